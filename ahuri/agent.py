@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from . import (
+    api,
+    config,
+    metrics,
+    timing
+)
+from .utils import *
+
+__all__ = [
+    "socket_path",
+    "supported",
+    "AgentClient",
+    "call",
+    "serve",
+    "start",
+    "stop"
+]
+
+socket_path = os.path.join(config.config_dir, "agent.sock")
+log_path = os.path.join(config.config_dir, "agent.log")
+supported = hasattr(socket, "AF_UNIX")
+
+def call(request: dict, timeout: float = None) -> dict:
+    """
+    Function to send a single request to the agent and return its reply.
+
+    Args:
+        request (dict): the request
+        timeout (float, optional): seconds to wait for the reply. Defaults to None.
+
+    Raises:
+        OSError: if the agent is not running
+
+    Returns:
+        dict: the reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        return json.loads(sock.makefile("rb").readline())
+
+class AgentClient:
+    """
+    API client that sends requests through the running agent, reusing its
+    connections. Falls back to sending them directly if the agent can't be reached.
+
+    Takes the same arguments as api.Client.
+    """
+    def __init__(
+        self,
+        api_url: str,
+        token: str = None,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30,
+        retries: int = 3,
+        verbose: bool = False
+    ):
+        self.api_url = api_url
+        self.token = token
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.verbose = verbose
+        self._local = threading.local()
+        self._direct = None
+
+    def _connection(self):
+        """
+        Function to get this thread's connection to the agent, opening it if needed.
+
+        Raises:
+            OSError: if the agent is not running
+
+        Returns:
+            tuple: (socket, file to read replies from)
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection == None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(socket_path)
+            except OSError:
+                sock.close()
+                raise
+            connection = self._local.connection = (sock, sock.makefile("rb"))
+        return connection
+
+    def direct(self) -> api.Client:
+        """
+        Function to get a client that sends requests without the agent.
+
+        Returns:
+            api.Client: the client
+        """
+        if self._direct == None:
+            self._direct = api.Client(
+                self.api_url,
+                self.token,
+                connect_timeout = self.timeout[0],
+                read_timeout = self.timeout[1],
+                retries = self.retries,
+                verbose = self.verbose
+            )
+        return self._direct
+
+    def request(
+        self,
+        method: str,
+        *path: str,
+        data=None,
+        params: dict = None,
+        headers: dict = None,
+        expected: int = 200,
+        auth: bool = True,
+        with_headers: bool = False
+    ):
+        """
+        Function to send a request to the API through the agent and return the payload of the response.
+        Takes the same arguments as api.Client.request.
+
+        Raises:
+            APIError: if the request failed or returned an unexpected response
+
+        Returns:
+            Any: payload of the response
+        """
+        try:
+            sock, replies = self._connection()
+        except OSError:
+            if self.verbose:
+                log("Agent not reachable, sending request directly")
+            return self.direct().request(
+                method,
+                *path,
+                data = data,
+                params = params,
+                headers = headers,
+                expected = expected,
+                auth = auth,
+                with_headers = with_headers
+            )
+
+        if self.verbose:
+            log(f"Sending {method.upper()} request to API through agent\nAPI URL: {self.api_url}")
+        request = {
+            "api_url": self.api_url,
+            "token": self.token if auth else None,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "method": method,
+            "path": path,
+            "data": data,
+            "params": params,
+            "headers": headers,
+            "expected": expected,
+            "auth": auth
+        }
+        sent_at = time.perf_counter()
+        try:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            reply = replies.readline()
+        except OSError as e:
+            self._local.connection = None
+            raise api.APIError(f"Lost connection to agent: {e}")
+        if not reply:
+            self._local.connection = None
+            raise api.APIError("Agent closed the connection.")
+
+        reply = json.loads(reply)
+        if timing.enabled:
+            timing.add(
+                metrics.endpoint(method, path) + " (agent)",
+                sent_at,
+                time.perf_counter(),
+                "http",
+                status = reply["error"]["status_code"] if "error" in reply else expected
+            )
+        if metrics.enabled:
+            # the agent sends the request, so only the whole round trip and the outcome are known here
+            label = metrics.endpoint(method, path)
+            status = reply["error"]["status_code"] if "error" in reply else expected
+            metrics.observe("ahuri_http_request_seconds", time.perf_counter() - sent_at, endpoint=label)
+            metrics.count("ahuri_http_responses_total", endpoint=label, code=str(status) if status != None else "error")
+        if "error" in reply:
+            raise api.APIError(**reply["error"])
+        if self.verbose:
+            log(f"JSON Response:\n{json.dumps(reply['payload'], indent=2)}")
+        if with_headers:
+            return reply["payload"], reply.get("headers", {})
+        return reply["payload"]
+
+def serve(verbose: bool = False) -> None:
+    """
+    Function to run the agent in this process until it is stopped.
+
+    Args:
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    import socketserver
+
+    clients = {}
+    clients_lock = threading.Lock()
+    stats = {
+        "pid": os.getpid(),
+        "started": time.time(),
+        "requests": 0
+    }
+    stats_lock = threading.Lock()
+
+    def get_client(request: dict) -> api.Client:
+        key = (request["api_url"], request["token"], tuple(request["timeout"]), request["retries"])
+        with clients_lock:
+            client = clients.get(key)
+            if client == None:
+                client = clients[key] = api.Client(
+                    request["api_url"],
+                    request["token"],
+                    connect_timeout = request["timeout"][0],
+                    read_timeout = request["timeout"][1],
+                    retries = request["retries"]
+                )
+        return client
+
+    def error(message: str) -> dict:
+        return {"error": {
+            "message": message,
+            "status_code": None,
+            "expected": None,
+            "url": None,
+            "text": None,
+            "has_message": False
+        }}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                self.wfile.write(json.dumps(self.reply(line)).encode() + b"\n")
+
+        def reply(self, line: bytes) -> dict:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                return error(f"Invalid request sent to agent: {e}")
+            if type(request) != dict:
+                return error("Invalid request sent to agent: expected a JSON object")
+
+            command = request.get("command")
+            if command == "status":
+                with stats_lock:
+                    return dict(stats, uptime=time.time() - stats["started"])
+            if command == "stop":
+                threading.Thread(target=self.server.shutdown).start()
+                return {"stopping": True}
+
+            with stats_lock:
+                stats["requests"] += 1
+            try:
+                payload, headers = get_client(request).request(
+                    request["method"],
+                    *request["path"],
+                    data = request["data"],
+                    params = request.get("params"),
+                    headers = request.get("headers"),
+                    expected = request["expected"],
+                    auth = request["auth"],
+                    with_headers = True
+                )
+                reply = {"payload": payload, "headers": headers}
+            except api.APIError as e:
+                reply = {"error": {
+                    "message": e.message,
+                    "status_code": e.status_code,
+                    "expected": e.expected,
+                    "url": e.url,
+                    "text": e.text,
+                    "has_message": e.has_message
+                }}
+            except (KeyError, TypeError, IndexError) as e:
+                return error(f"Invalid request sent to agent: {type(e).__name__}: {e}")
+            if verbose:
+                log(f"{request['method']} /{'/'.join(request['path'])}: {'error' if 'error' in reply else 'ok'}")
+            return reply
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # the socket is created with the permissions from the umask, so don't let anyone else in
+    # even for the moment before the chmod, they could send requests as this user
+    umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    with server:
+        os.chmod(socket_path, 0o600)
+        info(f"Agent listening on {socket_path} (pid {os.getpid()})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+    info("Agent stopped.")
+
+def start(timeout: float = 5) -> int:
+    """
+    Function to start the agent in the background.
+
+    Args:
+        timeout (float, optional): seconds to wait for the agent to start. Defaults to 5.
+
+    Raises:
+        TimeoutError: if the agent didn't start in time
+
+    Returns:
+        int: process id of the agent
+    """
+    import subprocess
+
+    with open(log_path, "a") as logfile:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "ahuri", "agent", "start", "--foreground"],
+            stdin = subprocess.DEVNULL,
+            stdout = logfile,
+            stderr = subprocess.STDOUT,
+            start_new_session = True
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() != None:
+            break
+        try:
+            return call({"command": "status"}, timeout=1)["pid"]
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Agent did not start, see {log_path}")
+
+def stop() -> None:
+    """
+    Function to stop the running agent.
+
+    Raises:
+        OSError: if the agent is not running
+    """
+    call({"command": "stop"}, timeout=5)
@@ -0,0 +1,273 @@
+import json
+import time
+import random
+from . import (
+    metrics,
+    timing
+)
+from .utils import *
+
+__all__ = [
+    "APIError",
+    "Client",
+    "session"
+]
+
+# Methods that are safe to send again after a failure
+idempotent_methods = ("GET", "HEAD", "OPTIONS")
+# Status codes worth retrying after a short wait
+retry_status_codes = (429, 502, 503, 504)
+
+# Connections kept open to the API, raise it before the first request to send more requests at the same time
+pool_maxsize = 16
+
+_session = None
+
+class APIError(Exception):
+    """
+    Exception raised when a request to the API fails.
+
+    Attributes:
+        message (str): error message
+        status_code (int): status code returned, None if no response was received
+        expected (int): status code that was expected
+        url (str): url of the request
+        text (str): response text
+        has_message (bool): whether the API returned a message with the error
+    """
+    def __init__(self, message: str, status_code=None, expected=None, url=None, text=None, has_message=False):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.expected = expected
+        self.url = url
+        self.text = text
+        self.has_message = has_message
+
+def session():
+    """
+    Function to get the HTTP session shared by every API client in this process.
+    Connections in its pool are kept alive and reused between requests.
+
+    Returns:
+        requests.Session: the session
+    """
+    global _session
+    if _session == None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+class Client:
+    """
+    Client for the Ahuri API.
+
+    Args:
+        api_url (str): api url
+        token (str, optional): token of the user. Defaults to None.
+        connect_timeout (float, optional): seconds to wait for a connection. Defaults to 3.05.
+        read_timeout (float, optional): seconds to wait for a response. Defaults to 30.
+        retries (int, optional): times to retry idempotent requests. Defaults to 3.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    def __init__(
+        self,
+        api_url: str,
+        token: str = None,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30,
+        retries: int = 3,
+        verbose: bool = False
+    ):
+        from yarl import URL
+
+        self.api_url = URL(api_url)
+        self.token = token
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.verbose = verbose
+
+    def _backoff(self, attempt: int, response=None) -> float:
+        """
+        Function to get the seconds to wait before retrying a request.
+        Uses the Retry-After header if the API sent one, otherwise
+        exponential backoff with full jitter.
+
+        Args:
+            attempt (int): number of the failed attempt, starting at 0
+            response (requests.Response, optional): failed response. Defaults to None.
+
+        Returns:
+            float: seconds to wait
+        """
+        if response != None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(int(retry_after), 30)
+        return random.uniform(0, min(10, 0.25 * 2 ** attempt))
+
+    def _trace(self, method: str, path: tuple, sent_at: float, response, attempt: int) -> None:
+        """
+        Function to record a request for --profile, split into connect, time to first byte and body.
+        requests measures `elapsed` until the headers are parsed, the body is read after that.
+
+        Args:
+            method (str): HTTP method
+            path (tuple): path segments after the api url
+            sent_at (float): time.perf_counter() when the request was sent
+            response (requests.Response): the response, None if none was received
+            attempt (int): number of retries before this request
+        """
+        finished = time.perf_counter()
+        connect = timing.connect_time(reset=True)
+        details = {"status": response.status_code if response != None else "error"}
+        if attempt:
+            details["retry"] = attempt
+        details["connect"] = f"{connect * 1000:.1f}ms"
+        if response != None:
+            headers_at = response.elapsed.total_seconds()
+            details["ttfb"] = f"{max(0, headers_at - connect) * 1000:.1f}ms"
+            details["body"] = f"{max(0, finished - sent_at - headers_at) * 1000:.1f}ms"
+            details["bytes"] = len(response.content)
+        timing.add(metrics.endpoint(method, path), sent_at, finished, "http", **details)
+
+    def request(
+        self,
+        method: str,
+        *path: str,
+        data=None,
+        params: dict = None,
+        headers: dict = None,
+        expected: int = 200,
+        auth: bool = True,
+        with_headers: bool = False
+    ):
+        """
+        Function to send a request to the API and return the payload of the response.
+
+        Args:
+            method (str): HTTP method
+            *path (str): path segments after the api url
+            data (Any, optional): JSON data to send. Defaults to None.
+            params (dict, optional): query string parameters. Defaults to None.
+            headers (dict, optional): extra headers to send, like If-None-Match. Defaults to None.
+            expected (int, optional): expected status code. Defaults to 200.
+            auth (bool, optional): whether to send the token or not. Defaults to True.
+            with_headers (bool, optional): whether to return the response headers too or not. Defaults to False.
+
+        Raises:
+            APIError: if the request failed or returned an unexpected response
+
+        Returns:
+            Any: payload of the response, or (payload, headers) if with_headers is True.
+                The payload is None if the API answered a conditional request with 304 Not Modified.
+        """
+        import requests
+
+        method = method.upper()
+        url = self.api_url
+        for segment in path:
+            url = url/segment
+        headers = dict(headers or {})
+        conditional = "If-None-Match" in headers or "If-Modified-Since" in headers
+        if auth:
+            headers["Authorization"] = self.token
+
+        if self.verbose:
+            if data == None:
+                log(f"Sending {method} request to API\nAPI URL: {self.api_url}")
+            else:
+                log(f"Sending {method} request to API\nAPI URL: {self.api_url}\nJSON Data: {json.dumps(data, indent=2)}")
+
+        label = metrics.endpoint(method, path) if metrics.enabled else None
+        attempt = 0
+        while True:
+            retry = False
+            response = None
+            sent_at = time.perf_counter()
+            if timing.enabled:
+                timing.connect_time(reset=True)
+            try:
+                response = session().request(
+                    method,
+                    str(url),
+                    json = data,
+                    params = params,
+                    headers = headers,
+                    timeout = self.timeout
+                )
+            except requests.exceptions.ConnectTimeout as e:
+                # the request never reached the API, so it is always safe to retry
+                error = e
+                retry = True
+            except requests.exceptions.RequestException as e:
+                error = e
+                retry = method in idempotent_methods
+            else:
+                retry = method in idempotent_methods and response.status_code in retry_status_codes
+            if timing.enabled:
+                self._trace(method, path, sent_at, response, attempt)
+            if label != None:
+                metrics.observe("ahuri_http_request_seconds", time.perf_counter() - sent_at, endpoint=label)
+                metrics.count("ahuri_http_responses_total", endpoint=label, code=str(response.status_code) if response != None else "error")
+
+            if not retry or attempt >= self.retries:
+                break
+            wait = self._backoff(attempt, response)
+            if self.verbose:
+                log(f"Request failed, retrying in {wait:.2f}s ({attempt + 1}/{self.retries})")
+            if label != None:
+                metrics.count("ahuri_http_retries_total", endpoint=label)
+            time.sleep(wait)
+            attempt += 1
+
+        if response == None:
+            raise APIError(f"Could not reach {url}: {error}", url=str(url))
+
+        if conditional and response.status_code == 304:
+            if self.verbose:
+                log("Response not modified")
+            return (None, dict(response.headers)) if with_headers else None
+
+        try:
+            if self.verbose:
+                log("Converting JSON response to python dictionary")
+            rjson = response.json()
+        except ValueError:
+            if self.verbose:
+                log("err: No JSON in response")
+            is_json = False
+            has_message = False
+        else:
+            is_json = True
+            has_message = type(rjson) == dict and "message" in rjson
+
+        if self.verbose:
+            if is_json:
+                log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
+            else:
+                log(f"Response Text:\n{response.text}")
+
+        if response.status_code != expected:
+            raise APIError(
+                f"{response.status_code}: {rjson['message']}" if has_message else f"Status code {response.status_code} returned.",
+                status_code = response.status_code,
+                expected = expected,
+                url = response.url,
+                text = response.text,
+                has_message = has_message
+            )
+        if not is_json or type(rjson) != dict or "payload" not in rjson:
+            raise APIError(
+                f"Invalid response text received from {response.url}.",
+                url = response.url,
+                text = response.text
+            )
+        if with_headers:
+            return rjson["payload"], dict(response.headers)
+        return rjson["payload"]
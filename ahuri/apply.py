@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import random
+import tempfile
+from . import api
+from .bulk import imap
+
+__all__ = [
+    "load_manifest",
+    "load_state",
+    "save_state",
+    "plan",
+    "apply"
+]
+
+# Status codes that mean the API didn't act on the request, so it is safe to send again
+retry_status_codes = (429, 503)
+
+def load_manifest(path: str) -> list:
+    """
+    Function to read the channels a manifest asks for.
+
+    A manifest is a JSON file like {"channels": ["general", {"name": "random"}]},
+    a plain list of channels is accepted too.
+
+    Args:
+        path (str): path of the manifest
+
+    Raises:
+        OSError: if the file can't be read
+        ValueError: if the manifest is invalid
+
+    Returns:
+        list: channel names, without duplicates
+    """
+    with open(path, "r") as manifestfile:
+        manifest = json.load(manifestfile)
+    channels = manifest.get("channels") if type(manifest) == dict else manifest
+    if type(channels) != list:
+        raise ValueError("expected a list of channels or an object with a 'channels' list")
+
+    names = []
+    for channel in channels:
+        name = channel.get("name") if type(channel) == dict else channel
+        if type(name) != str or not name.strip():
+            raise ValueError(f"invalid channel: {json.dumps(channel)}")
+        names.append(name.strip())
+    return list(dict.fromkeys(names))
+
+def load_state(path: str) -> dict:
+    """
+    Function to read the channels created by earlier runs.
+
+    Args:
+        path (str): path of the state file
+
+    Raises:
+        ValueError: if the state file is invalid
+
+    Returns:
+        dict: channel names mapped to their ids, empty if the file doesn't exist
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as statefile:
+        state = json.load(statefile)
+    if type(state) != dict or type(state.get("channels")) != dict:
+        raise ValueError(f"invalid state file: {path}")
+    return state["channels"]
+
+def save_state(path: str, channels: dict) -> None:
+    """
+    Function to replace the state file atomically.
+
+    Args:
+        path (str): path of the state file
+        channels (dict): channel names mapped to their ids
+    """
+    fd, tmp = tempfile.mkstemp(prefix=".state-", suffix=".json", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as statefile:
+            json.dump({"channels": channels}, statefile, sort_keys=True, indent=4)
+        os.replace(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+def _retry(func, retries: int, retry_errors, *args):
+    """
+    Function to call func again while it fails with an error worth retrying,
+    waiting longer after every attempt.
+
+    Args:
+        func (Callable): function to call
+        retries (int): times to retry at most
+        retry_errors (Callable): called with the api.APIError, returns whether to retry or not
+        *args (Any): arguments for func
+
+    Returns:
+        Any: what func returned
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except api.APIError as e:
+            if attempt >= retries or not retry_errors(e):
+                raise
+        time.sleep(random.uniform(0, min(10, 0.25 * 2 ** attempt)))
+        attempt += 1
+
+def plan(client: api.Client, cache, names: list, state: dict, concurrency: int = 8) -> dict:
+    """
+    Function to work out what has to change to match a manifest.
+
+    Channels in the state file are looked up (through the cache) to check
+    they still exist, the lookups run at the same time.
+
+    Args:
+        client (api.Client): API client of the user
+        cache (cache.ChannelCache): cache to look channels up in
+        names (list): channel names in the manifest
+        state (dict): channel names mapped to the ids of channels created by earlier runs
+        concurrency (int, optional): lookups to run at the same time. Defaults to 8.
+
+    Raises:
+        api.APIError: if looking a channel up failed for another reason than it not existing
+
+    Returns:
+        dict: {"create": [names], "delete": {name: id}, "keep": {name: id}}
+    """
+    create = [name for name in names if name not in state]
+    delete = {name: id for name, id in state.items() if name not in names}
+    keep = {}
+
+    wanted = [(name, state[name]) for name in names if name in state]
+    for (name, id), channel, error in imap(lambda item: cache.channel(client, item[1]), wanted, concurrency):
+        if error == None:
+            keep[name] = id
+        elif isinstance(error, api.APIError) and error.status_code == 404:
+            # deleted outside of apply, create it again
+            cache.forget(id)
+            create.append(name)
+        else:
+            raise error
+    return {"create": create, "delete": delete, "keep": keep}
+
+def apply(
+    client: api.Client,
+    cache,
+    changes: dict,
+    state: dict,
+    concurrency: int = 8,
+    retries: int = 3,
+    progress = None
+) -> dict:
+    """
+    Function to create and delete channels as planned, at the same time.
+    The state is updated after every change that succeeded.
+
+    Creating a channel is only retried when the API turned the request away
+    (429 or 503), so a channel is never created twice. Deleting is retried
+    on any failure and a channel that is already gone counts as deleted.
+
+    Args:
+        client (api.Client): API client of the user
+        cache (cache.ChannelCache): cache to store created channels in
+        changes (dict): plan returned by plan()
+        state (dict): channel names mapped to their ids, updated in place
+        concurrency (int, optional): requests to send at the same time. Defaults to 8.
+        retries (int, optional): times to retry a failed request. Defaults to 3.
+        progress (Callable, optional): called with (action, name, result, error) after every change. Defaults to None.
+
+    Returns:
+        dict: names of failed changes mapped to their api.APIError
+    """
+    def create(name: str) -> dict:
+        return client.request("POST", "channel", data={"channelName": name}, expected=201)
+
+    def delete(id: str) -> dict:
+        try:
+            return client.request("DELETE", "channel", id)
+        except api.APIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def change(item: tuple):
+        action, name = item
+        if action == "create":
+            return _retry(create, retries, lambda e: e.status_code in retry_status_codes, name)
+        return _retry(delete, retries, lambda e: e.status_code == None or e.status_code >= 500 or e.status_code == 429, changes["delete"][name])
+
+    items = [("create", name) for name in changes["create"]] + [("delete", name) for name in changes["delete"]]
+    failed = {}
+    for (action, name), result, error in imap(change, items, concurrency, ordered=False):
+        if error != None and not isinstance(error, api.APIError):
+            raise error
+        if error != None:
+            failed[name] = error
+        elif action == "create":
+            state[name] = result["id"]
+            cache.store(result)
+        else:
+            cache.forget(state.pop(name))
+        if progress != None:
+            progress(action, name, result, error)
+    return failed
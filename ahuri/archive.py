@@ -0,0 +1,358 @@
+import os
+import re
+import time
+import sqlite3
+from . import config
+from datetime import datetime, timezone
+
+__all__ = [
+    "archive_path",
+    "parse_time",
+    "Archive"
+]
+
+archive_path = os.path.join(config.config_dir, "archive.db")
+
+schema = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT NOT NULL PRIMARY KEY,
+    channel TEXT NOT NULL,
+    sender_id TEXT,
+    sender TEXT,
+    content TEXT,
+    created_at TEXT,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_time ON messages (channel, time);
+CREATE INDEX IF NOT EXISTS messages_sender_id_time ON messages (sender_id, time);
+CREATE INDEX IF NOT EXISTS messages_sender_time ON messages (sender, time);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (time);
+CREATE TABLE IF NOT EXISTS cursors (
+    channel TEXT PRIMARY KEY,
+    after TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Full-text index over message content and sender, kept up to date by triggers.
+# It refers to messages by rowid, so the archive must never be VACUUMed.
+search_schema = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    sender,
+    content = 'messages',
+    content_rowid = 'rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, sender) VALUES (new.rowid, new.content, new.sender);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, sender) VALUES ('delete', old.rowid, old.content, old.sender);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, sender) VALUES ('delete', old.rowid, old.content, old.sender);
+    INSERT INTO messages_fts (rowid, content, sender) VALUES (new.rowid, new.content, new.sender);
+END;
+"""
+
+_relative_time = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_units = {
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 604800
+}
+
+def parse_time(value: str) -> float:
+    """
+    Function to parse a time given on the command line.
+    Accepts ISO 8601 dates and times (local time unless a timezone is given)
+    and durations before now like 30m, 2h or 7d.
+
+    Args:
+        value (str): the time
+
+    Raises:
+        ValueError: if the time is invalid
+
+    Returns:
+        float: unix time
+    """
+    value = value.strip()
+    match = _relative_time.match(value)
+    if match:
+        return time.time() - float(match.group(1)) * _units[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+def message_time(created_at) -> float:
+    """
+    Function to get the unix time of a message from its createdAt value.
+
+    Args:
+        created_at (Any): createdAt value sent by the API, UTC if it has no timezone
+
+    Returns:
+        float: unix time, the current time if created_at is missing or invalid
+    """
+    if type(created_at) == str:
+        try:
+            created = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+        else:
+            if created.tzinfo == None:
+                created = created.replace(tzinfo=timezone.utc)
+            return created.timestamp()
+    return time.time()
+
+def _row(message: dict, channel_id: str) -> tuple:
+    """
+    Function to get the row of the messages table for a message.
+
+    Args:
+        message (dict): message payload
+        channel_id (str): id of the channel the message was sent in
+
+    Returns:
+        tuple: values of the row, None if the message has no id
+    """
+    if message.get("id") == None or message.get("id") == "":
+        return None
+    sender = message.get("sender") or {}
+    return (
+        message.get("id"),
+        channel_id,
+        sender.get("id"),
+        f"{sender.get('username')}.{sender.get('tag')}",
+        message.get("content"),
+        message.get("createdAt"),
+        message_time(message.get("createdAt"))
+    )
+
+class Archive:
+    """
+    Local SQLite archive of received messages.
+
+    Messages are collected with add() and written in one transaction once
+    `batch_size` are waiting or `flush_interval` seconds after the first one
+    was added, so archiving doesn't slow the receive loop down.
+
+    Args:
+        path (str, optional): path of the database. Defaults to archive_path.
+        batch_size (int, optional): messages to collect before writing. Defaults to 200.
+        flush_interval (float, optional): seconds to wait for more messages before writing. Defaults to 1.
+    """
+    def __init__(self, path: str = archive_path, batch_size: int = 200, flush_interval: float = 1):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(schema)
+        self.searchable = self._create_search_index()
+        self._pending = []
+        self._timer = None
+
+    def _create_search_index(self) -> bool:
+        """
+        Function to create the full-text index, indexing messages archived before it existed.
+
+        Returns:
+            bool: False if this SQLite build has no FTS5 support
+        """
+        exists = self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        try:
+            self.connection.executescript(search_schema)
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            with self.connection:
+                self.connection.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        return True
+
+    def add(self, message: dict, channel_id: str) -> None:
+        """
+        Function to add a received message to the archive.
+        Messages without an id are skipped, since they couldn't be deduplicated.
+
+        Args:
+            message (dict): message payload received from the websocket
+            channel_id (str): id of the channel the message was sent in
+        """
+        row = _row(message, channel_id)
+        if row == None:
+            return
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer == None:
+            import asyncio
+
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+            else:
+                self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def cursor(self, channel: str):
+        """
+        Function to get the id of the last message synced from a channel.
+
+        Args:
+            channel (str): id of the channel
+
+        Returns:
+            str: message id, None if the channel was never synced
+        """
+        row = self.connection.execute("SELECT after FROM cursors WHERE channel = ?", (channel,)).fetchone()
+        return None if row == None else row["after"]
+
+    def store_page(self, channel: str, messages: list, after: str) -> int:
+        """
+        Function to write a page of synced messages and then move the channel's cursor
+        past them. Messages are never archived twice, so a page written again after
+        a crash is harmless. Messages without an id are skipped.
+
+        Args:
+            channel (str): id of the channel
+            messages (list): message payloads
+            after (str): id of the last message in the page
+
+        Returns:
+            int: number of messages that weren't in the archive yet
+        """
+        self._pending += [row for row in (_row(message, channel) for message in messages) if row != None]
+        added = self.flush()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cursors (channel, after, synced_at) VALUES (?, ?, ?)",
+                (channel, after, time.time())
+            )
+        return added
+
+    def flush(self) -> int:
+        """
+        Function to write the messages collected so far.
+
+        Returns:
+            int: number of messages that weren't in the archive yet
+        """
+        if self._timer != None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return 0
+        with self.connection:
+            # rowcount leaves out the rows the search index triggers write
+            added = self.connection.executemany(
+                "INSERT OR IGNORE INTO messages (id, channel, sender_id, sender, content, created_at, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending
+            ).rowcount
+        self._pending = []
+        return added
+
+    def history(
+        self,
+        channel: str = None,
+        sender: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 50
+    ) -> list:
+        """
+        Function to get the latest archived messages matching the filters.
+
+        Args:
+            channel (str, optional): only messages in this channel. Defaults to None.
+            sender (str, optional): only messages from this sender, as username.tag or id. Defaults to None.
+            since (float, optional): only messages sent at or after this unix time. Defaults to None.
+            until (float, optional): only messages sent before this unix time. Defaults to None.
+            limit (int, optional): number of messages to return at most. Defaults to 50.
+
+        Returns:
+            list: sqlite3.Row objects, oldest first
+        """
+        where = []
+        params = []
+        if channel != None:
+            where.append("channel = ?")
+            params.append(channel)
+        if sender != None:
+            where.append("(sender = ? OR sender_id = ?)")
+            params += [sender, sender]
+        if since != None:
+            where.append("time >= ?")
+            params.append(since)
+        if until != None:
+            where.append("time < ?")
+            params.append(until)
+        query = "SELECT * FROM messages"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY time DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+
+        return self.connection.execute(query, params).fetchall()[::-1]
+
+    def search(
+        self,
+        query: str,
+        channel: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 20,
+        order: str = "rank"
+    ) -> list:
+        """
+        Function to search archived messages by content and sender.
+
+        Args:
+            query (str): FTS5 query, for example: deploy failed, "exact phrase", sender:bob, error NOT timeout
+            channel (str, optional): only messages in this channel. Defaults to None.
+            since (float, optional): only messages sent at or after this unix time. Defaults to None.
+            until (float, optional): only messages sent before this unix time. Defaults to None.
+            limit (int, optional): number of messages to return at most. Defaults to 20.
+            order (str, optional): "rank" for the best matches first, "time" for the newest first. Defaults to "rank".
+
+        Raises:
+            sqlite3.OperationalError: if the query is invalid or SQLite has no FTS5 support
+
+        Returns:
+            list: sqlite3.Row objects
+        """
+        if not self.searchable:
+            raise sqlite3.OperationalError("this SQLite build does not support full-text search (FTS5)")
+        where = ["messages_fts MATCH ?"]
+        params = [query]
+        if channel != None:
+            where.append("messages.channel = ?")
+            params.append(channel)
+        if since != None:
+            where.append("messages.time >= ?")
+            params.append(since)
+        if until != None:
+            where.append("messages.time < ?")
+            params.append(until)
+        # matches in content count twice as much as matches in the sender
+        query = (
+            "SELECT messages.*, bm25(messages_fts, 1.0, 0.5) AS rank FROM messages_fts"
+            " JOIN messages ON messages.rowid = messages_fts.rowid"
+            " WHERE " + " AND ".join(where)
+            + (" ORDER BY rank" if order == "rank" else " ORDER BY messages.time DESC")
+            + " LIMIT ?"
+        )
+        params.append(limit)
+
+        self.flush()
+        return self.connection.execute(query, params).fetchall()
+
+    def close(self) -> None:
+        """
+        Function to write pending messages and close the archive.
+        """
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import asyncio
+from itertools import count
+from . import api
+from .utils import *
+from .listener import open_channels
+
+__all__ = [
+    "percentile",
+    "distribution",
+    "run",
+    "report"
+]
+
+# Start of the content of messages sent by bench, followed by the run id, sequence number and send time
+prefix = "ahuri-bench"
+# Seconds to wait between opening the channel on every listener and sending the first message,
+# the server doesn't acknowledge open channel so this gives it time to subscribe them
+settle = 1.0
+
+def percentile(values: list, q: float) -> float:
+    """
+    Function to get a percentile of sorted values with the nearest-rank method.
+
+    Args:
+        values (list): the values, sorted
+        q (float): the percentile, between 0 and 100
+
+    Returns:
+        float: the percentile, None if there are no values
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(len(values) * q / 100 + 0.5) - 1))
+    return values[index]
+
+def distribution(values: list) -> dict:
+    """
+    Function to summarize latencies.
+
+    Args:
+        values (list): latencies in seconds
+
+    Returns:
+        dict: count, mean, p50, p90, p99, p99.9 and max in milliseconds, only count if there are no values
+    """
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    summary = {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * 1000, 3)
+    }
+    for q in (50, 90, 99, 99.9):
+        summary[f"p{q:g}"] = round(percentile(values, q) * 1000, 3)
+    summary["max"] = round(values[-1] * 1000, 3)
+    return summary
+
+async def run(
+    client: api.Client,
+    channel_id: str,
+    ws_url: str,
+    listeners: int = 10,
+    senders: int = 1,
+    rate: float = 10,
+    duration: float = 10,
+    drain: float = 5,
+    connect_concurrency: int = 50,
+    progress = None,
+    verbose: bool = False
+) -> dict:
+    """
+    Function to simulate many clients on one channel: `listeners` websocket connections
+    that open the channel and `senders` that send messages to it at `rate` messages per
+    second in total for `duration` seconds. Every message carries the time it was sent,
+    so the delay until each listener receives it can be measured.
+
+    Senders wait for their previous request before sending the next one,
+    so a server slower than `rate` shows up as a lower send rate.
+
+    Args:
+        client (api.Client): API client of the user, its token is used for the listeners too
+        channel_id (str): id of the channel to use
+        ws_url (str): websocket url
+        listeners (int, optional): websocket connections to receive the messages on. Defaults to 10.
+        senders (int, optional): messages to send at the same time. Defaults to 1.
+        rate (float, optional): messages to send per second, in total. Defaults to 10.
+        duration (float, optional): seconds to send messages for. Defaults to 10.
+        drain (float, optional): seconds to wait for messages still on their way after the last one is sent. Defaults to 5.
+        connect_concurrency (int, optional): listeners connecting at the same time. Defaults to 50.
+        progress (Callable, optional): called with (seconds since sending started, sent, received) every second. Defaults to None.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+
+    Returns:
+        dict: the results, see report()
+    """
+    import websockets
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    # one thread per sender, each keeps its own connection to the API open
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(1, senders)))
+
+    run_id = os.urandom(4).hex()
+    tag = f"{prefix} {run_id} "
+    sequence = count()
+    state = {
+        "sent": 0,
+        "send_errors": 0,
+        "last_send_error": None,
+        "received": 0,
+        "duplicates": 0,
+        "connect_errors": 0,
+        "last_connect_error": None,
+        "disconnected": 0,
+        "max_loop_lag": 0.0
+    }
+    connect_times = []
+    send_times = []
+    latencies = []
+    semaphore = asyncio.Semaphore(max(1, connect_concurrency))
+    stopping = False
+
+    async def connect(index: int):
+        started = time.perf_counter()
+        async with semaphore:
+            try:
+                ws = await websockets.connect(ws_url, max_size=None)
+                await open_channels(ws, client.token, [channel_id])
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                state["connect_errors"] += 1
+                state["last_connect_error"] = str(e) or type(e).__name__
+                if verbose:
+                    log(f"Listener {index} could not connect: {state['last_connect_error']}")
+                return None
+        connect_times.append(time.perf_counter() - started)
+        return ws
+
+    async def receive(ws) -> None:
+        seen = set()
+        try:
+            async for text in ws:
+                received_at = time.time()
+                try:
+                    content = json.loads(text)["payload"]["content"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if type(content) != str or not content.startswith(tag):
+                    continue
+                number, sent_at = content[len(tag):].split(" ", 1)
+                if number in seen:
+                    state["duplicates"] += 1
+                    continue
+                seen.add(number)
+                state["received"] += 1
+                latencies.append(received_at - float(sent_at))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        if not stopping:
+            state["disconnected"] += 1
+
+    async def send(index: int, start: float, end: float) -> None:
+        interval = senders / rate
+        # spread the senders out so they don't all send at once
+        next_at = start + index / rate
+        while next_at < end:
+            wait = next_at - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            number = next(sequence)
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(
+                    client.request,
+                    "POST",
+                    "channel",
+                    channel_id,
+                    "send-message",
+                    data = {"content": f"{tag}{number} {time.time():.6f}"}
+                )
+            except api.APIError as e:
+                state["send_errors"] += 1
+                state["last_send_error"] = e.message
+            else:
+                state["sent"] += 1
+                send_times.append(time.perf_counter() - started)
+            next_at += interval
+
+    async def watch_loop() -> None:
+        # a busy event loop delays receiving, so report how late it woke up
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.1)
+            state["max_loop_lag"] = max(state["max_loop_lag"], time.perf_counter() - started - 0.1)
+
+    if verbose:
+        log(f"Connecting {listeners} {'listener' if listeners == 1 else 'listeners'} to {ws_url}")
+    connect_started = time.perf_counter()
+    connections = [ws for ws in await asyncio.gather(*[connect(index) for index in range(listeners)]) if ws != None]
+    connect_seconds = time.perf_counter() - connect_started
+    receivers = [asyncio.create_task(receive(ws)) for ws in connections]
+    watcher = asyncio.create_task(watch_loop())
+    await asyncio.sleep(settle)
+
+    if verbose:
+        log(f"Sending {rate:g} messages per second from {senders} {'sender' if senders == 1 else 'senders'} for {duration:g}s")
+    start = time.perf_counter()
+    end = start + duration
+    sending = asyncio.gather(*[send(index, start, end) for index in range(senders)])
+    try:
+        while not sending.done():
+            await asyncio.wait([sending], timeout=1)
+            if progress != None:
+                progress(time.perf_counter() - start, state["sent"], state["received"])
+        await sending
+        send_seconds = time.perf_counter() - start
+
+        # wait for messages still on their way
+        expected = state["sent"] * len(connections)
+        deadline = time.perf_counter() + drain
+        while state["received"] < expected and time.perf_counter() < deadline and any(not task.done() for task in receivers):
+            await asyncio.sleep(0.05)
+    finally:
+        stopping = True
+        sending.cancel()
+        watcher.cancel()
+        await asyncio.gather(*[ws.close() for ws in connections], return_exceptions=True)
+        await asyncio.gather(*receivers, watcher, return_exceptions=True)
+    receive_seconds = time.perf_counter() - start
+
+    expected = state["sent"] * len(connections)
+    return {
+        "run_id": run_id,
+        "channel": channel_id,
+        "target_rate": rate,
+        "duration": duration,
+        "listeners": {
+            "requested": listeners,
+            "connected": len(connections),
+            "connect_errors": state["connect_errors"],
+            "last_connect_error": state["last_connect_error"],
+            "disconnected": state["disconnected"],
+            "connect_seconds": round(connect_seconds, 3),
+            "connect_ms": distribution(connect_times)
+        },
+        "senders": {
+            "count": senders,
+            "sent": state["sent"],
+            "errors": state["send_errors"],
+            "last_error": state["last_send_error"],
+            "rate": round(state["sent"] / send_seconds, 2) if send_seconds else 0,
+            "request_ms": distribution(send_times)
+        },
+        "delivery": {
+            "expected": expected,
+            "received": state["received"],
+            "lost": max(0, expected - state["received"]),
+            "loss": round(1 - state["received"] / expected, 6) if expected else 0,
+            "duplicates": state["duplicates"],
+            "rate": round(state["received"] / receive_seconds, 2) if receive_seconds else 0,
+            "latency_ms": distribution(latencies)
+        },
+        "max_loop_lag_ms": round(state["max_loop_lag"] * 1000, 3)
+    }
+
+def report(results: dict) -> str:
+    """
+    Function to describe the results of run() for people.
+
+    Args:
+        results (dict): the results
+
+    Returns:
+        str: the description
+    """
+    def latency(summary: dict) -> str:
+        if not summary.get("count"):
+            return "none"
+        return f"p50 {summary['p50']:.2f}ms, p90 {summary['p90']:.2f}ms, p99 {summary['p99']:.2f}ms, p99.9 {summary['p99.9']:.2f}ms, max {summary['max']:.2f}ms"
+
+    listeners = results["listeners"]
+    senders = results["senders"]
+    delivery = results["delivery"]
+    lines = [
+        f"Listeners: {listeners['connected']} of {listeners['requested']} connected in {listeners['connect_seconds']:.2f}s, {listeners['connect_errors']} failed, {listeners['disconnected']} dropped",
+        f"Connect latency: {latency(listeners['connect_ms'])}",
+        f"Sent: {senders['sent']} messages from {senders['count']} {'sender' if senders['count'] == 1 else 'senders'} at {senders['rate']:g}/s (target {results['target_rate']:g}/s), {senders['errors']} failed",
+        f"Send request latency: {latency(senders['request_ms'])}",
+        f"Delivered: {delivery['received']} of {delivery['expected']} ({delivery['loss'] * 100:.2f}% lost, {delivery['duplicates']} duplicates) at {delivery['rate']:g}/s",
+        f"Delivery latency: {latency(delivery['latency_ms'])}"
+    ]
+    if listeners["last_connect_error"] != None:
+        lines.append(f"Last connect error: {listeners['last_connect_error']}")
+    if senders["last_error"] != None:
+        lines.append(f"Last send error: {senders['last_error']}")
+    if results["max_loop_lag_ms"] > 100:
+        lines.append(f"Warning: this process fell behind by up to {results['max_loop_lag_ms']:.0f}ms, latencies include that. Use fewer listeners per process.")
+    return "\n".join(lines)
@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+__all__ = [
+    "RateLimiter",
+    "imap"
+]
+
+class RateLimiter:
+    """
+    Spaces calls out so no more than `rate` happen per second.
+
+    Args:
+        rate (float): calls allowed per second, 0 for no limit
+    """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        """
+        Function to block until the next call is allowed.
+        """
+        if self.interval == 0:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = max(self._next, now - self.interval) + self.interval
+
+def imap(func, items, concurrency: int = 4, rate: float = 0, ordered: bool = True):
+    """
+    Function to call func on every item using a pool of threads.
+    Items are read lazily and at most `concurrency` calls run at the same time,
+    so items can come from an endless stream.
+
+    Args:
+        func (Callable): function called with every item
+        items (Iterable): the items
+        concurrency (int, optional): calls to run at the same time. Defaults to 4.
+        rate (float, optional): calls to start per second at most, 0 for no limit. Defaults to 0.
+        ordered (bool, optional): whether to yield results in the order of the items or as they finish. Defaults to True.
+
+    Yields:
+        tuple: (item, result, error) for every item, error is the exception raised by func or None
+    """
+    concurrency = max(1, concurrency)
+    limiter = RateLimiter(rate)
+    items = iter(items)
+    pending = []
+
+    def result(entry: tuple) -> tuple:
+        item, future = entry
+        error = future.exception()
+        return (item, None if error else future.result(), error)
+
+    # when ordered, queue a few extra calls so a slow one doesn't leave workers idle
+    window = concurrency * 2 if ordered else concurrency
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                limiter.wait()
+                pending.append((item, executor.submit(func, item)))
+
+            if not pending:
+                break
+
+            if ordered:
+                yield result(pending.pop(0))
+            else:
+                done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                for entry in [entry for entry in pending if entry[1] in done]:
+                    pending.remove(entry)
+                    yield result(entry)
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from . import (
+    api,
+    config
+)
+from .utils import *
+
+__all__ = [
+    "cache_path",
+    "ChannelCache"
+]
+
+cache_path = os.path.join(config.config_dir, "channels.json")
+
+class ChannelCache:
+    """
+    Local cache of channel details, kept in a JSON file next to the config file.
+
+    Details fetched less than `ttl` seconds ago are used without asking the API.
+    Older details are revalidated with If-None-Match / If-Modified-Since when
+    the API sent an ETag or Last-Modified header for them, so an unchanged
+    channel costs an empty 304 response instead of a full one.
+
+    Lookups are safe to run from several threads at once. Changes are only
+    written to the file by save().
+
+    The file belongs to one API url and user, it is started over when either changes
+    so details from another server or account are never used.
+
+    Args:
+        api_url (str): api url the details are fetched from
+        user (str): id of the logged in user
+        path (str, optional): path of the cache file. Defaults to cache_path.
+        ttl (float, optional): seconds to use cached details for without revalidating them. Defaults to 300.
+        enabled (bool, optional): whether to use cached details or not, fresh details are still saved if False. Defaults to True.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    def __init__(
+        self,
+        api_url: str,
+        user: str,
+        path: str = cache_path,
+        ttl: float = 300,
+        enabled: bool = True,
+        verbose: bool = False
+    ):
+        self.api_url = api_url
+        self.user = user
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        self.verbose = verbose
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._changed = False
+        try:
+            with open(path, "r") as cachefile:
+                cached = json.load(cachefile)
+            if type(cached) != dict or type(cached.get("channels")) != dict:
+                raise ValueError
+        except (OSError, ValueError):
+            cached = {"channels": {}}
+        if cached.get("api_url") == api_url and cached.get("user") == user:
+            self._entries = cached["channels"]
+        else:
+            if self.verbose and cached["channels"]:
+                log("Channel cache is for another API url or user, starting it over")
+            self._entries = {}
+            self._changed = bool(cached["channels"])
+
+    def channel(self, client: api.Client, id: str) -> dict:
+        """
+        Function to get the details of a channel, from the cache if possible.
+
+        Args:
+            client (api.Client): API client of the user
+            id (str): id of the channel
+
+        Raises:
+            api.APIError: if getting the channel failed
+
+        Returns:
+            dict: channel details
+        """
+        with self._lock:
+            entry = self._entries.get(id)
+        if type(entry) != dict or "channel" not in entry:
+            entry = None
+
+        headers = {}
+        if self.enabled and entry != None:
+            age = time.time() - entry.get("fetched_at", 0)
+            if 0 <= age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                if self.verbose:
+                    log(f"Using cached details of channel '{id}' ({int(age)}s old)")
+                return entry["channel"]
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        channel, response_headers = client.request(
+            "GET",
+            "channel",
+            id,
+            headers = headers or None,
+            with_headers = True
+        )
+        # header names are case-insensitive, the agent sends them back in a plain dict
+        response_headers = {name.lower(): value for name, value in response_headers.items()}
+
+        with self._lock:
+            if channel == None:
+                # not modified, keep the cached details and validators
+                self.revalidated += 1
+                channel = entry["channel"]
+                etag = response_headers.get("etag", entry.get("etag"))
+                last_modified = response_headers.get("last-modified", entry.get("last_modified"))
+            else:
+                self.misses += 1
+                etag = response_headers.get("etag")
+                last_modified = response_headers.get("last-modified")
+            self._entries[id] = {
+                "channel": channel,
+                "fetched_at": time.time(),
+                "etag": etag,
+                "last_modified": last_modified
+            }
+            self._changed = True
+        return channel
+
+    def store(self, channel: dict) -> None:
+        """
+        Function to add channel details received from another request, like creating the channel.
+
+        Args:
+            channel (dict): the channel
+        """
+        with self._lock:
+            self._entries[channel["id"]] = {
+                "channel": channel,
+                "fetched_at": time.time(),
+                "etag": None,
+                "last_modified": None
+            }
+            self._changed = True
+
+    def forget(self, id: str) -> None:
+        """
+        Function to remove a channel from the cache.
+
+        Args:
+            id (str): id of the channel
+        """
+        with self._lock:
+            if self._entries.pop(id, None) != None:
+                self._changed = True
+
+    def stats(self) -> str:
+        """
+        Function to describe how many lookups were answered from the cache.
+
+        Returns:
+            str: the description
+        """
+        return f"Channel cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses"
+
+    def save(self) -> None:
+        """
+        Function to write the cache file atomically if anything changed.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            cached = {
+                "api_url": self.api_url,
+                "user": self.user,
+                "channels": dict(self._entries)
+            }
+            self._changed = False
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".channels-", suffix=".json", dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(fd, "w") as cachefile:
+                    json.dump(cached, cachefile)
+                os.replace(tmp, self.path)
+            except:
+                os.remove(tmp)
+                raise
+        except OSError as e:
+            # the cache only saves time, a command shouldn't fail because of it
+            if self.verbose:
+                log(f"Could not save channel cache: {e}")
@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 from .utils import *
 
 __all__ = [
@@ -10,6 +11,7 @@ __all__ = [
     "reset",
     "check",
     "get",
+    "update",
     "set"
 ]
 
@@ -23,13 +25,69 @@ config_dir = os.path.join(_config, "ahuri-cli")
 config = os.path.join(config_dir, "config.json")
 reset_str = """{
     "api_url": "http://18.169.99.65:81",
+    "archive": false,
+    "channel_ttl": 300,
+    "connect_timeout": 3.05,
+    "read_timeout": 30,
+    "retries": 3,
     "time_format": "%H:%M",
     "user": {
         "token": null
     },
+    "user_ttl": 3600,
     "ws_url": "ws://18.169.99.65:81/ws"
 }"""
 
+# In-process copy of the config file and the (mtime, size) it was read at
+_cache = None
+_stamp = None
+
+def _load(verbose=False) -> dict:
+    """
+    Function to get the config, reading the config file only if it
+    changed since it was last read.
+
+    Args:
+        verbose (bool, optional): whether show more output or not. Defaults to False.
+
+    Returns:
+        dict: config in dictionary
+    """
+    global _cache, _stamp
+    stat = os.stat(config)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _cache == None or stamp != _stamp:
+        if verbose:
+            log("Reading config file")
+        with open(config, "r") as configfile:
+            _cache = json.load(configfile)
+        _stamp = stamp
+    return _cache
+
+def _write(configjson: dict, verbose=False) -> None:
+    """
+    Function to replace the config file atomically, so other processes
+    never see a half-written file.
+
+    Args:
+        configjson (dict): new config
+        verbose (bool, optional): whether show more output or not. Defaults to False.
+    """
+    global _cache, _stamp
+    if verbose:
+        log("Writing config file")
+    fd, tmp = tempfile.mkstemp(prefix=".config-", suffix=".json", dir=config_dir)
+    try:
+        with os.fdopen(fd, "w") as configfile:
+            json.dump(configjson, configfile, sort_keys=True, indent=4)
+        os.replace(tmp, config)
+    except:
+        os.remove(tmp)
+        raise
+    stat = os.stat(config)
+    _cache = configjson
+    _stamp = (stat.st_mtime_ns, stat.st_size)
+
 def reset(p=True, verbose=False) -> None:
     """
     Function to reset config.
@@ -38,10 +96,7 @@ def reset(p=True, verbose=False) -> None:
         p (bool, optional): whether to print main output or not. Defaults to True.
         verbose (bool, optional): whether show more output or not. Defaults to False.
     """
-    if verbose:
-        log("Writing config file")
-    with open(config, "w") as configfile:
-        configfile.write(reset_str)
+    _write(json.loads(reset_str), verbose=verbose)
     
     if p:
         info("Reset config file!")
@@ -51,51 +106,19 @@ def reset(p=True, verbose=False) -> None:
 def check() -> None:
     """
     Function to check the config directories and config file when the program starts.
+    The config file is read once here and kept in memory for get().
     """
     try:
-        if os.name == "nt":
-            if os.path.exists(config_dir):
-                if os.path.exists(config):
-                    with open(config, "r") as configfile:
-                        try:
-                            if type(json.load(configfile)) != dict:
-                                raise TypeError
-                        except:
-                            winfo("Config file seems to be broken... Resetting config.")
-                            broken = True
-                        else:
-                            broken = False
-                    if broken:
-                        reset()
-                else:
-                    reset(p=False)
-            else:
-                os.mkdir(config_dir)
-                reset(p=False)
+        os.makedirs(config_dir, exist_ok=True)
+        if os.path.exists(config):
+            try:
+                if type(_load()) != dict:
+                    raise TypeError
+            except:
+                winfo("Config file seems to be broken... Resetting config.")
+                reset()
         else:
-            if os.path.exists(_config):
-                if os.path.exists(config_dir):
-                    if os.path.exists(config):
-                        with open(config, "r") as configfile:
-                            try:
-                                if type(json.load(configfile)) != dict:
-                                    raise TypeError
-                            except:
-                                winfo("Config file seems to be broken... Resetting config.")
-                                broken = True
-                            else:
-                                broken = False
-                        if broken:
-                            reset()
-                    else:
-                        reset(p=False)
-                else:
-                    os.mkdir(config_dir)
-                    reset(p=False)
-            else:
-                os.mkdir(_config)
-                os.mkdir(config_dir)
-                reset(p=False)
+            reset(p=False)
     except:
         pass
 
@@ -112,13 +135,25 @@ def get(variable: str, default=None, verbose=False):
     Returns:
         Any: default
     """
-    if verbose:
-        log("Reading config file")
-    with open(config, "r") as configfile:
-        configjson = json.load(configfile)
-    result = configjson.get(variable)
+    result = _load(verbose=verbose).get(variable)
     return default if result == None else result
 
+def update(variables: dict, verbose=False) -> dict:
+    """
+    Set values to many variables in config file with a single write.
+
+    Args:
+        variables (dict): variables to set mapped to their values
+        verbose (bool, optional): whether show more output or not. Defaults to False.
+
+    Returns:
+        dict: config in dictionary
+    """
+    configjson = dict(_load(verbose=verbose))
+    configjson.update(variables)
+    _write(configjson, verbose=verbose)
+    return configjson
+
 def set(variable: str, value=None, verbose=False) -> dict:
     """
     Set value to a variable in config file.
@@ -131,14 +166,4 @@ def set(variable: str, value=None, verbose=False) -> dict:
     Returns:
         dict: config in dictionary
     """
-    if verbose:
-        log("Reading config file")
-    with open(config, "r") as configfile:
-        configjson = json.load(configfile)
-    configjson[variable] = value
-    
-    if verbose:
-        log("Writing config file")
-    with open(config, "w") as configfile:
-        json.dump(configjson, configfile, sort_keys=True, indent=4)
-    return configjson
\ No newline at end of file
+    return update({variable: value}, verbose=verbose)
@@ -0,0 +1,91 @@
+import re
+
+__all__ = [
+    "compile_filter"
+]
+
+def _compile(senders: list, match: list, exclude: list):
+    """
+    Function to build the check for one set of filters.
+
+    Returns:
+        Callable: called with a message payload, returns whether to keep it. None if there are no filters.
+    """
+    if not senders and not match and not exclude:
+        return None
+    senders = frozenset(sender.strip() for sender in senders)
+    match = [re.compile(pattern).search for pattern in match]
+    exclude = [re.compile(pattern).search for pattern in exclude]
+
+    def accept(message: dict) -> bool:
+        if senders:
+            sender = message.get("sender") or {}
+            if sender.get("id") not in senders and f"{sender.get('username')}.{sender.get('tag')}" not in senders:
+                return False
+        if match or exclude:
+            content = message.get("content")
+            if type(content) != str:
+                content = ""
+            if match and not any(search(content) != None for search in match):
+                return False
+            if exclude and any(search(content) != None for search in exclude):
+                return False
+        return True
+    return accept
+
+def compile_filter(senders: list = [], match: list = [], exclude: list = [], channels: list = []):
+    """
+    Function to build a check for received messages out of the filter options.
+    Everything is prepared once here so checking a message is only a few lookups
+    and regex searches. Senders are checked first since that is cheapest.
+    Every regex is compiled on its own so inline flags like (?i) and backreferences
+    work the same however many are given.
+
+    A value given as ID:VALUE, where ID is one of `channels`, only applies to that channel.
+    The channel's values are used together with the ones given without a channel.
+
+    Args:
+        senders (list, optional): only messages from these senders, as username.tag or id. Defaults to [].
+        match (list, optional): only messages whose content matches one of these regexes. Defaults to [].
+        exclude (list, optional): no messages whose content matches one of these regexes. Defaults to [].
+        channels (list, optional): ids of the channels values can be scoped to. Defaults to [].
+
+    Raises:
+        re.error: if a regex is invalid
+
+    Returns:
+        Callable: called with a message payload and the id of its channel, returns whether to keep it.
+            None if there are no filters.
+
+    Example:
+        >>> accept = compile_filter(match=["(?i)deploy", "(?P<a>a)(?P=a)"], exclude=["(?i)staging"])
+        >>> accept({"content": "DEPLOY done"}), accept({"content": "aa"}), accept({"content": "Deploy to Staging"})
+        (True, True, False)
+        >>> accept = compile_filter(match=["ops:^deploy"], exclude=["(?i)staging"], channels=["ops", "dev"])
+        >>> accept({"content": "build done"}, "ops"), accept({"content": "build done"}, "dev")
+        (False, True)
+    """
+    channels = set(channels)
+    scoped = {}
+    common = ([], [], [])
+
+    for index, values in enumerate((senders, match, exclude)):
+        for value in values:
+            channel, separator, scoped_value = value.partition(":")
+            if separator and channel in channels:
+                scoped.setdefault(channel, ([], [], []))[index].append(scoped_value)
+            else:
+                common[index].append(value)
+
+    accept_any = _compile(*common)
+    checks = {
+        channel: _compile(*[common[index] + values[index] for index in range(3)])
+        for channel, values in scoped.items()
+    }
+    if accept_any == None and not checks:
+        return None
+
+    def accept(message: dict, channel_id=None) -> bool:
+        check = checks.get(channel_id, accept_any)
+        return check == None or check(message)
+    return accept
@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from collections import deque
+from . import config
+
+__all__ = [
+    "overflow_policies",
+    "exec_hook",
+    "load_hook",
+    "HookQueue"
+]
+
+overflow_policies = ("block", "drop-oldest", "spill")
+
+def exec_hook(command: str):
+    """
+    Function to make a hook that runs a shell command for every message.
+    The command gets the message as JSON on stdin and these environment variables:
+    AHURI_CHANNEL_ID, AHURI_MESSAGE_ID, AHURI_SENDER (username.tag) and AHURI_CONTENT.
+    What the command prints goes to stderr, so it never mixes with the messages on stdout.
+
+    Args:
+        command (str): the command
+
+    Returns:
+        Callable: coroutine function called with (message, channel id), raises RuntimeError with the command's
+            error output if it fails
+    """
+    async def hook(message: dict, channel_id) -> None:
+        sender = message.get("sender") or {}
+        env = dict(
+            os.environ,
+            AHURI_CHANNEL_ID = str(channel_id or ""),
+            AHURI_MESSAGE_ID = str(message.get("id") or ""),
+            AHURI_SENDER = f"{sender.get('username')}.{sender.get('tag')}",
+            AHURI_CONTENT = str(message.get("content") or "")
+        )
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdin = asyncio.subprocess.PIPE,
+            stdout = sys.stderr,
+            stderr = asyncio.subprocess.PIPE,
+            env = env
+        )
+        _, error = await process.communicate(json.dumps(message).encode())
+        error = error.decode(errors="replace").strip()
+        if process.returncode != 0:
+            raise RuntimeError(f"'{command}' exited with status {process.returncode}" + (f": {error}" if error else ""))
+        if error:
+            print(error, file=sys.stderr, flush=True)
+    hook.__name__ = command
+    return hook
+
+def load_hook(spec: str):
+    """
+    Function to import a Python hook given as module:function.
+    The function is called with (message, channel id) and may be a coroutine function.
+    Other functions are run in a thread so they don't block the event loop.
+
+    Args:
+        spec (str): module and function, for example myhooks:on_message
+
+    Raises:
+        ValueError: if spec is invalid or the function isn't callable
+        ImportError: if the module can't be imported
+
+    Returns:
+        Callable: coroutine function called with (message, channel id)
+    """
+    import importlib
+
+    module, _, name = spec.partition(":")
+    if not module or not name:
+        raise ValueError(f"expected module:function, got '{spec}'")
+    # let hooks live next to where the command is run
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    func = importlib.import_module(module)
+    for attribute in name.split("."):
+        func = getattr(func, attribute, None)
+    if not callable(func):
+        raise ValueError(f"'{spec}' is not a function")
+
+    if asyncio.iscoroutinefunction(func):
+        return func
+    async def hook(message: dict, channel_id) -> None:
+        await asyncio.to_thread(func, message, channel_id)
+    hook.__name__ = spec
+    return hook
+
+class HookQueue:
+    """
+    Hands received messages to hooks through a bounded queue served by a pool
+    of workers, so a slow hook doesn't hold up receiving messages.
+
+    When the queue is full, the overflow policy decides what happens to a new message:
+        spill: write messages to a file and queue them again, in order, once there is room
+        drop-oldest: drop the oldest waiting message to make room
+        block: wait for room, receiving stops until the hooks catch up
+
+    Args:
+        hooks (list): coroutine functions called with (message, channel id), see exec_hook and load_hook
+        workers (int, optional): messages to handle at the same time. Defaults to 4.
+        size (int, optional): messages that can wait in the queue. Defaults to 1000.
+        overflow (str, optional): "spill", "drop-oldest" or "block". Defaults to "spill".
+        spill_path (str, optional): file to spill messages to. Defaults to a file in the config directory.
+        on_error (Callable, optional): called with (hook, message, exception) when a hook fails. Defaults to None.
+    """
+    def __init__(
+        self,
+        hooks: list,
+        workers: int = 4,
+        size: int = 1000,
+        overflow: str = "spill",
+        spill_path: str = None,
+        on_error = None
+    ):
+        if overflow not in overflow_policies:
+            raise ValueError(f"overflow must be one of {', '.join(overflow_policies)}")
+        self.hooks = hooks
+        self.workers = max(1, workers)
+        self.size = max(1, size)
+        self.overflow = overflow
+        self.spill_path = spill_path or os.path.join(config.config_dir, f"hooks-spill-{os.getpid()}.ndjson")
+        self.on_error = on_error
+
+        self.received = 0
+        self.handled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.latencies = deque(maxlen=1000)
+
+        self._queue = None
+        self._tasks = []
+        self._spill = None
+        self._spill_offset = 0
+        self._spill_waiting = 0
+
+    def depth(self) -> int:
+        """
+        Function to get the number of messages waiting, including spilled ones.
+
+        Returns:
+            int: messages waiting
+        """
+        return (self._queue.qsize() if self._queue != None else 0) + self._spill_waiting
+
+    def start(self) -> None:
+        """
+        Function to start the workers. Has to be called from a running event loop.
+        """
+        self._queue = asyncio.Queue(self.size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def put(self, message: dict, channel_id=None) -> None:
+        """
+        Function to queue a message for the hooks, following the overflow policy if the queue is full.
+
+        Args:
+            message (dict): message payload received from the websocket
+            channel_id (Any, optional): id of the channel the message was sent in. Defaults to None.
+        """
+        self.received += 1
+        item = (message, channel_id)
+        if self.overflow == "block":
+            await self._queue.put(item)
+        elif self.overflow == "drop-oldest":
+            if self._queue.full():
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+            self._queue.put_nowait(item)
+        elif self._spill_waiting or self._queue.full():
+            # once spilling, keep spilling until the file is read back so the order is kept
+            self._spill_write(item)
+        else:
+            self._queue.put_nowait(item)
+        self.max_depth = max(self.max_depth, self.depth())
+
+    def _spill_write(self, item: tuple) -> None:
+        """
+        Function to append a message to the spill file.
+
+        Args:
+            item (tuple): (message, channel id)
+        """
+        if self._spill == None:
+            self._spill = open(self.spill_path, "w+", encoding="utf-8")
+            self._spill_offset = 0
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write(json.dumps(item) + "\n")
+        self._spill_waiting += 1
+        self.spilled += 1
+
+    def _spill_read(self) -> None:
+        """
+        Function to move spilled messages back into the queue while it has room.
+        """
+        if not self._spill_waiting:
+            return
+        self._spill.flush()
+        self._spill.seek(self._spill_offset)
+        while self._spill_waiting and not self._queue.full():
+            message, channel_id = json.loads(self._spill.readline())
+            self._queue.put_nowait((message, channel_id))
+            self._spill_waiting -= 1
+        self._spill_offset = self._spill.tell()
+        if not self._spill_waiting:
+            # everything was read back, start the file over
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_offset = 0
+
+    async def _worker(self) -> None:
+        """
+        Function that takes messages off the queue and calls every hook with them.
+        """
+        while True:
+            message, channel_id = await self._queue.get()
+            try:
+                self._spill_read()
+                started = time.perf_counter()
+                failed = False
+                for hook in self.hooks:
+                    try:
+                        await hook(message, channel_id)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        failed = True
+                        if self.on_error != None:
+                            self.on_error(hook, message, e)
+                self.latencies.append(time.perf_counter() - started)
+                if failed:
+                    self.failed += 1
+                else:
+                    self.handled += 1
+            finally:
+                self._queue.task_done()
+
+    async def close(self, timeout: float = 5) -> None:
+        """
+        Function to wait for the queued messages to be handled and stop the workers.
+
+        Args:
+            timeout (float, optional): seconds to wait for the hooks to catch up. Defaults to 5.
+        """
+        if self._queue == None:
+            return
+        try:
+            deadline = time.monotonic() + timeout
+            while self.depth() and time.monotonic() < deadline:
+                self._spill_read()
+                try:
+                    await asyncio.wait_for(self._queue.join(), max(0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self._spill != None:
+                self._spill.close()
+                os.remove(self.spill_path)
+                self._spill = None
+
+    def report(self) -> str:
+        """
+        Function to describe what the hooks did.
+
+        Returns:
+            str: the description
+        """
+        text = f"Hooks: {self.handled} handled, {self.failed} failed, {self.dropped} dropped, {self.spilled} spilled, {self.depth()} left in queue (at most {self.max_depth} waiting)"
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            average = sum(latencies) / len(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            text += f"\nHook latency: {average * 1000:.1f}ms average, {p95 * 1000:.1f}ms p95, {latencies[-1] * 1000:.1f}ms max"
+        return text
@@ -0,0 +1,365 @@
+import sys
+import json
+import time
+import random
+from . import (
+    api,
+    metrics,
+    timing
+)
+from .utils import *
+from .render import Renderer
+from datetime import datetime
+
+__all__ = [
+    "message_channel",
+    "listen"
+]
+
+# Seconds to wait before the first reconnect attempt, doubled after every failed attempt
+reconnect_delay = 0.5
+# Longest wait between reconnect attempts
+reconnect_max_delay = 30
+
+def message_channel(message: dict, default=None):
+    """
+    Function to get the id of the channel a message was sent in.
+
+    Args:
+        message (dict): message payload received from the websocket
+        default (Any, optional): value returned if the message has no channel. Defaults to None.
+
+    Returns:
+        Any: channel id
+    """
+    channel = message.get("channel", message.get("channelId"))
+    if type(channel) == dict:
+        channel = channel.get("id")
+    return default if channel == None else channel
+
+async def open_channels(ws, token: str, ids: list, verbose: bool = False) -> None:
+    """
+    Function to authorize a websocket connection and open channels on it.
+
+    Args:
+        ws (websockets.WebSocketClientProtocol): the connection
+        token (str): token of the user
+        ids (list): ids of the channels to open
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    if verbose:
+        log("Authorizing connection...")
+    with timing.span("authorize", "ws"):
+        await ws.send(json.dumps({
+            "command": "authorize",
+            "arguments": {
+                "token": token
+            }
+        }))
+    if verbose:
+        log("Authorized connection!")
+    for id in ids:
+        if verbose:
+            log(f"Opening channel '{id}'...")
+        with timing.span("open channel", "ws", id=id):
+            await ws.send(json.dumps({
+                "command": "open channel",
+                "arguments": {
+                    "id": id
+                }
+            }))
+    if verbose:
+        log(f"Opened {len(ids)} {'channels' if len(ids) > 1 else 'channel'}!")
+
+# websocket code for connecting to channels
+async def listen(
+    client: api.Client,
+    ids: list,
+    ws_url: str,
+    time_format: str,
+    mute: list = [],
+    reconnect: bool = True,
+    archive = None,
+    cache = None,
+    hooks = None,
+    accept = None,
+    output: str = "text",
+    queue_size: int = 10000,
+    coalesce_at: int = 1000,
+    verbose: bool = False
+) -> None:
+    """
+    Websockets code for connecting to one or more channels over a single connection.
+    If the connection drops it is opened again, waiting longer after every failed attempt.
+
+    Receiving and showing messages run as separate tasks joined by a bounded queue,
+    so a slow terminal doesn't stop messages from being read off the connection.
+    Every received message is archived and handed to hooks as it is received,
+    only showing it can be dropped or summarized when output can't keep up.
+
+    Args:
+        client (api.Client): API client of the user
+        ids (list): ids of the channels to connect to
+        ws_url (str): websocket url
+        time_format (str): time format
+        mute (list, optional): ids of channels whose messages are not shown. Defaults to [].
+        reconnect (bool, optional): whether to reconnect when the connection drops or not. Defaults to True.
+        archive (archive.Archive, optional): archive to save received messages to. Defaults to None.
+        cache (cache.ChannelCache, optional): cache to look the channels up in. Defaults to None.
+        hooks (hooks.HookQueue, optional): queue to hand received messages to hooks through. Defaults to None.
+        accept (Callable, optional): check from filters.compile_filter, messages it rejects are dropped before
+            they are archived, handed to hooks or shown. Defaults to None.
+        output (str, optional): "text" to show messages for people, "ndjson" to write one JSON object per message
+            and nothing else, warnings and logs go to utils.stream which has to be pointed away from stdout. Defaults to "text".
+        queue_size (int, optional): received messages that can wait to be shown. When full, the oldest is dropped from the text output,
+            ndjson output stops receiving until there is room instead so no message is left out. Defaults to 10000.
+        coalesce_at (int, optional): waiting messages at which bursts are shown as one summary per sender, 0 to never. Defaults to 1000.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+
+    Raises:
+        api.APIError: if getting one of the channels failed
+    """
+    import asyncio
+    import websockets
+
+    tagged = len(ids) > 1
+    text = output == "text"
+    renderer = Renderer(time_format, tagged=tagged, verbose=verbose, format=output, auto_flush=False)
+    default_channel = None if tagged else ids[0]
+    channels = None
+    names = {}
+    attempt = 0
+    reconnects = 0
+    received = 0
+    filtered = 0
+    dropped = 0
+    coalesced = 0
+    downtime = 0.0
+    disconnected_at = None
+    # (time received, message, channel id) waiting for the consumer
+    queue = asyncio.Queue(max(1, queue_size))
+    consumer = None
+    measure = metrics.enabled
+
+    async def notice(message: str, warning: bool = True) -> None:
+        await renderer.drain()
+        if text:
+            print()
+        (winfo if warning else info)(message)
+
+    async def receive(ws) -> None:
+        """
+        Receives messages as fast as the server sends them, archives them and hands
+        them to hooks, then queues them to be shown. If the consumer falls so far
+        behind that the queue is full, the oldest waiting message is dropped from
+        the text output so memory stays bounded and the server never sees us stop
+        reading. ndjson output is read by programs, so it waits for room instead.
+        """
+        nonlocal attempt, dropped
+        while True:
+            msg = await ws.recv()
+            # the connection works, start the backoff over next time it drops
+            attempt = 0
+            if measure:
+                metrics.count("ahuri_ws_messages_total")
+                metrics.count("ahuri_ws_bytes_total", len(msg))
+            handled = await handle(msg)
+            if handled == None:
+                continue
+            if not text:
+                await queue.put((time.monotonic(), *handled))
+                continue
+            if queue.full():
+                queue.get_nowait()
+                dropped += 1
+                if measure:
+                    metrics.count("ahuri_ws_dropped_total")
+            queue.put_nowait((time.monotonic(), *handled))
+
+    async def handle(msg: str):
+        """
+        Decodes a message and archives it and hands it to hooks.
+
+        Returns:
+            tuple: (message, channel id) to show, None if it was filtered out or muted
+        """
+        nonlocal received, filtered
+        if measure:
+            decode_started = time.perf_counter()
+            wsr = json.loads(msg)
+            metrics.observe("ahuri_ws_decode_seconds", time.perf_counter() - decode_started)
+        else:
+            wsr = json.loads(msg)
+        if verbose:
+            log(f"Message received from server: {msg}")
+            if "message" in wsr:
+                log(wsr["message"])
+
+        if wsr.get("payload") == None:
+            if "message" in wsr:
+                await notice(f"Invalid websocket response returned. Message: {wsr['message']}\nExiting.")
+            else:
+                await notice(f"Invalid websocket response returned. Websocket response:\n{json.dumps(wsr, indent=2)}\nExiting.")
+            sys.exit()
+
+        message = wsr["payload"]
+        received += 1
+        channel_id = message_channel(message, default_channel)
+        if accept != None and not accept(message, channel_id):
+            filtered += 1
+            return None
+        if archive != None:
+            archive.add(message, channel_id or "")
+        if hooks != None:
+            await hooks.put(message, channel_id)
+        if channel_id in mute:
+            return None
+        return message, channel_id
+
+    async def consume() -> None:
+        """
+        Shows queued messages. While more than `coalesce_at` are waiting, messages
+        are taken off the queue in bulk and every sender's messages in the burst
+        are shown as one summary line instead.
+        """
+        nonlocal coalesced
+        while True:
+            received_at, message, channel_id = await queue.get()
+            if not text or coalesce_at <= 0 or queue.qsize() < coalesce_at:
+                if measure:
+                    render_started = time.perf_counter()
+                    renderer.message(message, channel_id, names.get(channel_id) or channel_id or "?")
+                    metrics.observe("ahuri_ws_render_seconds", time.perf_counter() - render_started)
+                else:
+                    renderer.message(message, channel_id, names.get(channel_id) or channel_id or "?")
+            else:
+                burst = [(received_at, message, channel_id)] + [queue.get_nowait() for _ in range(queue.qsize())]
+                groups = {}
+                for received_at, message, channel_id in burst:
+                    key = (channel_id, message["sender"]["id"])
+                    if key in groups:
+                        groups[key][1] += 1
+                        groups[key][3] = received_at
+                    else:
+                        groups[key] = [message, 1, received_at, received_at]
+                for (channel_id, _), (message, count, first, last) in groups.items():
+                    name = names.get(channel_id) or channel_id or "?"
+                    if count == 1:
+                        renderer.message(message, channel_id, name)
+                    else:
+                        coalesced += count
+                        if measure:
+                            metrics.count("ahuri_ws_coalesced_total", count)
+                        renderer.summary(count, message["sender"], last - first, channel_id, name)
+            if measure:
+                metrics.gauge("ahuri_ws_queue_depth", queue.qsize())
+            if queue.empty() or renderer.buffered() >= renderer.buffer_size:
+                if measure and renderer.buffered():
+                    write_started = time.perf_counter()
+                    await renderer.drain()
+                    metrics.observe("ahuri_ws_write_seconds", time.perf_counter() - write_started)
+                else:
+                    await renderer.drain()
+
+    # look the channels up while the websocket connects and authorizes
+    if text:
+        info(f"Getting {'channels' if tagged else 'channel'} from ID '{', '.join(ids)}'...")
+    started = time.perf_counter()
+    if cache != None:
+        lookup = asyncio.gather(*[asyncio.to_thread(cache.channel, client, id) for id in ids])
+    else:
+        lookup = asyncio.gather(*[asyncio.to_thread(client.request, "GET", "channel", id) for id in ids])
+    # errors are raised where the lookup is awaited, don't warn about them if it never is
+    lookup.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    reporter = None
+    if hooks != None:
+        hooks.start()
+        if verbose:
+            async def report() -> None:
+                while True:
+                    await asyncio.sleep(10)
+                    await renderer.drain()
+                    log(hooks.report())
+            reporter = asyncio.create_task(report())
+
+    if verbose:
+        log(f"Establishing connection to websocket server at {ws_url}")
+    if text:
+        info(f"Connecting to {'channels' if tagged else 'channel'} '{', '.join(ids)}'...")
+    try:
+        while True:
+            try:
+                handshake_started = time.perf_counter()
+                async with websockets.connect(ws_url) as ws:
+                    timing.add("websocket handshake", handshake_started, time.perf_counter(), "ws", url=ws_url)
+                    if verbose:
+                        log(f"Connection established in {(time.perf_counter() - started) * 1000:.0f}ms!")
+                    await open_channels(ws, client.token, ids, verbose=verbose)
+
+                    if channels == None:
+                        with timing.span("wait for channel lookup", "ws"):
+                            channels = dict(zip(ids, await lookup))
+                        names = {id: channel["name"] for id, channel in channels.items()}
+                        if verbose:
+                            log(f"Connected in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+                        if text:
+                            info("Success!")
+                            for channel in channels.values():
+                                info(f"You are now connected to channel '{channel['name']}' owned by {channel['owner']['username']}.{channel['owner']['tag']}")
+                            for id in mute:
+                                if id in channels:
+                                    info(f"Muted channel '{channels[id]['name']}'.")
+                        consumer = asyncio.create_task(consume())
+                    else:
+                        gap = time.monotonic() - disconnected_at
+                        downtime += gap
+                        reconnects += 1
+                        metrics.count("ahuri_ws_reconnects_total")
+                        disconnected_at = None
+                        renderer.last_message = None
+                        await notice(f"Reconnected after {gap:.1f}s. Messages sent from {gap_start} to {datetime.now().strftime(time_format)} may be missing.", warning=False)
+
+                    receiver = asyncio.create_task(receive(ws))
+                    try:
+                        # the consumer only stops if it fails, the receiver when the connection drops
+                        done, _ = await asyncio.wait((receiver, consumer), return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        receiver.cancel()
+                    for task in done:
+                        task.result()
+            except (websockets.WebSocketException, OSError, asyncio.TimeoutError) as e:
+                # give up if the first connection fails, the url or server is probably wrong
+                if not reconnect or channels == None:
+                    raise
+                if disconnected_at == None:
+                    disconnected_at = time.monotonic()
+                    gap_start = datetime.now().strftime(time_format)
+                    await notice(f"Disconnected from websocket server ({e or type(e).__name__}). Reconnecting...")
+                wait = random.uniform(0, min(reconnect_max_delay, reconnect_delay * 2 ** attempt))
+                attempt += 1
+                if verbose:
+                    log(f"Reconnect attempt {attempt} in {wait:.2f}s")
+                await asyncio.sleep(wait)
+    except KeyboardInterrupt:
+        if text:
+            winfo("Keyboard Interrupt sent. Exiting.")
+    finally:
+        lookup.cancel()
+        if consumer != None:
+            consumer.cancel()
+        if reporter != None:
+            reporter.cancel()
+        if hooks != None:
+            await hooks.close()
+        renderer.flush()
+        if verbose and accept != None:
+            log(f"Filtered out {filtered} of {received} received messages")
+        if dropped or coalesced:
+            summary = f"{coalesced} {'message was' if coalesced == 1 else 'messages were'} shown as summaries and {dropped} dropped because output couldn't keep up."
+            info(summary)
+        if disconnected_at != None:
+            downtime += time.monotonic() - disconnected_at
+        if text and (reconnects > 0 or disconnected_at != None):
+            info(f"Reconnected {reconnects} {'time' if reconnects == 1 else 'times'}, disconnected for {downtime:.1f}s in total.")
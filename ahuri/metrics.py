@@ -0,0 +1,287 @@
+import os
+import time
+import tempfile
+import threading
+from bisect import bisect_left
+
+__all__ = [
+    "enabled",
+    "endpoint",
+    "count",
+    "observe",
+    "gauge",
+    "reset",
+    "summary",
+    "prometheus",
+    "write_prometheus",
+    "PrometheusWriter"
+]
+
+# Nothing is recorded unless this is set, so the client pays nothing for metrics it doesn't use
+enabled = False
+
+# Upper bounds in seconds of the latency histogram buckets
+buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_help = {
+    "ahuri_http_request_seconds": ("histogram", "Time taken by HTTP requests to the API, per attempt."),
+    "ahuri_http_responses_total": ("counter", "HTTP responses received from the API by status code, error if none was received."),
+    "ahuri_http_retries_total": ("counter", "HTTP requests sent again after a failure."),
+    "ahuri_ws_messages_total": ("counter", "Messages received from the websocket server."),
+    "ahuri_ws_bytes_total": ("counter", "Bytes of messages received from the websocket server."),
+    "ahuri_ws_decode_seconds": ("histogram", "Time taken to decode a received message."),
+    "ahuri_ws_render_seconds": ("histogram", "Time taken to format a received message for the terminal."),
+    "ahuri_ws_write_seconds": ("histogram", "Time taken to write a batch of output to the terminal."),
+    "ahuri_ws_dropped_total": ("counter", "Received messages dropped because output couldn't keep up."),
+    "ahuri_ws_coalesced_total": ("counter", "Received messages shown as part of a summary line."),
+    "ahuri_ws_queue_depth": ("gauge", "Received messages waiting to be shown."),
+    "ahuri_ws_reconnects_total": ("counter", "Times the websocket connection was opened again after dropping.")
+}
+
+# Counters shown with their rate per second by summary()
+_rates = ("ahuri_ws_messages_total", "ahuri_ws_bytes_total")
+
+_lock = threading.Lock()
+_started = time.time()
+# (name, labels) mapped to a number for counters and gauges, [bucket counts, sum, count] for histograms
+_values = {}
+
+def endpoint(method: str, path: tuple) -> str:
+    """
+    Function to get the endpoint label of a request, with ids left out
+    so every channel shares one series.
+
+    Args:
+        method (str): HTTP method
+        path (tuple): path segments after the api url
+
+    Returns:
+        str: the label, for example GET /channel/{id}/messages
+    """
+    segments = []
+    for segment in path:
+        segments.append("{id}" if segments and segments[-1] == "channel" else segment)
+    return f"{method.upper()} /{'/'.join(segments)}"
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """
+    Function to add to a counter.
+
+    Args:
+        name (str): name of the counter
+        value (float, optional): amount to add. Defaults to 1.
+        **labels (str): labels of the series
+    """
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+def gauge(name: str, value: float, **labels) -> None:
+    """
+    Function to set a gauge.
+
+    Args:
+        name (str): name of the gauge
+        value (float): its value
+        **labels (str): labels of the series
+    """
+    if not enabled:
+        return
+    with _lock:
+        _values[(name, tuple(sorted(labels.items())))] = value
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Function to record a value in a histogram.
+
+    Args:
+        name (str): name of the histogram
+        value (float): the value, in seconds for latencies
+        **labels (str): labels of the series
+    """
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect_left(buckets, value)
+    with _lock:
+        histogram = _values.get(key)
+        if histogram == None:
+            histogram = _values[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+def reset() -> None:
+    """
+    Function to forget everything recorded so far.
+    """
+    global _started
+    with _lock:
+        _values.clear()
+        _started = time.time()
+
+def _quantile(histogram: list, q: float) -> float:
+    """
+    Function to estimate a quantile from histogram buckets, as the upper bound of the bucket it falls in.
+
+    Args:
+        histogram (list): [bucket counts, sum, count]
+        q (float): the quantile, between 0 and 1
+
+    Returns:
+        float: the estimate, inf if it falls past the last bucket
+    """
+    rank = q * histogram[2]
+    seen = 0
+    for index, bucket in enumerate(histogram[0]):
+        seen += bucket
+        if seen >= rank:
+            return buckets[index] if index < len(buckets) else float("inf")
+    return float("inf")
+
+def summary() -> str:
+    """
+    Function to describe everything recorded so far for people, for --stats.
+
+    Returns:
+        str: the description, empty if nothing was recorded
+    """
+    with _lock:
+        values = {key: (value if type(value) != list else [list(value[0]), value[1], value[2]]) for key, value in _values.items()}
+    elapsed = max(time.time() - _started, 1e-9)
+
+    def labels_text(labels: tuple) -> str:
+        return "(" + ", ".join(f"{name} {value}" for name, value in labels) + ")" if labels else ""
+
+    lines = []
+    for (name, labels), value in sorted(values.items()):
+        if type(value) == list:
+            if value[2] == 0:
+                continue
+            lines.append(
+                f"{name} {labels_text(labels)}".strip()
+                + f": {value[2]} in total, {value[1] / value[2] * 1000:.2f}ms average,"
+                + f" p50 <= {_quantile(value, 0.5) * 1000:g}ms, p95 <= {_quantile(value, 0.95) * 1000:g}ms, p99 <= {_quantile(value, 0.99) * 1000:g}ms"
+            )
+        elif name in _rates:
+            lines.append(f"{name} {labels_text(labels)}".strip() + f": {value:g} ({value / elapsed:.1f}/s)")
+        else:
+            lines.append(f"{name} {labels_text(labels)}".strip() + f": {value:g}")
+    return "\n".join(lines)
+
+def _escape(value) -> str:
+    """
+    Function to escape a label value for the Prometheus text format.
+
+    Args:
+        value (Any): the value
+
+    Returns:
+        str: escaped value
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus() -> str:
+    """
+    Function to get everything recorded so far in the Prometheus text format.
+
+    Returns:
+        str: the metrics
+    """
+    with _lock:
+        values = {key: (value if type(value) != list else [list(value[0]), value[1], value[2]]) for key, value in _values.items()}
+
+    def labels_text(labels, extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    lines = []
+    described = set()
+    for (name, labels), value in sorted(values.items()):
+        if name not in described:
+            described.add(name)
+            kind, help = _help.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+        if type(value) == list:
+            cumulative = 0
+            for index, bucket in enumerate(value[0]):
+                cumulative += bucket
+                bound = f"{buckets[index]:g}" if index < len(buckets) else "+Inf"
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{labels_text(labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(labels)} {value[1]}")
+            lines.append(f"{name}_count{labels_text(labels)} {value[2]}")
+        else:
+            lines.append(f"{name}{labels_text(labels)} {value:g}")
+    lines.append("# HELP ahuri_start_time_seconds Unix time the client started recording metrics.")
+    lines.append("# TYPE ahuri_start_time_seconds gauge")
+    lines.append(f"ahuri_start_time_seconds {_started}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str) -> None:
+    """
+    Function to replace a file with the metrics in the Prometheus text format atomically,
+    so a scraper like node_exporter's textfile collector never reads half a file.
+
+    Args:
+        path (str): path of the file, node_exporter only reads files ending in .prom
+    """
+    fd, tmp = tempfile.mkstemp(prefix=".ahuri-", suffix=".prom.tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as promfile:
+            promfile.write(prometheus())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+class PrometheusWriter:
+    """
+    Rewrites a Prometheus text format file every `interval` seconds from a background thread,
+    for long running commands.
+
+    Args:
+        path (str): path of the file
+        interval (float, optional): seconds between writes. Defaults to 15.
+    """
+    def __init__(self, path: str, interval: float = 15):
+        self.path = path
+        self.interval = interval
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        """
+        Function to write the file now. Errors are kept in `error` instead of raised.
+        """
+        try:
+            write_prometheus(self.path)
+        except OSError as e:
+            self.error = e
+
+    def start(self) -> None:
+        """
+        Function to write the file and keep rewriting it until stop() is called.
+        """
+        self.write()
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Function to stop rewriting the file, writing it one last time.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
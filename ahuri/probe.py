@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import asyncio
+from . import api
+from .utils import *
+from .bench import percentile
+from .listener import (
+    open_channels,
+    reconnect_delay,
+    reconnect_max_delay
+)
+
+__all__ = [
+    "prefix",
+    "Probe"
+]
+
+# Start of the content of messages sent by probes, followed by the run id and sequence number
+prefix = "ahuri-probe"
+
+class Probe:
+    """
+    Measures how long a message takes from being sent to the API to being received
+    on the websocket. Keeps the channel open on a websocket connection, sends a tagged
+    message every `interval` seconds and matches it in what the connection receives.
+    Messages not received within `timeout` seconds, or not sent at all, count as lost.
+
+    Totals are kept on the object, so they can be reported even if run() is interrupted.
+
+    Args:
+        client (api.Client): API client of the user
+        channel_id (str): id of the channel to send the probes to
+        ws_url (str): websocket url
+        interval (float, optional): seconds between probes. Defaults to 1.
+        timeout (float, optional): seconds to wait for a probe before counting it as lost. Defaults to 5.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    def __init__(
+        self,
+        client: api.Client,
+        channel_id: str,
+        ws_url: str,
+        interval: float = 1,
+        timeout: float = 5,
+        verbose: bool = False
+    ):
+        self.client = client
+        self.channel_id = channel_id
+        self.ws_url = ws_url
+        self.interval = interval
+        self.timeout = timeout
+        self.verbose = verbose
+        self.tag = f"{prefix} {os.urandom(4).hex()} "
+        self.disconnects = 0
+
+        # sequence number mapped to time.perf_counter() when it was sent
+        self._pending = {}
+        self._sequence = 0
+        self._total = self._new_window()
+        self._window = self._new_window()
+        self._connected = None
+
+    @staticmethod
+    def _new_window() -> dict:
+        return {
+            "started": time.time(),
+            "sent": 0,
+            "errors": 0,
+            "lost": 0,
+            "latencies": []
+        }
+
+    def _record(self, key: str, value=1) -> None:
+        for window in (self._total, self._window):
+            if key == "latencies":
+                window[key].append(value)
+            else:
+                window[key] += value
+
+    def summary(self, window: bool = False) -> dict:
+        """
+        Function to summarize the probes so far.
+
+        Args:
+            window (bool, optional): whether to summarize only the probes since the last report or not. Defaults to False.
+
+        Returns:
+            dict: probes sent and received, send errors, loss, and p50, p95, p99, max and jitter
+                (mean difference between consecutive latencies) in milliseconds, None if nothing was received
+        """
+        stats = self._window if window else self._total
+        latencies = stats["latencies"]
+        ordered = sorted(latencies)
+        attempted = stats["sent"] + stats["errors"]
+        lost = stats["lost"] + stats["errors"]
+
+        def ms(value):
+            return round(value * 1000, 3) if value != None else None
+
+        return {
+            "time": round(time.time(), 3),
+            "seconds": round(time.time() - stats["started"], 3),
+            "sent": stats["sent"],
+            "errors": stats["errors"],
+            "received": len(latencies),
+            "lost": lost,
+            "loss": round(lost / attempted, 6) if attempted else 0,
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "max": ms(ordered[-1] if ordered else None),
+            "jitter": ms(
+                sum(abs(latencies[index] - latencies[index - 1]) for index in range(1, len(latencies))) / (len(latencies) - 1)
+                if len(latencies) > 1 else None
+            ),
+            "disconnects": self.disconnects
+        }
+
+    async def _receive(self) -> None:
+        """
+        Function to keep the channel open and match received probes, reconnecting when the connection drops.
+        Errors are raised if the first connection fails.
+        """
+        import websockets
+
+        delay = reconnect_delay
+        connected = False
+        while True:
+            try:
+                async with websockets.connect(self.ws_url) as ws:
+                    await open_channels(ws, self.client.token, [self.channel_id], verbose=self.verbose)
+                    self._connected.set()
+                    connected = True
+                    delay = reconnect_delay
+                    async for text in ws:
+                        received_at = time.perf_counter()
+                        try:
+                            content = json.loads(text)["payload"]["content"]
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                        if type(content) != str or not content.startswith(self.tag):
+                            continue
+                        sent_at = self._pending.pop(content[len(self.tag):], None)
+                        if sent_at != None:
+                            self._record("latencies", received_at - sent_at)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                if not connected:
+                    raise
+                if self.verbose:
+                    log(f"Websocket connection failed: {e}")
+            # probes sent while disconnected can't be received, they are counted as lost when they time out
+            self._connected.clear()
+            self.disconnects += 1
+            if self.verbose:
+                log(f"Reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, reconnect_max_delay)
+
+    async def _send(self) -> None:
+        """
+        Function to send one probe.
+        """
+        number = str(self._sequence)
+        self._sequence += 1
+        self._pending[number] = time.perf_counter()
+        try:
+            await asyncio.to_thread(
+                self.client.request,
+                "POST",
+                "channel",
+                self.channel_id,
+                "send-message",
+                data = {"content": f"{self.tag}{number}"}
+            )
+        except api.APIError as e:
+            self._pending.pop(number, None)
+            self._record("errors")
+            if self.verbose:
+                log(f"Could not send probe {number}: {e.message}")
+        else:
+            self._record("sent")
+
+    def _expire(self, now: float) -> None:
+        """
+        Function to count probes that took longer than the timeout as lost.
+        """
+        for number, sent_at in list(self._pending.items()):
+            if now - sent_at >= self.timeout:
+                del self._pending[number]
+                self._record("lost")
+
+    async def run(self, duration: float = None, report_every: float = 10, on_report = None) -> dict:
+        """
+        Function to send probes until `duration` seconds have passed, or forever.
+
+        Args:
+            duration (float, optional): seconds to send probes for, None to run until cancelled. Defaults to None.
+            report_every (float, optional): seconds between calls to on_report. Defaults to 10.
+            on_report (Callable, optional): called with summary(window=True) every `report_every` seconds. Defaults to None.
+
+        Returns:
+            dict: summary() of the whole run
+        """
+        self._connected = asyncio.Event()
+        receiver = asyncio.create_task(self._receive())
+        connected = asyncio.create_task(self._connected.wait())
+        sends = set()
+        try:
+            # look the channel up while connecting, which fails early if it doesn't exist
+            # and opens the connection to the API so the first probe doesn't pay for it
+            await asyncio.to_thread(self.client.request, "GET", "channel", self.channel_id)
+            # the first probe is only sent once the channel is open, so connecting doesn't count as latency
+            await asyncio.wait([connected, receiver], return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                receiver.result()
+            started = time.perf_counter()
+            self._total = self._new_window()
+            self._window = self._new_window()
+            next_probe = started
+            next_report = started + report_every
+            reported = False
+            while duration == None or next_probe < started + duration:
+                await asyncio.sleep(max(0, next_probe - time.perf_counter()))
+                # probes are sent at a fixed interval even if the API is slower than that
+                task = asyncio.create_task(self._send())
+                sends.add(task)
+                task.add_done_callback(sends.discard)
+                next_probe += self.interval
+                self._expire(time.perf_counter())
+                if on_report != None and time.perf_counter() >= next_report:
+                    on_report(self.summary(window=True))
+                    self._window = self._new_window()
+                    next_report += report_every
+                    reported = True
+
+            # wait for the last probes
+            await asyncio.gather(*sends)
+            deadline = time.perf_counter() + self.timeout
+            while self._pending and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            self._expire(float("inf"))
+            # a run shorter than one report only gets the summary of the whole run
+            if on_report != None and reported and (self._window["sent"] or self._window["errors"]):
+                on_report(self.summary(window=True))
+        finally:
+            for task in [receiver, connected, *sends]:
+                task.cancel()
+            await asyncio.gather(receiver, connected, *sends, return_exceptions=True)
+        return self.summary()
@@ -0,0 +1,204 @@
+import sys
+import json
+import time
+from datetime import datetime
+
+__all__ = [
+    "Renderer"
+]
+
+# strftime directives that change more often than once a minute
+_second_directives = ("%S", "%f", "%X", "%T", "%c", "%s", "%r")
+
+class Renderer:
+    """
+    Collects received messages and writes them to the terminal in batches.
+
+    In the "text" format messages are shown for people to read. In the "ndjson"
+    format every message payload is written as one compact JSON object per line,
+    with no timestamps or grouping, for other programs to read.
+
+    Output is flushed when more than `buffer_size` characters are waiting or
+    when no message arrived for `flush_interval` seconds. Timestamps are
+    formatted once per distinct minute (or second, if the time format shows
+    seconds) and sender headers once per sender.
+
+    Args:
+        time_format (str): time format
+        tagged (bool, optional): whether to prefix messages with their channel name or not. Defaults to False.
+        verbose (bool, optional): whether to show more output or not, writes every message at once if True. Defaults to False.
+        buffer_size (int, optional): characters to collect before writing. Defaults to 16384.
+        flush_interval (float, optional): seconds to wait for more messages before writing. Defaults to 0.05.
+        stream (TextIO, optional): where to write to. Defaults to sys.stdout.
+        format (str, optional): "text" or "ndjson". Defaults to "text".
+        auto_flush (bool, optional): whether to flush when the buffer is full or the interval passed,
+            if False the owner calls drain() or flush() itself. Defaults to True.
+    """
+    def __init__(
+        self,
+        time_format: str,
+        tagged: bool = False,
+        verbose: bool = False,
+        buffer_size: int = 16384,
+        flush_interval: float = 0.05,
+        stream = None,
+        format: str = "text",
+        auto_flush: bool = True
+    ):
+        self.time_format = time_format
+        self.tagged = tagged
+        self.verbose = verbose
+        self.buffer_size = 0 if verbose else buffer_size
+        self.flush_interval = flush_interval
+        self.stream = stream
+        self.format = format
+        self.auto_flush = auto_flush
+        self.last_message = None
+
+        self._buffer = []
+        self._buffered = 0
+        self._timer = None
+        self._headers = {}
+        self._granularity = 1 if any(x in time_format for x in _second_directives) else 60
+        self._time_key = None
+        self._timestamp = ""
+
+    def timestamp(self) -> str:
+        """
+        Function to get the current time in the time format, reusing the last
+        result while it can't have changed.
+
+        Returns:
+            str: formatted time
+        """
+        key = int(time.time() // self._granularity)
+        if key != self._time_key:
+            self._time_key = key
+            self._timestamp = datetime.now().strftime(self.time_format)
+        return self._timestamp
+
+    def header(self, sender: dict) -> str:
+        """
+        Function to get the `username.tag` header of a sender.
+
+        Args:
+            sender (dict): sender of a message
+
+        Returns:
+            str: the header
+        """
+        key = (sender["id"], sender["username"], sender["tag"])
+        header = self._headers.get(key)
+        if header == None:
+            header = self._headers[key] = f"{sender['username']}.{sender['tag']}"
+        return header
+
+    def message(self, message: dict, channel_id=None, channel_name: str = None) -> None:
+        """
+        Function to add a received message to the output.
+        Messages from the same sender in the same channel are grouped under one header.
+
+        Args:
+            message (dict): message payload received from the websocket
+            channel_id (Any, optional): id of the channel the message was sent in. Defaults to None.
+            channel_name (str, optional): name of that channel, shown if tagged is True. Defaults to None.
+        """
+        if self.format == "ndjson":
+            if channel_id != None and "channel" not in message and "channelId" not in message:
+                message = dict(message, channel=channel_id)
+            self.write(json.dumps(message, separators=(",", ":"), ensure_ascii=False) + "\n")
+            return
+
+        sender = message["sender"]
+        prefix = f"[{channel_name}] " if self.tagged else ""
+        group = (channel_id, sender["id"])
+        if self.last_message == group and not self.verbose:
+            text = f"{prefix}{self.timestamp()} > {message['content']}\n"
+        else:
+            text = f"\n{prefix}{self.header(sender)} at {self.timestamp()}\n> {message['content']}\n"
+        self.last_message = group
+        self.write(text)
+
+    def summary(self, count: int, sender: dict, seconds: float, channel_id=None, channel_name: str = None) -> None:
+        """
+        Function to add a line standing in for messages that weren't shown one by one.
+
+        Args:
+            count (int): number of messages
+            sender (dict): sender of the messages
+            seconds (float): time between the first and last of them
+            channel_id (Any, optional): id of the channel they were sent in. Defaults to None.
+            channel_name (str, optional): name of that channel, shown if tagged is True. Defaults to None.
+        """
+        prefix = f"[{channel_name}] " if self.tagged else ""
+        self.last_message = None
+        self.write(f"\n{prefix}{count} messages from {self.header(sender)} in {seconds:.1f}s at {self.timestamp()}\n")
+
+    def buffered(self) -> int:
+        """
+        Function to get the number of characters waiting to be written.
+
+        Returns:
+            int: characters waiting
+        """
+        return self._buffered
+
+    def write(self, text: str) -> None:
+        """
+        Function to add text to the output.
+
+        Args:
+            text (str): text to write
+        """
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if not self.auto_flush:
+            return
+        if self._buffered >= self.buffer_size:
+            self.flush()
+        elif self._timer == None:
+            import asyncio
+
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+            else:
+                self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        """
+        Function to write everything collected so far.
+        Call this before printing anything else so the output stays in order.
+        """
+        if self._timer != None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            stream = self.stream or sys.stdout
+            stream.write("".join(self._buffer))
+            stream.flush()
+            self._buffer = []
+            self._buffered = 0
+
+    async def drain(self) -> None:
+        """
+        Function to write everything collected so far from a thread, so a slow
+        terminal doesn't stop the event loop. Text added while writing is kept
+        for the next call.
+        """
+        import asyncio
+
+        if self._timer != None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            text = "".join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            stream = self.stream or sys.stdout
+
+            def write() -> None:
+                stream.write(text)
+                stream.flush()
+            await asyncio.to_thread(write)
@@ -22,21 +22,23 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import time
+# taken before anything else is imported so --profile can show how long importing took
+_started = time.perf_counter()
+
 import os
+import re
 import sys
 import json
-import asyncio
 import argparse
-import maskpass
-import requests
-import websockets
 from . import (
     __title__,
     __display_version__,
-    config
+    api,
+    config,
+    utils
 )
 from .utils import *
-from yarl import URL
 from datetime import datetime
 if os.name == "nt":
     try:
@@ -49,8 +51,7 @@ if os.name == "nt":
         readline = Readline()
 else:
     import readline
-
-config.check()
+_imported = time.perf_counter()
 
 # Create the parser
 parser = argparse.ArgumentParser(
@@ -58,6 +59,8 @@ parser = argparse.ArgumentParser(
     description = "Use Ahuri from the command line!",
     epilog = f"""subcommands:
   account  manage your account
+  agent    run a background agent that speeds up commands
+  bench    simulate many clients on a channel to measure the server
   channel  create, get or delete channels
   config   view or edit config variables
 
@@ -67,187 +70,283 @@ Config file located at {config.config}""",
 )
 subparser = parser.add_subparsers(help="subcommands")
 
-# Checking some config values
-api_url = config.get("api_url")
-if api_url == None:
-    warn("No 'api_url' found in config file.")
-elif api_url == "":
-    warn("'api_url' not set in config. This may cause errors.")
-else:
-    api_url = URL(api_url)
+def new_client(api_url: str, token: str = None, verbose: bool = False) -> api.Client:
+    """
+    Function to create an API client using the timeouts and retries set in the config file.
 
-token = config.get("user")
-if token == None:
-    warn("No 'user' found in config file. Please log in to fix this.")
-else:
-    token = token.get("token")
-    if token == None:
-        warn("Not logged in. This may cause errors.")
-    elif type(token) != str:
-        warn("Invalid token, Log in to fix this.")
+    Args:
+        api_url (str): api url
+        token (str, optional): token of the user. Defaults to None.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+
+    Returns:
+        api.Client: the client
+    """
+    from . import agent
+
+    # send requests through the agent if it is running
+    if agent.supported and os.path.exists(agent.socket_path):
+        client = agent.AgentClient
     else:
-        # Re-adding user details to config
-        headers = {
-            "Authorization": token
-        }
-        
-        try:
-            response = requests.get(
-                api_url/"account",
-                headers = headers
-            )
-        except:
-            warn("Failed to fetch user details.")
-        else:
-            try:
-                rjson = response.json()
-            except ValueError:
-                is_json = False
-                has_message = False
-            else:
-                is_json = True
-                if "message" in rjson:
-                    has_message = True
-
-            if response.status_code == 200:
-                if is_json:
-                    user_details = rjson["payload"]
-                    config.set("user", user_details)
-                else:
-                    warn(f"Invalid response text received from {response.url} while fetching user details.")
-            else:
-                if has_message:
-                    warn(f"Invalid status code returned while fetching user details. ({response.status_code})\n{response.status_code}: {rjson['message']}")
-                else:
-                    warn(f"Invalid status code returned while fetching user details. ({response.status_code})")
+        client = api.Client
+    return client(
+        api_url,
+        token,
+        connect_timeout = config.get("connect_timeout", 3.05),
+        read_timeout = config.get("read_timeout", 30),
+        retries = config.get("retries", 3),
+        verbose = verbose
+    )
 
-# websocket code for connecting to a channel
-async def listen(
-    token: str,
-    id: str,
-    api_url: URL,
-    ws_url: str,
-    time_format: str,
-    verbose: bool = False
-) -> None:
+def get_client(subcommand: argparse.ArgumentParser, verbose: bool = False, auth: bool = True) -> api.Client:
     """
-    Websockets code for connecting to a channel
+    Function to create an API client from the config file.
+    Exits with an error from the subcommand if the config is missing something.
 
     Args:
-        token (str): token of the user
-        id (str): the channel id of the channel to connect to
-        api_url (URL): api url
-        ws_url (str): websocket url
-        time_format (str): time format
+        subcommand (argparse.ArgumentParser): parser of the subcommand that is used
         verbose (bool, optional): whether to show more output or not. Defaults to False.
+        auth (bool, optional): whether the user has to be logged in or not. Defaults to True.
+
+    Returns:
+        api.Client: the client
     """
-    last_message = ""
+    api_url = config.get("api_url", verbose=verbose)
+    if api_url == None:
+        subcommand.error("No 'api_url' found in config file.")
 
-    headers = {
-        "Authorization": token
-    }
+    token = None
+    if auth:
+        token = config.get("user", verbose=verbose)
+        if token == None:
+            subcommand.error("No 'user' found in config file. Please log in to fix this.")
+        else:
+            token = token.get("token")
+            if token == None:
+                subcommand.error("Not logged in. Please log in.")
+            elif type(token) != str:
+                subcommand.error("Invalid token, Log in again to fix this.")
 
-    if verbose:
-        log(f"Sending GET request to API\nAPI URL: {api_url}")
-    
-    info(f"Getting channel from ID '{id}'...")
+    return new_client(api_url, token, verbose=verbose)
 
-    response = requests.get(
-        api_url/"channel"/id,
-        headers = headers
-    )
+def api_error(subcommand: argparse.ArgumentParser, error: api.APIError) -> None:
+    """
+    Function to show an API error and exit with an error from the subcommand.
 
-    try:
+    Args:
+        subcommand (argparse.ArgumentParser): parser of the subcommand that is used
+        error (api.APIError): the error
+    """
+    if error.expected != None:
+        winfo(f"An error occured! Request did not return status code {error.expected}.")
+        if error.has_message:
+            print(f"Status code: {error.status_code}")
+        else:
+            print(f"Status code: {error.status_code}\nResponse text: {error.text}")
+    subcommand.error(error.message)
+
+def config_number(variable: str, default: float) -> float:
+    """
+    Function to get a number from the config file.
+    Numbers set with the config subcommand are saved as strings, so those are accepted too.
+
+    Args:
+        variable (str): variable name to get
+        default (float): value returned if the variable is missing or not a number
+
+    Returns:
+        float: the number
+    """
+    value = config.get(variable, default)
+    if type(value) == str:
+        try:
+            value = float(value)
+        except ValueError:
+            return default
+    return value if type(value) in (int, float) else default
+
+# Seconds to wait before fetching the user details again after it failed
+user_retry = 300
+
+def refresh_user(verbose: bool = False) -> None:
+    """
+    Function to re-fetch the logged in user's details and save them to the config file.
+    Does nothing if they were fetched less than 'user_ttl' seconds ago,
+    or if fetching them failed less than `user_retry` seconds ago.
+
+    Args:
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+    """
+    user_ttl = config_number("user_ttl", 3600)
+    refreshed_at = config.get("user_refreshed_at", 0)
+    if type(refreshed_at) not in (int, float):
+        refreshed_at = 0
+    age = time.time() - refreshed_at
+    if 0 <= age < user_ttl:
         if verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
+            log(f"User details fetched {int(age)}s ago, skipping refresh")
+        return
+    failed_at = config.get("user_refresh_failed_at", 0)
+    if type(failed_at) in (int, float) and 0 <= time.time() - failed_at < user_retry:
         if verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
+            log(f"Fetching user details failed {int(time.time() - failed_at)}s ago, skipping refresh")
+        return
+
+    api_url = config.get("api_url")
+    if api_url == None or api_url == "":
+        return
+    token = config.get("user", {})
+    if type(token) != dict:
+        return
+    token = token.get("token")
+    if type(token) != str:
+        return
 
     if verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-        else:
-            log(f"Response Text:\n{response.text}")
-
-    if response.status_code == 200:
-        if is_json:
-            channel = rjson["payload"]
+        log("Refreshing user details")
+    started = time.perf_counter()
+    client = new_client(api_url, token, verbose=verbose)
+    # don't hold up the command for long if the API is slow
+    client.timeout = (client.timeout[0], min(client.timeout[1], 5))
+    client.retries = 0
+    try:
+        user_details = client.request("GET", "account")
+    except api.APIError as e:
+        if e.expected != None:
+            warn(f"Invalid status code returned while fetching user details. ({e.status_code})")
         else:
-            channel_connect.error(f"Invalid response text received from {response.url}.")
+            warn(f"Failed to fetch user details. {e.message}")
+        # while the API is down, don't make every command wait for it first
+        config.update({"user_refresh_failed_at": time.time()}, verbose=verbose)
     else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            channel_connect.error(f"{response.status_code}: {rjson['message']}")
+        config.update({
+            "user": user_details,
+            "user_refreshed_at": time.time()
+        }, verbose=verbose)
+        if verbose:
+            log(f"Refreshed user details in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+def read_ids(ids: list, file: str = None) -> list:
+    """
+    Function to collect ids given as arguments and in a file.
+    The file has one id per line, blank lines and lines starting with # are skipped.
+
+    Args:
+        ids (list): ids given as arguments
+        file (str, optional): path of the file to read, - to read stdin. Defaults to None.
+
+    Returns:
+        list: ids without duplicates, in the order they were given
+    """
+    ids = [id.strip() for id in ids]
+    if file != None:
+        if file == "-":
+            lines = sys.stdin.read().splitlines()
         else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            channel_connect.error(f"Status code {response.status_code} returned.")    
-    
-    if verbose:
-        log(f"Establishing connection to websocket server at {ws_url}")
-    info(f"Connecting to channel '{channel['name']}'...")
+            with open(file, "r") as idfile:
+                lines = idfile.read().splitlines()
+        ids += [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+    return list(dict.fromkeys(id for id in ids if id))
+
+def channel_cache(client: api.Client, no_cache: bool = False, verbose: bool = False):
+    """
+    Function to open the channel details cache of the client's API url and the logged in user
+    with the TTL set in the config file.
+
+    Args:
+        client (api.Client): API client of the user
+        no_cache (bool, optional): whether to fetch fresh details instead of using cached ones. Defaults to False.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+
+    Returns:
+        cache.ChannelCache: the cache
+    """
+    from .cache import ChannelCache
+
+    user = config.get("user")
+    if type(user) == dict and user.get("id") == None:
+        # the cache is kept per user, so the user's id is needed
+        refresh_user(verbose=verbose)
+        user = config.get("user")
+    return ChannelCache(
+        str(client.api_url),
+        user.get("id") if type(user) == dict else None,
+        ttl = config_number("channel_ttl", 300),
+        enabled = not no_cache,
+        verbose = verbose
+    )
+
+def channel_details(channel: dict) -> str:
+    """
+    Function to format the details of a channel.
+
+    Args:
+        channel (dict): the channel
+
+    Returns:
+        str: the details
+    """
+    return f"\nChannel Details\nName: {channel['name']}\nID: {channel['id']}\nCreated at: {channel['createdAt']} UTC\nOwner: {channel['owner']['username']}.{channel['owner']['tag']} ({channel['owner']['id']})"
+
+def channel_bulk(func, ids: list, output: str = "table", concurrency: int = 8, verbose: bool = False) -> int:
+    """
+    Function to call func on many channel ids at the same time and print every result as soon as it is ready.
+    A failed id is reported and doesn't stop the others.
+
+    Args:
+        func (Callable): function called with every id, returns the channel or raises api.APIError
+        ids (list): ids of the channels
+        output (str, optional): "table", "ndjson" (one JSON object per line) or "text". Defaults to "table".
+        concurrency (int, optional): requests to send at the same time. Defaults to 8.
+        verbose (bool, optional): whether to show more output or not. Defaults to False.
+
+    Returns:
+        int: number of ids that failed or weren't done
+    """
+    from .bulk import imap
+
+    width = max(len("ID"), *[len(id) for id in ids])
+    if output == "table":
+        print(f"{'ID':<{width}}  {'NAME':<24}  {'OWNER':<24}  CREATED AT")
+
+    done = 0
+    failed = 0
+    started = time.perf_counter()
     try:
-        async with websockets.connect(ws_url) as ws:
-            if verbose:
-                log("Connection established!")
-                log("Authorizing connection...")
-            await ws.send(json.dumps({
-                "command": "authorize",
-                "arguments": {
-                    "token": token
-                }
-            }))
-            if verbose:
-                log("Authorized connection!")
-                log("Opening channel...")
-            await ws.send(json.dumps({
-                "command": "open channel",
-                "arguments": {
-                    "id": id
-                }
-            }))
-            if verbose:
-                log("Opened channel!")
-
-            info("Success!")
-            info(f"You are now connected to channel '{channel['name']}' owned by {channel['owner']['username']}.{channel['owner']['tag']}")
-            while True:
-                msg = await ws.recv()
-                msgtime = datetime.now()
-                time = datetime.strftime(msgtime, time_format)
-                wsr = json.loads(msg)
-                if verbose:
-                    log(f"Message received from server: {msg}")
-                    if "message" in wsr:
-                        log(wsr["message"])
-
-                if "payload" == None:
-                    print()
-                    if "message" in wsr:
-                        winfo(f"Invalid websocket response returned. Message: {wsr['message']}")
-                    else:
-                        winfo(f"Invalid websocket response returned. Websocket response:\n{json.dumps(wsr, indent=2)}")
-                    winfo("Exiting.")
-                    sys.exit()
-
-                message = wsr["payload"]
-                sender = message["sender"]
-                if last_message == sender["id"] and not verbose:
-                    print(f"{time} > {message['content']}")
+        for id, channel, error in imap(func, ids, concurrency, ordered=False):
+            if error != None and not isinstance(error, api.APIError):
+                raise error
+            done += 1
+            if error != None:
+                failed += 1
+            if output == "ndjson":
+                if error == None:
+                    record = {"id": id, "ok": True, "channel": channel}
                 else:
-                    print()
-                    print(f"{message['sender']['username']}.{message['sender']['tag']} at {time}\n> {message['content']}")
-                last_message = sender["id"]
+                    record = {"id": id, "ok": False, "error": error.message, "status_code": error.status_code}
+                print(json.dumps(record), flush=True)
+            elif output == "table":
+                if error == None:
+                    owner = f"{channel['owner']['username']}.{channel['owner']['tag']}"
+                    print(f"{id:<{width}}  {channel['name'][:24]:<24}  {owner[:24]:<24}  {channel['createdAt']}", flush=True)
+                else:
+                    print(f"{id:<{width}}  error: {error.message}", flush=True)
+            else:
+                if error == None:
+                    print(channel_details(channel), flush=True)
+                else:
+                    print(f"\n{id}: {error.message}", flush=True)
     except KeyboardInterrupt:
-        winfo("Keyboard Interrupt sent. Exiting.")
+        if output != "ndjson":
+            winfo("Keyboard Interrupt sent. Stopping.")
+    elapsed = time.perf_counter() - started
+
+    summary = f"Done {done} of {len(ids)} in {elapsed:.2f}s, {failed} failed."
+    if output != "ndjson":
+        info(summary)
+    elif verbose:
+        log(summary)
+    return failed + len(ids) - done
 
 # Add functions that run after subcommands are used
 def mainfunc(args: argparse.Namespace) -> None:
@@ -283,68 +382,14 @@ def account_deletefunc(args: argparse.Namespace) -> None:
         winfo("Invalid input, cancelled.")
         sys.exit()
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        account_delete.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        account_delete.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            account_delete.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            account_delete.error("Invalid token, Log in again to fix this.")
-    
-    headers = {
-        "Authorization": token
-    }
-
-    if args.verbose:
-        log(f"Sending DELETE request to API\nAPI URL: {api_url}")
-    response = requests.delete(
-        api_url/"account",
-        headers = headers
-    )
-
+    client = get_client(account_delete, verbose=args.verbose)
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
+        user_details = client.request("DELETE", "account")
+    except api.APIError as e:
+        api_error(account_delete, e)
 
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-        else:
-            log(f"Response Text:\n{response.text}")
-
-    if response.status_code == 200:
-        if is_json:
-            user_details = rjson["payload"]
-            config.set("user", {"token": None})
-            print(f"Deleted your account!\n\nAccount Details\nUsername: {user_details['username']}.{user_details['tag']}\nID: {user_details['id']}\nEmail: {user_details['email']}\nCreated at: {user_details['createdAt']} UTC")
-        else:
-            account_delete.error(f"Invalid response text received from {response.url} while fetching user details.")
-    else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            account_delete.error(f"{response.status_code}: {rjson['message']}")
-        else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            account_delete.error(f"Status code {response.status_code} returned.")
+    config.set("user", {"token": None})
+    print(f"Deleted your account!\n\nAccount Details\nUsername: {user_details['username']}.{user_details['tag']}\nID: {user_details['id']}\nEmail: {user_details['email']}\nCreated at: {user_details['createdAt']} UTC")
 
 def account_infofunc(args: argparse.Namespace) -> None:
     """
@@ -353,67 +398,17 @@ def account_infofunc(args: argparse.Namespace) -> None:
     Args:
         args (argparse.Namespace)
     """
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        account_info.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
-    token = config.get("user")
-    if token == None:
-        account_info.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            account_info.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            account_info.error("Invalid token, Log in to fix this.")
-    
-    headers = {
-        "Authorization": token
-    }
-
-    if args.verbose:
-        log(f"Sending GET request to API\nAPI URL: {api_url}")
-    response = requests.get(
-        api_url/"account",
-        headers = headers
-    )
-    
+    client = get_client(account_info, verbose=args.verbose)
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
-    
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-        else:
-            log(f"Response Text:\n{response.text}")
-    if response.status_code == 200:
-        if is_json:
-            user_details = rjson["payload"]
-            config.set("user", user_details, verbose=args.verbose)
-            print(f"Account Details\nUsername: {user_details['username']}.{user_details['tag']}\nID: {user_details['id']}\nEmail: {user_details['email']}\nCreated at: {user_details['createdAt']} UTC")
-        else:
-            account_info.error(f"Invalid response text received from {response.url} while fetching user details.")
-    else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            account_info.error(f"{response.status_code}: {rjson['message']}")
-        else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            account_info.error(f"Status code {response.status_code} returned.")
+        user_details = client.request("GET", "account")
+    except api.APIError as e:
+        api_error(account_info, e)
+
+    config.update({
+        "user": user_details,
+        "user_refreshed_at": time.time()
+    }, verbose=args.verbose)
+    print(f"Account Details\nUsername: {user_details['username']}.{user_details['tag']}\nID: {user_details['id']}\nEmail: {user_details['email']}\nCreated at: {user_details['createdAt']} UTC")
 
 def account_loginfunc(args: argparse.Namespace) -> None:
     """
@@ -422,65 +417,31 @@ def account_loginfunc(args: argparse.Namespace) -> None:
     Args:
         args (argparse.Namespace)
     """
+    import maskpass
+
     email = args.email.strip()
     password = maskpass.askpass(
         prompt = f"Enter password for {email}: ",
         mask = "*"
     ).strip()
-    
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        account_login.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
+
+    client = get_client(account_login, verbose=args.verbose, auth=False)
     data = {
         "email": email,
         "password": password
     }
 
-    if args.verbose:
-        log(f"Sending POST request to API\nAPI URL: {api_url}\nJSON Data: {json.dumps(data, indent=2)}")
     info("Logging in...")
-    response = requests.post(
-        api_url/"auth"/"login",
-        json = data
-    )
-
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
-    
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-        else:
-            log(f"Response Text:\n{response.text}")
-    if response.status_code == 200:
-        if is_json:
-            user_details = rjson["payload"]
-            config.set("user", user_details, verbose=args.verbose)
-            info(f"Logged in as {user_details['username']}.{user_details['tag']} successfully!")
-        else:
-            account_login.error(f"Invalid response text received from {response.url}.")
-    else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            account_login.error(f"{response.status_code}: {rjson['message']}")
-        else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            account_login.error(f"Status code {response.status_code} returned.")
+        user_details = client.request("POST", "auth", "login", data=data, auth=False)
+    except api.APIError as e:
+        api_error(account_login, e)
+
+    config.update({
+        "user": user_details,
+        "user_refreshed_at": time.time()
+    }, verbose=args.verbose)
+    info(f"Logged in as {user_details['username']}.{user_details['tag']} successfully!")
 
 def account_registerfunc(args: argparse.Namespace) -> None:
     """
@@ -495,337 +456,731 @@ def account_registerfunc(args: argparse.Namespace) -> None:
     confirm_password = input(f"Confirm your password: ").strip()
 
     if password == confirm_password:
-        api_url = config.get("api_url", verbose=args.verbose)
-        if api_url == None:
-            account_register.error("No 'api_url' found in config file.")
-        else:
-            api_url = URL(api_url)
-        
+        client = get_client(account_register, verbose=args.verbose, auth=False)
         data = {
             "email": email,
             "username": username,
             "password": password
         }
 
-        if args.verbose:
-            log(f"Sending POST request to API\nAPI URL: {api_url}\nJSON Data: {json.dumps(data, indent=2)}")
         info("Registering account...")
-        response = requests.post(
-            api_url/"auth"/"register",
-            json = data
-        )
-
         try:
-            if args.verbose:
-                log("Converting JSON response to python dictionary")
-            rjson = response.json()
-        except ValueError:
-            if args.verbose:
-                log("err: No JSON in response")
-            is_json = False
-            has_message = False
-        else:
-            is_json = True
-            if "message" in rjson:
-                has_message = True
-        
-        if args.verbose:
-            if is_json:
-                log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-            else:
-                log(f"Response Text:\n{response.text}")
-
-        if response.status_code == 201:
-            if is_json:
-                user_details = rjson["payload"]
-                config.set("user", user_details, verbose=args.verbose)
-                info("Registered an account successfully!")
-                print(f"\nAccount Details\nEmail: {email}\nUsername: {user_details['username']}.{user_details['tag']}")
-            else:
-                account_register.error(f"Invalid response text received from {response.url}.")
-        else:
-            winfo("An error occured! Request did not return status code 201.")
-            if has_message:
-                print(f"Status code: {response.status_code}")
-                account_register.error(f"{response.status_code}: {rjson['message']}")
-            else:
-                print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-                account_register.error(f"Status code {response.status_code} returned.")
+            user_details = client.request("POST", "auth", "register", data=data, expected=201, auth=False)
+        except api.APIError as e:
+            api_error(account_register, e)
+
+        config.update({
+            "user": user_details,
+            "user_refreshed_at": time.time()
+        }, verbose=args.verbose)
+        info("Registered an account successfully!")
+        print(f"\nAccount Details\nEmail: {email}\nUsername: {user_details['username']}.{user_details['tag']}")
     else:
         account_register.error("Passwords do not match.")
 
-def channel_connectfunc(args: argparse.Namespace) -> None:
+def agent_startfunc(args: argparse.Namespace) -> None:
     """
-    Function that executes when create subcommand of channel subcommand is used.
+    Function that executes when start subcommand of agent subcommand is used.
 
     Args:
         args (argparse.Namespace)
     """
-    id = args.id.strip()
+    from . import agent
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        channel_connect.error("No 'api_url' found in config file.")
+    if not agent.supported:
+        agent_start.error("The agent is not supported on this platform.")
+    try:
+        status = agent.call({"command": "status"}, timeout=1)
+    except OSError:
+        pass
     else:
-        api_url = URL(api_url)
-    
-    ws_url = config.get("ws_url", verbose=args.verbose)
-    if ws_url == None:
-        channel_connect.error("No 'ws_url' found in config file.")
-    elif type(ws_url) != str:
-        channel_connect.error("Invalid format. Please reset config file to fix this.")
-
-    time_format = config.get("time_format", verbose=args.verbose)
-    if time_format == None:
-        channel_connect.error("No 'time_format' found in config file.")
-    elif type(time_format) != str:
-        channel_connect.error("Invalid format. Please reset config file to fix this.")
+        agent_start.error(f"Agent is already running (pid {status['pid']}).")
 
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        channel_connect.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            channel_connect.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            channel_connect.error("Invalid token, Log in again to fix this.")
+    if args.foreground:
+        agent.serve(verbose=args.verbose)
+        return
 
+    info("Starting agent...")
     try:
-        asyncio.get_event_loop().run_until_complete(listen(token, id, api_url, ws_url, time_format, args.verbose))
-    except KeyboardInterrupt:
-        winfo("Keyboard Interrupt sent. Exiting")
+        pid = agent.start()
+    except TimeoutError as e:
+        agent_start.error(str(e))
+    info(f"Agent started (pid {pid}). Commands will now be sent through it.")
 
-def channel_createfunc(args: argparse.Namespace) -> None:
+def agent_statusfunc(args: argparse.Namespace) -> None:
     """
-    Function that executes when create subcommand of channel subcommand is used.
+    Function that executes when status subcommand of agent subcommand is used.
 
     Args:
         args (argparse.Namespace)
     """
-    name = args.name.strip()
+    from . import agent
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        channel_create.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        channel_create.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            channel_create.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            channel_create.error("Invalid token, Log in again to fix this.")
-    
-    data = {
-        "channelName": name
-    }
-    headers = {
-        "Authorization": token
-    }
+    if not agent.supported:
+        agent_status.error("The agent is not supported on this platform.")
+    try:
+        status = agent.call({"command": "status"}, timeout=1)
+    except OSError:
+        info("Agent is not running.")
+        return
+    print(f"Agent Status\nPID: {status['pid']}\nUptime: {status['uptime']:.0f}s\nRequests served: {status['requests']}\nSocket: {agent.socket_path}")
 
-    if args.verbose:
-        log(f"Sending POST request to API\nAPI URL: {api_url}\nJSON Data: {json.dumps(data, indent=2)}")
-    info("Creating channel...")
-    response = requests.post(
-        api_url/"channel",
-        json = data,
-        headers = headers
-    )
+def agent_stopfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when stop subcommand of agent subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    from . import agent
 
+    if not agent.supported:
+        agent_stop.error("The agent is not supported on this platform.")
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
+        agent.stop()
+    except OSError:
+        if os.path.exists(agent.socket_path):
+            # left behind by an agent that didn't exit cleanly
+            os.remove(agent.socket_path)
+        agent_stop.error("Agent is not running.")
+    info("Agent stopped.")
+
+def benchfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when bench subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    import asyncio
+    from . import bench as _bench
+
+    if args.listeners < 0 or args.senders < 1 or args.connect_concurrency < 1:
+        bench.error("--listeners can't be negative, --senders and --connect-concurrency must be at least 1.")
+    if args.rate <= 0 or args.duration <= 0 or args.drain < 0:
+        bench.error("--rate and --duration must be more than 0 and --drain can't be negative.")
+    # let every sender keep its own connection open
+    api.pool_maxsize = max(api.pool_maxsize, args.senders)
+
+    if args.token != None:
+        api_url = args.api_url or config.get("api_url", verbose=args.verbose)
+        if api_url == None:
+            bench.error("No 'api_url' found in config file.")
+        client = new_client(api_url, args.token, verbose=args.verbose)
     else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
+        client = get_client(bench, verbose=args.verbose)
+        if args.api_url != None:
+            client = new_client(args.api_url, client.token, verbose=args.verbose)
 
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
+    ws_url = args.ws_url or config.get("ws_url", verbose=args.verbose)
+    if ws_url == None:
+        bench.error("No 'ws_url' found in config file.")
+    elif type(ws_url) != str:
+        bench.error("Invalid format. Please reset config file to fix this.")
+
+    total = int(args.rate * args.duration)
+    if not args.yes:
+        sure_inp = input(f"This sends about {total} {'message' if total == 1 else 'messages'} to channel '{args.id}' at {client.api_url} and opens {args.listeners} websocket {'connection' if args.listeners == 1 else 'connections'} to {ws_url}.\n>> Continue? Yes/No: ").strip().lower()
+        if sure_inp == "yes" or sure_inp == "y":
+            pass
+        elif sure_inp == "no" or sure_inp == "n":
+            info("Operation Cancelled.")
+            sys.exit()
         else:
-            log(f"Response Text:\n{response.text}")
+            winfo("Invalid input, cancelled.")
+            sys.exit()
 
-    if response.status_code == 201:
-        if is_json:
-            channel = rjson["payload"]
-            info("Created channel successfully!")
-            print(f"\nChannel Details\nName: {channel['name']}\nID: {channel['id']}")
-        else:
-            channel_create.error(f"Invalid response text received from {response.url}.")
+    def progress(seconds: float, sent: int, received: int) -> None:
+        # stderr, so the results can be read by other programs
+        print(f"\r{seconds:5.1f}s  {sent} sent, {received} received", end="", file=sys.stderr, flush=True)
+
+    try:
+        results = asyncio.run(_bench.run(
+            client,
+            args.id,
+            ws_url,
+            listeners = args.listeners,
+            senders = args.senders,
+            rate = args.rate,
+            duration = args.duration,
+            drain = args.drain,
+            connect_concurrency = args.connect_concurrency,
+            progress = progress if args.output == "text" and sys.stderr.isatty() else None,
+            verbose = args.verbose
+        ))
+    except KeyboardInterrupt:
+        winfo("Keyboard Interrupt sent. Exiting")
+        sys.exit(1)
+    if args.output == "text" and sys.stderr.isatty():
+        print(file=sys.stderr)
+
+    if args.output == "json":
+        print(json.dumps(results, indent=2))
     else:
-        winfo("An error occured! Request did not return status code 201.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            channel_create.error(f"{response.status_code}: {rjson['message']}")
-        else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            channel_create.error(f"Status code {response.status_code} returned.")
+        print(_bench.report(results))
+    if results["senders"]["sent"] == 0 or results["listeners"]["connected"] == 0:
+        sys.exit(1)
 
-def channel_deletefunc(args: argparse.Namespace) -> None:
+def channel_applyfunc(args: argparse.Namespace) -> None:
     """
-    Function that executes when delete subcommand of channel subcommand is used.
+    Function that executes when apply subcommand of channel subcommand is used.
 
     Args:
         args (argparse.Namespace)
     """
-    sure_inp = input("Are you sure you want to delete the channel?\nYour messages will be entirely deleted.\nYou can not recover your messages after deleting the channel.\n>> Yes/No: ").strip().lower()
-    if sure_inp == "yes" or sure_inp == "y":
-        pass
-    elif sure_inp == "no" or sure_inp == "n":
-        print("Operation Cancelled.")
-        sys.exit()
-    else:
-        print("Invalid input, cancelled.")
-        sys.exit()
+    from . import apply
 
-    id = args.id.strip()
+    if args.concurrency < 1:
+        channel_apply.error("--concurrency must be at least 1.")
+    if args.retries < 0:
+        channel_apply.error("--retries can't be negative.")
+    state_path = args.state or f"{os.path.splitext(args.manifest)[0]}.state.json"
+    try:
+        names = apply.load_manifest(args.manifest)
+        state = apply.load_state(state_path)
+    except OSError as e:
+        channel_apply.error(f"Could not read '{e.filename}': {e.strerror}")
+    except ValueError as e:
+        channel_apply.error(f"Invalid manifest or state file: {e}")
+    api.pool_maxsize = max(api.pool_maxsize, args.concurrency)
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        channel_delete.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        channel_delete.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            channel_delete.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            channel_delete.error("Invalid token, Log in again to fix this.")
-    
-    headers = {
-        "Authorization": token
-    }
+    client = get_client(channel_apply, verbose=args.verbose)
 
-    if args.verbose:
-        log(f"Sending DELETE request to API\nAPI URL: {api_url}")
-    info("Deleting channel...")
-    response = requests.delete(
-        api_url/"channel"/id,
-        headers = headers
-    )
+    cache = channel_cache(client, no_cache=args.no_cache, verbose=args.verbose)
 
+    info("Comparing manifest with existing channels...")
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
-
+        changes = apply.plan(client, cache, names, state, concurrency=args.concurrency)
+    except api.APIError as e:
+        cache.save()
+        api_error(channel_apply, e)
     if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
+        log(cache.stats())
+
+    print("\nPlan")
+    for name in changes["create"]:
+        print(f"  + {name}")
+    for name, id in changes["delete"].items():
+        print(f"  - {name} ({id})")
+    print(f"{len(changes['create'])} to create, {len(changes['delete'])} to delete, {len(changes['keep'])} unchanged.\n")
+
+    if not changes["create"] and not changes["delete"]:
+        cache.save()
+        info("Nothing to do.")
+        return
+    if args.dry_run:
+        cache.save()
+        return
+    if changes["delete"] and not args.yes:
+        sure_inp = input(f"Are you sure you want to delete {len(changes['delete'])} {'channel' if len(changes['delete']) == 1 else 'channels'}?\nTheir messages will be entirely deleted.\n>> Yes/No: ").strip().lower()
+        if sure_inp != "yes" and sure_inp != "y":
+            cache.save()
+            winfo("Operation Cancelled.")
+            sys.exit()
+
+    def progress(action: str, name: str, result, error) -> None:
+        if error != None:
+            winfo(f"Failed to {action} '{name}': {error.message}")
+        elif action == "create":
+            print(f"  created {name} ({result['id']})")
         else:
-            log(f"Response Text:\n{response.text}")
+            print(f"  deleted {name}")
 
-    if response.status_code == 200:
-        info("Deleted channel successfully!")
-        if is_json:
-            channel = rjson["payload"]
-            print(f"\nChannel Details\nName: {channel['name']}\nID: {channel['id']}\nCreated at: {channel['createdAt']} UTC\nOwner: {channel['owner']['username']}.{channel['owner']['tag']} ({channel['owner']['id']})")
-        else:
-            channel_delete.error(f"Invalid response text received from {response.url}.")
-    else:
-        if has_message:
-            print(f"An error occured! Request did not return status code 200.\nStatus code: {response.status_code}")
-            channel_delete.error(f"{response.status_code}: {rjson['message']}")
-        else:
-            print(f"An error occured! Request did not return status code 200.\nStatus code: {response.status_code}\nResponse text: {response.text}")
-            channel_delete.error(f"Status code {response.status_code} returned.")
+    info("Applying changes...")
+    started = time.perf_counter()
+    failed = {}
+    try:
+        failed = apply.apply(
+            client,
+            cache,
+            changes,
+            state,
+            concurrency = args.concurrency,
+            retries = args.retries,
+            progress = progress
+        )
+    except KeyboardInterrupt:
+        winfo("Keyboard Interrupt sent. Saving what was applied so far.")
+        failed = None
+    finally:
+        # channels created so far must be recorded even if the run stopped early
+        apply.save_state(state_path, state)
+        cache.save()
+    elapsed = time.perf_counter() - started
+
+    if failed == None:
+        sys.exit(1)
+    done = len(changes["create"]) + len(changes["delete"]) - len(failed)
+    info(f"Applied {done} {'change' if done == 1 else 'changes'} in {elapsed:.2f}s, {len(failed)} failed. State saved to {state_path}")
+    if failed:
+        sys.exit(1)
 
-def channel_infofunc(args: argparse.Namespace) -> None:
+def channel_connectfunc(args: argparse.Namespace) -> None:
     """
-    Function that executes when get subcommand of channel subcommand is used.
+    Function that executes when connect subcommand of channel subcommand is used.
 
     Args:
         args (argparse.Namespace)
     """
-    id = args.id.strip()
+    import asyncio
+    from .listener import listen
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        channel_info.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        channel_info.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            channel_info.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            channel_info.error("Invalid token, Log in again to fix this.")
-    
-    headers = {
-        "Authorization": token
-    }
+    if args.format != "text":
+        # stdout only has the messages, so warnings and logs go to stderr
+        utils.stream = sys.stderr
+    try:
+        ids = read_ids(args.id, args.file)
+    except OSError as e:
+        channel_connect.error(f"Could not read ids from '{args.file}': {e.strerror}")
+    if ids == []:
+        channel_connect.error("Specify the id of at least one channel to connect to.")
+    if args.queue_size < 1 or args.coalesce_at < 0:
+        channel_connect.error("--queue-size must be at least 1 and --coalesce-at can't be negative.")
+    if args.metrics_interval <= 0:
+        channel_connect.error("--metrics-interval must be more than 0.")
+
+    hooks = None
+    if args.exec or args.hook:
+        from . import hooks as _hooks
+
+        if args.hook_workers < 1 or args.hook_queue < 1:
+            channel_connect.error("--hook-workers and --hook-queue must be at least 1.")
+        try:
+            functions = [_hooks.exec_hook(command) for command in args.exec]
+            functions += [_hooks.load_hook(spec) for spec in args.hook]
+        except (ImportError, ValueError) as e:
+            channel_connect.error(f"Could not load hook: {e}")
+
+        def hook_error(hook, message: dict, error: Exception) -> None:
+            winfo(f"Hook '{hook.__name__}' failed on message {message.get('id')}: {error}")
+
+        hooks = _hooks.HookQueue(
+            functions,
+            workers = args.hook_workers,
+            size = args.hook_queue,
+            overflow = args.overflow,
+            on_error = hook_error
+        )
 
-    if args.verbose:
-        log(f"Sending GET request to API\nAPI URL: {api_url}")
-    info("Getting channel details...")
-    response = requests.get(
-        api_url/"channel"/id,
-        headers = headers
-    )
+    from .filters import compile_filter
 
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
+        accept = compile_filter(args.senders, args.match, args.exclude, channels=ids)
+    except re.error as e:
+        channel_connect.error(f"Invalid regex: {e}")
 
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
+    client = get_client(channel_connect, verbose=args.verbose)
+
+    ws_url = config.get("ws_url", verbose=args.verbose)
+    if ws_url == None:
+        channel_connect.error("No 'ws_url' found in config file.")
+    elif type(ws_url) != str:
+        channel_connect.error("Invalid format. Please reset config file to fix this.")
+
+    time_format = config.get("time_format", verbose=args.verbose)
+    if time_format == None:
+        channel_connect.error("No 'time_format' found in config file.")
+    elif type(time_format) != str:
+        channel_connect.error("Invalid format. Please reset config file to fix this.")
+
+    cache = channel_cache(client, no_cache=args.no_cache, verbose=args.verbose)
+
+    writer = None
+    if args.metrics_file != None:
+        from .metrics import PrometheusWriter
+
+        writer = PrometheusWriter(args.metrics_file, interval=args.metrics_interval)
+        writer.start()
+        if writer.error != None:
+            channel_connect.error(f"Could not write metrics to '{args.metrics_file}': {writer.error.strerror}")
+
+    archive = None
+    if args.archive or config.get("archive", False) == True:
+        from .archive import Archive
+
+        archive = Archive()
+        if args.verbose:
+            log(f"Saving received messages to {archive.path}")
+
+    try:
+        asyncio.run(listen(
+            client,
+            ids,
+            ws_url,
+            time_format,
+            mute = [id.strip() for id in args.mute],
+            reconnect = not args.no_reconnect,
+            archive = archive,
+            cache = cache,
+            hooks = hooks,
+            accept = accept,
+            output = args.format,
+            queue_size = args.queue_size,
+            coalesce_at = args.coalesce_at,
+            verbose = args.verbose
+        ))
+    except api.APIError as e:
+        api_error(channel_connect, e)
+    except OSError as e:
+        channel_connect.error(f"Could not connect to websocket server at {ws_url}: {e}")
+    except KeyboardInterrupt:
+        if args.format == "text":
+            winfo("Keyboard Interrupt sent. Exiting")
+    finally:
+        cache.save()
+        if archive != None:
+            archive.close()
+        if writer != None:
+            writer.stop()
+        if hooks != None:
+            info(hooks.report())
+        if args.verbose:
+            log(cache.stats())
+
+def channel_createfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when create subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    name = args.name.strip()
+
+    client = get_client(channel_create, verbose=args.verbose)
+
+    data = {
+        "channelName": name
+    }
+
+    info("Creating channel...")
+    try:
+        channel = client.request("POST", "channel", data=data, expected=201)
+    except api.APIError as e:
+        api_error(channel_create, e)
+
+    info("Created channel successfully!")
+    print(f"\nChannel Details\nName: {channel['name']}\nID: {channel['id']}")
+
+def channel_deletefunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when delete subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    try:
+        ids = read_ids(args.id, args.file)
+    except OSError as e:
+        channel_delete.error(f"Could not read ids from '{args.file}': {e.strerror}")
+    if ids == []:
+        channel_delete.error("Specify the id of at least one channel to delete.")
+    if args.concurrency < 1:
+        channel_delete.error("--concurrency must be at least 1.")
+    # let every worker keep its own connection open
+    api.pool_maxsize = max(api.pool_maxsize, args.concurrency)
+    if args.file == "-" and not args.yes:
+        channel_delete.error("Use --yes to confirm deleting channels read from stdin.")
+
+    if not args.yes:
+        what = "the channel" if len(ids) == 1 else f"{len(ids)} channels"
+        sure_inp = input(f"Are you sure you want to delete {what}?\nYour messages will be entirely deleted.\nYou can not recover your messages after deleting the channel.\n>> Yes/No: ").strip().lower()
+        if sure_inp == "yes" or sure_inp == "y":
+            pass
+        elif sure_inp == "no" or sure_inp == "n":
+            winfo("Operation Cancelled.")
+            sys.exit()
         else:
-            log(f"Response Text:\n{response.text}")
+            winfo("Invalid input, cancelled.")
+            sys.exit()
+
+    client = get_client(channel_delete, verbose=args.verbose)
+
+    cache = channel_cache(client, verbose=args.verbose)
+
+    def delete(id: str) -> dict:
+        channel = client.request("DELETE", "channel", id)
+        cache.forget(id)
+        return channel
 
-    if response.status_code == 200:
-        if is_json:
-            channel = rjson["payload"]
-            print(f"\nChannel Details\nName: {channel['name']}\nID: {channel['id']}\nCreated at: {channel['createdAt']} UTC\nOwner: {channel['owner']['username']}.{channel['owner']['tag']} ({channel['owner']['id']})")
+    if len(ids) == 1 and args.output == None:
+        info("Deleting channel...")
+        try:
+            channel = delete(ids[0])
+        except api.APIError as e:
+            api_error(channel_delete, e)
+        cache.save()
+
+        info("Deleted channel successfully!")
+        print(channel_details(channel))
+        return
+
+    if args.output != "ndjson":
+        info(f"Deleting {len(ids)} channels...")
+    try:
+        failed = channel_bulk(delete, ids, args.output or "table", args.concurrency, verbose=args.verbose)
+    finally:
+        cache.save()
+    if failed:
+        sys.exit(1)
+
+def print_archived(messages: list, time_format: str, tagged: bool = False) -> None:
+    """
+    Function to print archived messages, grouping messages from the same sender.
+
+    Args:
+        messages (list): rows from the archive
+        time_format (str): time format
+        tagged (bool, optional): whether to prefix messages with their channel id or not. Defaults to False.
+    """
+    last_message = None
+    for message in messages:
+        prefix = f"[{message['channel']}] " if tagged else ""
+        timestamp = datetime.fromtimestamp(message["time"]).strftime(f"%Y-%m-%d {time_format}")
+        if last_message == (message["channel"], message["sender_id"]):
+            print(f"{prefix}{timestamp} > {message['content']}")
         else:
-            channel_info.error(f"Invalid response text received from {response.url}.")
-    else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            channel_info.error(f"{response.status_code}: {rjson['message']}")
+            print()
+            print(f"{prefix}{message['sender']} at {timestamp}\n> {message['content']}")
+        last_message = (message["channel"], message["sender_id"])
+
+def channel_historyfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when history subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    from .archive import (
+        archive_path,
+        parse_time,
+        Archive
+    )
+
+    time_format = config.get("time_format", verbose=args.verbose)
+    if time_format == None:
+        channel_history.error("No 'time_format' found in config file.")
+    elif type(time_format) != str:
+        channel_history.error("Invalid format. Please reset config file to fix this.")
+
+    since = until = None
+    try:
+        if args.since != None:
+            since = parse_time(args.since)
+        if args.until != None:
+            until = parse_time(args.until)
+    except ValueError as e:
+        channel_history.error(f"Invalid time: {e}")
+
+    if not os.path.exists(archive_path):
+        channel_history.error("No messages archived yet. Use `channel connect --archive` or set 'archive' to true in the config file.")
+
+    started = time.perf_counter()
+    archive = Archive()
+    try:
+        messages = archive.history(
+            channel = args.id.strip() if args.id != None else None,
+            sender = args.sender.strip() if args.sender != None else None,
+            since = since,
+            until = until,
+            limit = args.number
+        )
+    finally:
+        archive.close()
+    if args.verbose:
+        log(f"Found {len(messages)} messages in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    print_archived(messages, time_format, tagged=args.id == None)
+
+def channel_infofunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when get subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    try:
+        ids = read_ids(args.id, args.file)
+    except OSError as e:
+        channel_info.error(f"Could not read ids from '{args.file}': {e.strerror}")
+    if ids == []:
+        channel_info.error("Specify the id of at least one channel to get info about.")
+    if args.concurrency < 1:
+        channel_info.error("--concurrency must be at least 1.")
+    # let every worker keep its own connection open
+    api.pool_maxsize = max(api.pool_maxsize, args.concurrency)
+
+    client = get_client(channel_info, verbose=args.verbose)
+
+    cache = channel_cache(client, no_cache=args.no_cache, verbose=args.verbose)
+
+    if len(ids) == 1 and args.output == None:
+        info("Getting channel details...")
+        try:
+            channel = cache.channel(client, ids[0])
+        except api.APIError as e:
+            api_error(channel_info, e)
+        cache.save()
+        if args.verbose:
+            log(cache.stats())
+
+        print(channel_details(channel))
+        return
+
+    if args.output != "ndjson":
+        info(f"Getting details of {len(ids)} channels...")
+    try:
+        failed = channel_bulk(lambda id: cache.channel(client, id), ids, args.output or "table", args.concurrency, verbose=args.verbose)
+    finally:
+        cache.save()
+        if args.verbose:
+            log(cache.stats())
+    if failed:
+        sys.exit(1)
+
+def channel_probefunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when probe subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    import asyncio
+    from .probe import Probe
+
+    if args.interval <= 0 or args.timeout <= 0 or args.report_every <= 0:
+        channel_probe.error("--interval, --timeout and --report-every must be more than 0.")
+    if args.duration != None and args.duration <= 0:
+        channel_probe.error("--duration must be more than 0.")
+
+    client = get_client(channel_probe, verbose=args.verbose)
+
+    ws_url = config.get("ws_url", verbose=args.verbose)
+    if ws_url == None:
+        channel_probe.error("No 'ws_url' found in config file.")
+    elif type(ws_url) != str:
+        channel_probe.error("Invalid format. Please reset config file to fix this.")
+
+    def latency(value) -> str:
+        return f"{value:.1f}ms" if value != None else "-"
+
+    def show(summary: dict, label: str) -> None:
+        if args.output == "ndjson":
+            print(json.dumps(dict(summary, type=label), separators=(",", ":")), flush=True)
         else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            channel_info.error(f"Status code {response.status_code} returned.")
+            print(
+                f"{datetime.fromtimestamp(summary['time']).strftime('%H:%M:%S')}  {label:<7}"
+                + f" {summary['received']}/{summary['sent'] + summary['errors']} received, {summary['loss'] * 100:.1f}% lost,"
+                + f" p50 {latency(summary['p50'])}, p95 {latency(summary['p95'])}, p99 {latency(summary['p99'])},"
+                + f" max {latency(summary['max'])}, jitter {latency(summary['jitter'])}",
+                flush = True
+            )
+
+    probe = Probe(
+        client,
+        args.id,
+        ws_url,
+        interval = args.interval,
+        timeout = args.timeout,
+        verbose = args.verbose
+    )
+    if args.output == "text":
+        info(f"Probing channel '{args.id}' every {args.interval:g}s{f' for {args.duration:g}s' if args.duration != None else ', press Ctrl+C to stop'}...")
+    try:
+        summary = asyncio.run(probe.run(
+            duration = args.duration,
+            report_every = args.report_every,
+            on_report = lambda summary: show(summary, "window")
+        ))
+    except api.APIError as e:
+        api_error(channel_probe, e)
+    except OSError as e:
+        channel_probe.error(f"Could not connect to websocket server at {ws_url}: {e}")
+    except KeyboardInterrupt:
+        summary = probe.summary()
+    show(summary, "total")
+
+    failed = []
+    if args.fail_loss != None and summary["loss"] * 100 > args.fail_loss:
+        failed.append(f"loss {summary['loss'] * 100:.1f}% is over {args.fail_loss:g}%")
+    if args.fail_p99 != None and (summary["p99"] == None or summary["p99"] > args.fail_p99):
+        failed.append(f"p99 {latency(summary['p99'])} is over {args.fail_p99:g}ms")
+    if failed:
+        print(f"<!> Probe failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+def channel_searchfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when search subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    import sqlite3
+    from .archive import (
+        archive_path,
+        parse_time,
+        Archive
+    )
+
+    time_format = config.get("time_format", verbose=args.verbose)
+    if time_format == None:
+        channel_search.error("No 'time_format' found in config file.")
+    elif type(time_format) != str:
+        channel_search.error("Invalid format. Please reset config file to fix this.")
+
+    since = until = None
+    try:
+        if args.since != None:
+            since = parse_time(args.since)
+        if args.until != None:
+            until = parse_time(args.until)
+    except ValueError as e:
+        channel_search.error(f"Invalid time: {e}")
+
+    if not os.path.exists(archive_path):
+        channel_search.error("No messages archived yet. Use `channel connect --archive` or set 'archive' to true in the config file.")
+
+    started = time.perf_counter()
+    archive = Archive()
+    try:
+        messages = archive.search(
+            " ".join(args.query),
+            channel = args.channel.strip() if args.channel != None else None,
+            since = since,
+            until = until,
+            limit = args.number,
+            order = args.sort
+        )
+    except sqlite3.OperationalError as e:
+        channel_search.error(f"Search failed: {e}")
+    finally:
+        archive.close()
+    if args.verbose:
+        log(f"Found {len(messages)} messages in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    if messages == []:
+        info("No messages found.")
+    print_archived(messages, time_format, tagged=args.channel == None)
+
+def read_messages(file: str):
+    """
+    Function to read messages from a file one line at a time, skipping empty lines.
+
+    Args:
+        file (str): path of the file, - to read stdin
+
+    Yields:
+        tuple: (line number, message)
+    """
+    messagefile = sys.stdin if file == "-" else open(file, "r")
+    try:
+        for number, line in enumerate(messagefile, start=1):
+            line = line.rstrip("\r\n")
+            if line.strip():
+                yield (number, line)
+    finally:
+        if messagefile != sys.stdin:
+            messagefile.close()
 
 def channel_sendfunc(args: argparse.Namespace) -> None:
     """
@@ -835,83 +1190,133 @@ def channel_sendfunc(args: argparse.Namespace) -> None:
         args (argparse.Namespace)
     """
     id = args.id.strip()
-    content = args.message.strip()
+    if args.message == None and args.file == None:
+        channel_send.error("Specify a message to send with -m or a file of messages with -f.")
+    if args.concurrency < 1:
+        channel_send.error("--concurrency must be at least 1.")
+
+    client = get_client(channel_send, verbose=args.verbose)
 
-    api_url = config.get("api_url", verbose=args.verbose)
-    if api_url == None:
-        channel_send.error("No 'api_url' found in config file.")
-    else:
-        api_url = URL(api_url)
-    
     time_format = config.get("time_format")
     if time_format == None:
         channel_send.error("No 'time_format' found in config file.")
     elif type(time_format) != str:
         channel_send.error("Invalid format. Please reset config file to fix this.")
-    
-    token = config.get("user", verbose=args.verbose)
-    if token == None:
-        channel_send.error("No 'user' found in config file. Please log in to fix this.")
-    else:
-        token = token.get("token")
-        if token == None:
-            channel_send.error("Not logged in. Please log in.")
-        elif type(token) != str:
-            channel_send.error("Invalid token, Log in again to fix this.")
-    
+
+    if args.file != None:
+        channel_send_bulk(args, client, id)
+        return
+
     data = {
-        "content": content
-    }
-    headers = {
-        "Authorization": token
+        "content": args.message.strip()
     }
 
-    if args.verbose:
-        log(f"Sending POST request to API\nAPI URL: {api_url}\nJSON Data: {json.dumps(data, indent=2)}")
     info("Sending message...")
-    response = requests.post(
-        api_url/"channel"/id/"send-message",
-        json = data,
-        headers = headers
-    )
+    try:
+        message = client.request("POST", "channel", id, "send-message", data=data)
+    except api.APIError as e:
+        api_error(channel_send, e)
     msgtime = datetime.now()
     msgtime = msgtime.strftime(time_format)
 
+    info("Sent!")
+    print(f"Message preview:\n{message['sender']['username']}.{message['sender']['tag']} at {msgtime}\n> {message['content']}")
+
+def channel_send_bulk(args: argparse.Namespace, client: api.Client, id: str) -> None:
+    """
+    Function to send every line of a file or stdin as a message to a channel.
+
+    Args:
+        args (argparse.Namespace)
+        client (api.Client): API client of the user
+        id (str): id of the channel
+    """
+    from .bulk import imap
+
+    def send(line: tuple):
+        return client.request("POST", "channel", id, "send-message", data={"content": line[1].strip()})
+
+    if args.file != "-" and not os.path.isfile(args.file):
+        channel_send.error(f"No such file: '{args.file}'")
+
+    info("Sending messages...")
+    sent = 0
+    failed = 0
+    started = time.perf_counter()
     try:
-        if args.verbose:
-            log("Converting JSON response to python dictionary")
-        rjson = response.json()
-    except ValueError:
-        if args.verbose:
-            log("err: No JSON in response")
-        is_json = False
-        has_message = False
-    else:
-        is_json = True
-        if "message" in rjson:
-            has_message = True
+        for (number, content), message, error in imap(send, read_messages(args.file), args.concurrency, args.rate):
+            if error == None:
+                sent += 1
+                if args.verbose:
+                    log(f"Sent line {number}")
+            else:
+                failed += 1
+                winfo(f"Failed to send line {number}: {getattr(error, 'message', error)}")
+    except KeyboardInterrupt:
+        winfo("Keyboard Interrupt sent. Stopping.")
+    elapsed = time.perf_counter() - started
 
-    if args.verbose:
-        if is_json:
-            log(f"JSON Response:\n{json.dumps(rjson, indent=2)}")
-        else:
-            log(f"Response Text:\n{response.text}")
+    info(f"Sent {sent} {'message' if sent == 1 else 'messages'} in {elapsed:.2f}s ({sent / elapsed if elapsed else 0:.1f} messages/s), {failed} failed.")
+    if failed:
+        sys.exit(1)
 
-    if response.status_code == 200:
-        if is_json:
-            message = rjson["payload"]
-            info("Sent!")
-            print(f"Message preview:\n{message['sender']['username']}.{message['sender']['tag']} at {msgtime}\n> {message['content']}")
-        else:
-            channel_send.error(f"Invalid response text received from {response.url}.")
-    else:
-        winfo("An error occured! Request did not return status code 200.")
-        if has_message:
-            print(f"Status code: {response.status_code}")
-            channel_send.error(f"{response.status_code}: {rjson['message']}")
+def channel_syncfunc(args: argparse.Namespace) -> None:
+    """
+    Function that executes when sync subcommand of channel subcommand is used.
+
+    Args:
+        args (argparse.Namespace)
+    """
+    from .archive import Archive
+    from .sync import sync
+
+    try:
+        ids = read_ids(args.id, args.file)
+    except OSError as e:
+        channel_sync.error(f"Could not read ids from '{args.file}': {e.strerror}")
+    if ids == []:
+        channel_sync.error("Specify the id of at least one channel to sync.")
+    if args.page_size < 1 or args.jobs < 1:
+        channel_sync.error("--page-size and --jobs must be at least 1.")
+
+    client = get_client(channel_sync, verbose=args.verbose)
+
+    def progress(id: str, received: int, added: int) -> None:
+        if args.verbose:
+            log(f"{id}: received {received} messages, {added} new")
+
+    info(f"Syncing {len(ids)} {'channel' if len(ids) == 1 else 'channels'}...")
+    started = time.perf_counter()
+    archive = Archive()
+    try:
+        results = sync(
+            client,
+            archive,
+            ids,
+            page_size = args.page_size,
+            jobs = args.jobs,
+            full = args.full,
+            progress = progress
+        )
+    except KeyboardInterrupt:
+        winfo("Keyboard Interrupt sent. Messages synced so far were saved.")
+        sys.exit()
+    finally:
+        archive.close()
+    elapsed = time.perf_counter() - started
+
+    failed = 0
+    total = 0
+    for id, result in results.items():
+        if isinstance(result, api.APIError):
+            failed += 1
+            winfo(f"{id}: {result.message}")
         else:
-            print(f"Status code: {response.status_code}\nResponse text: {response.text}")
-            channel_send.error(f"Status code {response.status_code} returned.")
+            total += result
+            print(f"{id}: {result} new {'message' if result == 1 else 'messages'}")
+    info(f"Synced {total} new {'message' if total == 1 else 'messages'} in {elapsed:.2f}s, {failed} {'channel' if failed == 1 else 'channels'} failed.")
+    if failed:
+        sys.exit(1)
 
 def configfunc(args: argparse.Namespace) -> None:
     """
@@ -935,6 +1340,21 @@ parser.add_argument(
     action = "store_true",
     help = "display the version and exit"
 )
+parser.add_argument(
+    "--stats",
+    action = "store_true",
+    help = "show request latencies, status codes, retries and websocket throughput when the command exits"
+)
+parser.add_argument(
+    "--profile",
+    action = "store_true",
+    help = "show how long each phase of the command took when it exits: importing, loading the config, building the parser, every HTTP request split into connect, time to first byte and body, and the websocket handshake, authorize and open channel"
+)
+parser.add_argument(
+    "--profile-output",
+    metavar = "FILE",
+    help = "also write the profile to FILE, as a Chrome trace (for chrome://tracing or ui.perfetto.dev) if it ends in .json, as cProfile stats (for pstats or snakeviz) otherwise. Implies --profile"
+)
 parser.set_defaults(func=mainfunc)
 
 # account subcommand
@@ -1021,35 +1441,373 @@ account_register.add_argument(
 )
 account_register.set_defaults(func=account_registerfunc)
 
+# agent subcommand
+agent = subparser.add_parser(
+    "agent",
+    prog = "agent",
+    description = "run a background agent that keeps connections to the API open, other commands send their requests through it while it is running",
+    epilog = """subcommands:
+  start   start the agent
+  status  show whether the agent is running
+  stop    stop the agent
+""",
+    allow_abbrev = False,
+    formatter_class = argparse.RawDescriptionHelpFormatter
+)
+agent_subparser = agent.add_subparsers(help="subcommands")
+
+# start subcommand of agent subcommand
+agent_start = agent_subparser.add_parser(
+    "start",
+    prog = "start",
+    description = "start the agent",
+    allow_abbrev = False
+)
+agent_start.add_argument(
+    "--foreground",
+    action = "store_true",
+    help = "run the agent in this process instead of in the background"
+)
+agent_start.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+agent_start.set_defaults(func=agent_startfunc)
+
+# status subcommand of agent subcommand
+agent_status = agent_subparser.add_parser(
+    "status",
+    prog = "status",
+    description = "show whether the agent is running",
+    allow_abbrev = False
+)
+agent_status.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+agent_status.set_defaults(func=agent_statusfunc)
+
+# stop subcommand of agent subcommand
+agent_stop = agent_subparser.add_parser(
+    "stop",
+    prog = "stop",
+    description = "stop the agent",
+    allow_abbrev = False
+)
+agent_stop.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+agent_stop.set_defaults(func=agent_stopfunc)
+
+# bench subcommand
+bench = subparser.add_parser(
+    "bench",
+    prog = "bench",
+    description = "simulate many clients on a channel to see how the server copes: listeners connect to the websocket server and open the channel, senders send messages to it at a steady rate, and the time each message takes to reach each listener is measured. Works against a real server or benchmarks/standin.py",
+    epilog = "every message sent is a real message in the channel, use a channel made for benchmarking",
+    allow_abbrev = False
+)
+bench.add_argument(
+    "id",
+    action = "store",
+    type = str,
+    help = "id of channel to send messages to"
+)
+bench.add_argument(
+    "-l", "--listeners",
+    action = "store",
+    type = int,
+    default = 10,
+    help = "websocket connections receiving the messages (default: 10)"
+)
+bench.add_argument(
+    "-s", "--senders",
+    action = "store",
+    type = int,
+    default = 1,
+    help = "messages being sent at the same time, raise it if the send rate falls short of --rate (default: 1)"
+)
+bench.add_argument(
+    "-r", "--rate",
+    action = "store",
+    type = float,
+    default = 10,
+    help = "messages to send per second, across all senders (default: 10)"
+)
+bench.add_argument(
+    "-d", "--duration",
+    action = "store",
+    type = float,
+    default = 10,
+    help = "seconds to send messages for (default: 10)"
+)
+bench.add_argument(
+    "--drain",
+    action = "store",
+    type = float,
+    default = 5,
+    help = "seconds to wait for messages still on their way after the last one is sent (default: 5)"
+)
+bench.add_argument(
+    "--connect-concurrency",
+    action = "store",
+    type = int,
+    default = 50,
+    help = "listeners connecting at the same time (default: 50)"
+)
+bench.add_argument(
+    "--api-url",
+    action = "store",
+    type = str,
+    help = "api url to use instead of the one in the config file"
+)
+bench.add_argument(
+    "--ws-url",
+    action = "store",
+    type = str,
+    help = "websocket url to use instead of the one in the config file"
+)
+bench.add_argument(
+    "--token",
+    action = "store",
+    type = str,
+    help = "token to use instead of the logged in user's"
+)
+bench.add_argument(
+    "-o", "--output",
+    choices = ("text", "json"),
+    default = "text",
+    help = "show the results for people or as JSON (default: text)"
+)
+bench.add_argument(
+    "-y", "--yes",
+    action = "store_true",
+    help = "don't ask for confirmation"
+)
+bench.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+bench.set_defaults(func=benchfunc)
+
 # channel subcommand
 channel = subparser.add_parser(
     "channel",
     prog = "channel",
     description = "create, get or delete channels",
     epilog = """subcommands:
-  connect  connect to a channel
+  apply    create and delete channels to match a manifest
+  connect  connect to channels
   create   create channels
   delete   delete channels
+  history  show archived messages
   info     get info about channels
+  probe    measure how long messages take to arrive
+  search   search archived messages
   send     send a message to a channel
+  sync     download new messages into the local archive
 """,
     allow_abbrev = False,
     formatter_class = argparse.RawDescriptionHelpFormatter
 )
 channel_subparser = channel.add_subparsers(help="subcommands")
 
+# apply subcommmand of channel subcommand
+channel_apply = channel_subparser.add_parser(
+    "apply",
+    prog = "apply",
+    description = "create and delete channels to match a manifest, a JSON file like {\"channels\": [\"general\", \"random\"]}",
+    epilog = "Ids of the channels created are kept in a state file next to the manifest. Channels removed from the manifest are deleted, channels not created by apply are never touched.",
+    allow_abbrev = False
+)
+channel_apply.add_argument(
+    "manifest",
+    action = "store",
+    type = str,
+    help = "path of the manifest"
+)
+channel_apply.add_argument(
+    "-s", "--state",
+    action = "store",
+    type = str,
+    help = "path of the state file (default: <manifest>.state.json)"
+)
+channel_apply.add_argument(
+    "-n", "--dry-run",
+    action = "store_true",
+    help = "only show what would change"
+)
+channel_apply.add_argument(
+    "-c", "--concurrency",
+    action = "store",
+    type = int,
+    default = 8,
+    help = "requests to send at the same time (default: 8)"
+)
+channel_apply.add_argument(
+    "--retries",
+    action = "store",
+    type = int,
+    default = 3,
+    help = "times to retry a failed change (default: 3)"
+)
+channel_apply.add_argument(
+    "--no-cache",
+    action = "store_true",
+    help = "check that channels still exist with the API instead of trusting cached details"
+)
+channel_apply.add_argument(
+    "-y", "--yes",
+    action = "store_true",
+    help = "don't ask for confirmation before deleting channels"
+)
+channel_apply.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+channel_apply.set_defaults(func=channel_applyfunc)
+
 # connect subcommmand of channel subcommand
 channel_connect = channel_subparser.add_parser(
     "connect",
     prog = "connect",
-    description = "connect to a channel",
+    description = "connect to one or more channels",
     allow_abbrev = False
 )
 channel_connect.add_argument(
     "id",
     action = "store",
     type = str,
-    help = "id of channel"
+    nargs = "*",
+    help = "ids of channels"
+)
+channel_connect.add_argument(
+    "-f", "--file",
+    action = "store",
+    type = str,
+    help = "file with one channel id per line, - to read from stdin"
+)
+channel_connect.add_argument(
+    "--mute",
+    action = "append",
+    type = str,
+    default = [],
+    metavar = "ID",
+    help = "don't show messages from this channel, can be used more than once"
+)
+channel_connect.add_argument(
+    "--archive",
+    action = "store_true",
+    help = "save received messages to the local archive, see `channel history`"
+)
+channel_connect.add_argument(
+    "--no-reconnect",
+    action = "store_true",
+    help = "exit instead of reconnecting when the connection drops"
+)
+channel_connect.add_argument(
+    "--from",
+    action = "append",
+    default = [],
+    dest = "senders",
+    metavar = "SENDER",
+    help = "only show messages from this sender, as username.tag or id, or as ID:SENDER in channel ID only (can be used more than once)"
+)
+channel_connect.add_argument(
+    "--match",
+    action = "append",
+    default = [],
+    metavar = "REGEX",
+    help = "only show messages whose content matches this regex, use (?i) to ignore case, or ID:REGEX to match in channel ID only (can be used more than once)"
+)
+channel_connect.add_argument(
+    "--exclude",
+    action = "append",
+    default = [],
+    metavar = "REGEX",
+    help = "don't show messages whose content matches this regex, or ID:REGEX to exclude in channel ID only (can be used more than once)"
+)
+channel_connect.add_argument(
+    "--exec",
+    action = "append",
+    default = [],
+    metavar = "CMD",
+    help = "run a shell command for every message, it gets the message as JSON on stdin and AHURI_CHANNEL_ID, AHURI_MESSAGE_ID, AHURI_SENDER and AHURI_CONTENT in its environment (can be used more than once)"
+)
+channel_connect.add_argument(
+    "--hook",
+    action = "append",
+    default = [],
+    metavar = "MODULE:FUNCTION",
+    help = "call a Python function with (message, channel id) for every message (can be used more than once)"
+)
+channel_connect.add_argument(
+    "--hook-workers",
+    action = "store",
+    type = int,
+    default = 4,
+    help = "messages to run hooks on at the same time (default: 4)"
+)
+channel_connect.add_argument(
+    "--hook-queue",
+    action = "store",
+    type = int,
+    default = 1000,
+    help = "messages that can wait for hooks (default: 1000)"
+)
+channel_connect.add_argument(
+    "--overflow",
+    action = "store",
+    choices = ["spill", "drop-oldest", "block"],
+    default = "spill",
+    help = "what to do when the hook queue is full: spill writes messages to disk until there is room, drop-oldest drops the oldest waiting message, block waits for room and stops receiving messages until the hooks catch up (default: spill)"
+)
+channel_connect.add_argument(
+    "--format",
+    action = "store",
+    choices = ["text", "ndjson"],
+    default = "text",
+    help = "text to show messages, ndjson to write every message as one JSON object per line and nothing else (default: text)"
+)
+channel_connect.add_argument(
+    "--queue-size",
+    action = "store",
+    type = int,
+    default = 10000,
+    help = "received messages that can wait to be shown, the oldest are left out of the text output when more arrive, ndjson output waits for room instead. Messages are still archived and handed to hooks (default: 10000)"
+)
+channel_connect.add_argument(
+    "--coalesce-at",
+    action = "store",
+    type = int,
+    default = 1000,
+    help = "when this many messages are waiting to be shown, show each sender's messages as one summary line, 0 to never (default: 1000)"
+)
+channel_connect.add_argument(
+    "--metrics-file",
+    action = "store",
+    type = str,
+    metavar = "PATH",
+    help = "keep writing metrics to this file in the Prometheus text format, for node_exporter's textfile collector (name it *.prom)"
+)
+channel_connect.add_argument(
+    "--metrics-interval",
+    action = "store",
+    type = float,
+    default = 15,
+    metavar = "SECONDS",
+    help = "seconds between writes of --metrics-file (default: 15)"
+)
+channel_connect.add_argument(
+    "--no-cache",
+    action = "store_true",
+    help = "fetch channel details from the API instead of using cached ones"
 )
 channel_connect.add_argument(
     "-v", "--verbose",
@@ -1089,7 +1847,32 @@ channel_delete.add_argument(
     "id",
     action = "store",
     type = str,
-    help = "id of channel to delete"
+    nargs = "*",
+    help = "ids of channels to delete"
+)
+channel_delete.add_argument(
+    "-f", "--file",
+    action = "store",
+    type = str,
+    help = "file with one channel id per line, - to read from stdin"
+)
+channel_delete.add_argument(
+    "-c", "--concurrency",
+    action = "store",
+    type = int,
+    default = 8,
+    help = "requests to send at the same time (default: 8)"
+)
+channel_delete.add_argument(
+    "-o", "--output",
+    action = "store",
+    choices = ["text", "table", "ndjson"],
+    help = "how to print results: text, table or ndjson (one JSON object per line) (default: text for one channel, table for more)"
+)
+channel_delete.add_argument(
+    "-y", "--yes",
+    action = "store_true",
+    help = "don't ask for confirmation"
 )
 channel_delete.add_argument(
     "-v", "--verbose",
@@ -1098,6 +1881,53 @@ channel_delete.add_argument(
 )
 channel_delete.set_defaults(func=channel_deletefunc)
 
+# history subcommmand of channel subcommand
+channel_history = channel_subparser.add_parser(
+    "history",
+    prog = "history",
+    description = "show archived messages",
+    epilog = "times can be ISO dates or times like 2022-10-01 or 2022-10-01T12:00, or durations before now like 30m, 2h or 7d",
+    allow_abbrev = False
+)
+channel_history.add_argument(
+    "id",
+    action = "store",
+    type = str,
+    nargs = "?",
+    help = "id of channel to show messages from, all channels if not given"
+)
+channel_history.add_argument(
+    "-n", "--number",
+    action = "store",
+    type = int,
+    default = 50,
+    help = "number of messages to show (default: 50)"
+)
+channel_history.add_argument(
+    "-s", "--sender",
+    action = "store",
+    type = str,
+    help = "only show messages from this sender, as username.tag or id"
+)
+channel_history.add_argument(
+    "--since",
+    action = "store",
+    type = str,
+    help = "only show messages sent at or after this time"
+)
+channel_history.add_argument(
+    "--until",
+    action = "store",
+    type = str,
+    help = "only show messages sent before this time"
+)
+channel_history.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+channel_history.set_defaults(func=channel_historyfunc)
+
 # info subcommmand of channel subcommand
 channel_info = channel_subparser.add_parser(
     "info",
@@ -1109,7 +1939,32 @@ channel_info.add_argument(
     "id",
     action = "store",
     type = str,
-    help = "id of channel to get info about"
+    nargs = "*",
+    help = "ids of channels to get info about"
+)
+channel_info.add_argument(
+    "-f", "--file",
+    action = "store",
+    type = str,
+    help = "file with one channel id per line, - to read from stdin"
+)
+channel_info.add_argument(
+    "-c", "--concurrency",
+    action = "store",
+    type = int,
+    default = 8,
+    help = "requests to send at the same time (default: 8)"
+)
+channel_info.add_argument(
+    "-o", "--output",
+    action = "store",
+    choices = ["text", "table", "ndjson"],
+    help = "how to print results: text, table or ndjson (one JSON object per line) (default: text for one channel, table for more)"
+)
+channel_info.add_argument(
+    "--no-cache",
+    action = "store_true",
+    help = "fetch channel details from the API instead of using cached ones"
 )
 channel_info.add_argument(
     "-v", "--verbose",
@@ -1118,6 +1973,137 @@ channel_info.add_argument(
 )
 channel_info.set_defaults(func=channel_infofunc)
 
+# probe subcommmand of channel subcommand
+channel_probe = channel_subparser.add_parser(
+    "probe",
+    prog = "probe",
+    description = "measure how long messages take from being sent to arriving on the websocket: keeps the channel open, sends a tagged message every --interval seconds and reports latency percentiles, jitter and loss every --report-every seconds and when it stops",
+    epilog = "every probe is a real message in the channel, use a channel made for monitoring. Exits with status 1 if --fail-loss or --fail-p99 is exceeded, so it can be used for alerting",
+    allow_abbrev = False
+)
+channel_probe.add_argument(
+    "id",
+    action = "store",
+    type = str,
+    help = "id of channel to send probes to"
+)
+channel_probe.add_argument(
+    "-i", "--interval",
+    action = "store",
+    type = float,
+    default = 1,
+    help = "seconds between probes (default: 1)"
+)
+channel_probe.add_argument(
+    "-d", "--duration",
+    action = "store",
+    type = float,
+    help = "seconds to probe for (default: until Ctrl+C)"
+)
+channel_probe.add_argument(
+    "-t", "--timeout",
+    action = "store",
+    type = float,
+    default = 5,
+    help = "seconds to wait for a probe before counting it as lost (default: 5)"
+)
+channel_probe.add_argument(
+    "--report-every",
+    action = "store",
+    type = float,
+    default = 10,
+    help = "seconds between reports (default: 10)"
+)
+channel_probe.add_argument(
+    "--fail-loss",
+    action = "store",
+    type = float,
+    metavar = "PERCENT",
+    help = "exit with status 1 if more than this percentage of probes were lost"
+)
+channel_probe.add_argument(
+    "--fail-p99",
+    action = "store",
+    type = float,
+    metavar = "MS",
+    help = "exit with status 1 if the 99th percentile latency is over this many milliseconds"
+)
+channel_probe.add_argument(
+    "-o", "--output",
+    choices = ("text", "ndjson"),
+    default = "text",
+    help = "show reports for people or as one JSON object per line (default: text)"
+)
+channel_probe.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+channel_probe.set_defaults(func=channel_probefunc)
+
+# search subcommmand of channel subcommand
+channel_search = channel_subparser.add_parser(
+    "search",
+    prog = "search",
+    description = "search archived messages",
+    epilog = """queries use SQLite FTS5 syntax, for example:
+  deploy failed        messages containing both words
+  "deploy failed"      messages containing the phrase
+  deploy OR rollback   messages containing either word
+  deploy NOT staging   messages containing deploy but not staging
+  sender:bob deploy    messages from bob containing deploy
+  deplo*               words starting with deplo
+
+times can be ISO dates or times like 2022-10-01 or 2022-10-01T12:00, or durations before now like 30m, 2h or 7d""",
+    allow_abbrev = False,
+    formatter_class = argparse.RawDescriptionHelpFormatter
+)
+channel_search.add_argument(
+    "query",
+    action = "store",
+    type = str,
+    nargs = "+",
+    help = "what to search for"
+)
+channel_search.add_argument(
+    "-c", "--channel",
+    action = "store",
+    type = str,
+    help = "only search messages in this channel"
+)
+channel_search.add_argument(
+    "-n", "--number",
+    action = "store",
+    type = int,
+    default = 20,
+    help = "number of messages to show (default: 20)"
+)
+channel_search.add_argument(
+    "--since",
+    action = "store",
+    type = str,
+    help = "only search messages sent at or after this time"
+)
+channel_search.add_argument(
+    "--until",
+    action = "store",
+    type = str,
+    help = "only search messages sent before this time"
+)
+channel_search.add_argument(
+    "--sort",
+    action = "store",
+    choices = ["rank", "time"],
+    default = "rank",
+    help = "show the best matches or the newest matches first (default: rank)"
+)
+channel_search.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+channel_search.set_defaults(func=channel_searchfunc)
+
 # send subcommmand of channel subcommand
 channel_send = channel_subparser.add_parser(
     "send",
@@ -1137,6 +2123,26 @@ channel_send.add_argument(
     type = str,
     help = "message to send"
 )
+channel_send.add_argument(
+    "-f", "--file",
+    action = "store",
+    type = str,
+    help = "send every line of a file as a message, - to read from stdin"
+)
+channel_send.add_argument(
+    "-c", "--concurrency",
+    action = "store",
+    type = int,
+    default = 1,
+    help = "messages to send at the same time with -f, more than 1 may change the order they arrive in (default: 1)"
+)
+channel_send.add_argument(
+    "-r", "--rate",
+    action = "store",
+    type = float,
+    default = 0,
+    help = "send at most this many messages per second with -f (default: no limit)"
+)
 channel_send.add_argument(
     "-v", "--verbose",
     action = "store_true",
@@ -1144,6 +2150,52 @@ channel_send.add_argument(
 )
 channel_send.set_defaults(func=channel_sendfunc)
 
+# sync subcommmand of channel subcommand
+channel_sync = channel_subparser.add_parser(
+    "sync",
+    prog = "sync",
+    description = "download messages sent since the last sync into the local archive",
+    allow_abbrev = False
+)
+channel_sync.add_argument(
+    "id",
+    action = "store",
+    type = str,
+    nargs = "*",
+    help = "ids of channels to sync"
+)
+channel_sync.add_argument(
+    "-f", "--file",
+    action = "store",
+    type = str,
+    help = "file with one channel id per line, - to read from stdin"
+)
+channel_sync.add_argument(
+    "-j", "--jobs",
+    action = "store",
+    type = int,
+    default = 4,
+    help = "pages to download at the same time (default: 4)"
+)
+channel_sync.add_argument(
+    "--page-size",
+    action = "store",
+    type = int,
+    default = 100,
+    help = "messages to download per request (default: 100)"
+)
+channel_sync.add_argument(
+    "--full",
+    action = "store_true",
+    help = "sync every message again instead of only new ones"
+)
+channel_sync.add_argument(
+    "-v", "--verbose",
+    action = "store_true",
+    help = "show more output"
+)
+channel_sync.set_defaults(func=channel_syncfunc)
+
 # config subcommand
 _config = subparser.add_parser(
     "config",
@@ -1176,14 +2228,77 @@ _config.add_argument(
     help = "reset config"
 )
 _config.set_defaults(func=configfunc)
+_parser_built = time.perf_counter()
 
 # parse the arguments
-def main(args=None):
-    if args == None:
-        args = parser.parse_args()
-    else:
-        args = parser.parse_args(args)
-    if "func" in dir(args):
-        args.func(args)
+def write_profile(path: str, profiler, argv: list) -> None:
+    """
+    Function to write the profile to the file given with --profile-output.
+
+    Args:
+        path (str): path of the file, a Chrome trace is written if it ends in .json
+        profiler (cProfile.Profile): the profiler, None if a Chrome trace is written
+        argv (list): arguments the command was run with
+    """
+    from . import timing
+
+    try:
+        if profiler != None:
+            profiler.dump_stats(path)
+        else:
+            timing.write_chrome_trace(path, _started, {
+                "version": __display_version__,
+                "python": sys.version.split()[0],
+                "platform": sys.platform,
+                "command": " ".join(argv)
+            })
+    except OSError as e:
+        warn(f"Could not write profile to '{path}': {e}")
     else:
-        parser.error("No default function for this command.")
\ No newline at end of file
+        print(f"Wrote profile to '{path}'", file=sys.stderr)
+
+def main(args=None):
+    config_started = time.perf_counter()
+    config.check()
+    config_loaded = time.perf_counter()
+    argv = sys.argv[1:] if args == None else list(args)
+    args = parser.parse_args(argv)
+    parsed = time.perf_counter()
+    if "func" not in dir(args):
+        parser.error("No default function for this command.")
+
+    from . import (
+        metrics,
+        timing
+    )
+
+    metrics.enabled = args.stats or getattr(args, "metrics_file", None) != None
+    timing.enabled = args.profile or args.profile_output != None
+    profiler = None
+    if timing.enabled:
+        timing.add("import", _started, _imported)
+        timing.add("build parser", _imported, _parser_built)
+        timing.add("load config", config_started, config_loaded)
+        timing.add("parse arguments", config_loaded, parsed)
+        # commands import the HTTP library when they first need it, do it here so it shows up on its own
+        with timing.span("import HTTP library"):
+            timing.install_http_timing()
+        if args.profile_output != None and not args.profile_output.endswith(".json"):
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+    try:
+        with timing.span("run command", command=" ".join(argv)):
+            args.func(args)
+    finally:
+        if profiler != None:
+            profiler.disable()
+        if args.stats:
+            stats = metrics.summary()
+            # stderr, so --stats can be used with output that is read by other programs
+            print(f"\nStats\n{stats}" if stats else "\nStats\nNothing was recorded.", file=sys.stderr)
+        if timing.enabled:
+            print("\n" + timing.report(_started), file=sys.stderr)
+            if args.profile_output != None:
+                write_profile(args.profile_output, profiler, argv)
\ No newline at end of file
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from . import api
+from .archive import Archive
+
+__all__ = [
+    "sync"
+]
+
+def sync(
+    client: api.Client,
+    archive: Archive,
+    ids: list,
+    page_size: int = 100,
+    jobs: int = 4,
+    full: bool = False,
+    progress = None
+) -> dict:
+    """
+    Function to download messages newer than each channel's cursor into the archive.
+
+    Pages of different channels are fetched at the same time by a pool of
+    threads, while pages of one channel are fetched in order since each
+    one starts after the last message of the previous one. Every page is
+    written in bulk from the calling thread.
+
+    Expects `GET channel/<id>/messages?after=<message id>&limit=<n>` to
+    return the messages after that id, oldest first.
+
+    Args:
+        client (api.Client): API client of the user
+        archive (Archive): archive to write messages to
+        ids (list): ids of the channels to sync
+        page_size (int, optional): messages to request per page. Defaults to 100.
+        jobs (int, optional): pages to fetch at the same time. Defaults to 4.
+        full (bool, optional): whether to ignore the cursors and sync from the first message or not. Defaults to False.
+        progress (Callable, optional): called with (channel id, messages in page, new messages in page) after every page. Defaults to None.
+
+    Returns:
+        dict: channel id mapped to the number of new messages, or the api.APIError that stopped its sync
+    """
+    def fetch(channel: str, after):
+        params = {"limit": page_size}
+        if after != None:
+            params["after"] = after
+        return client.request("GET", "channel", channel, "messages", params=params)
+
+    results = {id: 0 for id in ids}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        pending = {}
+        for id in ids:
+            after = None if full else archive.cursor(id)
+            pending[executor.submit(fetch, id, after)] = id
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                id = pending.pop(future)
+                try:
+                    page = future.result()
+                except api.APIError as e:
+                    results[id] = e
+                    continue
+
+                if page:
+                    after = page[-1].get("id")
+                    added = archive.store_page(id, page, after)
+                    results[id] += added
+                    if progress != None:
+                        progress(id, len(page), added)
+                    if len(page) >= page_size and after != None:
+                        pending[executor.submit(fetch, id, after)] = id
+    return results
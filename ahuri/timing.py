@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+__all__ = [
+    "enabled",
+    "add",
+    "span",
+    "install_http_timing",
+    "connect_time",
+    "report",
+    "write_chrome_trace"
+]
+
+# Nothing is recorded unless this is set
+enabled = False
+
+_lock = threading.Lock()
+# (name, category, start, end, thread id, args), times from time.perf_counter()
+_spans = []
+_local = threading.local()
+
+def add(name: str, start: float, end: float, category: str = "phase", **args) -> None:
+    """
+    Function to record a span that already ended.
+
+    Args:
+        name (str): name of the span
+        start (float): time.perf_counter() when it started
+        end (float): time.perf_counter() when it ended
+        category (str, optional): category of the span, like phase, http or ws. Defaults to "phase".
+        **args (Any): details shown with the span
+    """
+    if not enabled:
+        return
+    with _lock:
+        _spans.append((name, category, start, end, threading.get_ident(), args))
+
+@contextmanager
+def span(name: str, category: str = "phase", **args):
+    """
+    Context manager recording the time taken by its body as a span.
+    Details can be added to the yielded dict while it runs.
+
+    Args:
+        name (str): name of the span
+        category (str, optional): category of the span. Defaults to "phase".
+        **args (Any): details shown with the span
+
+    Yields:
+        dict: the details
+    """
+    if not enabled:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        add(name, start, time.perf_counter(), category, **args)
+
+def _timed_connect(connect, suffix: str = ""):
+    """
+    Function to wrap the connect method of a urllib3 connection class so it records how long it took.
+
+    Args:
+        connect (Callable): the method
+        suffix (str, optional): added to the span name. Defaults to "".
+
+    Returns:
+        Callable: the wrapped method
+    """
+    def timed_connect(self):
+        start = time.perf_counter()
+        try:
+            return connect(self)
+        finally:
+            end = time.perf_counter()
+            _local.connect_time = end - start
+            add(f"connect {self.host}:{self.port}{suffix}", start, end, "http")
+    timed_connect._timed = True
+    return timed_connect
+
+def install_http_timing() -> None:
+    """
+    Function to time the connections urllib3 opens (DNS lookup, TCP connect and TLS handshake),
+    so requests can be split into connect, time to first byte and body.
+    The time of the last connection opened by a thread is read with connect_time().
+    """
+    import urllib3.connection
+
+    # HTTPSConnection has its own connect doing the TLS handshake too
+    for connection, suffix in ((urllib3.connection.HTTPConnection, ""), (urllib3.connection.HTTPSConnection, " (TLS)")):
+        if "connect" in vars(connection) and not getattr(connection.connect, "_timed", False):
+            connection.connect = _timed_connect(connection.connect, suffix)
+
+def connect_time(reset: bool = False) -> float:
+    """
+    Function to get how long the last connection opened by this thread took to open.
+
+    Args:
+        reset (bool, optional): whether to forget it afterwards or not. Defaults to False.
+
+    Returns:
+        float: seconds, 0 if no connection was opened since the last reset
+    """
+    value = getattr(_local, "connect_time", 0.0)
+    if reset:
+        _local.connect_time = 0.0
+    return value
+
+def _sorted_spans() -> list:
+    with _lock:
+        return sorted(_spans, key=lambda span: (span[2], -span[3]))
+
+def report(origin: float) -> str:
+    """
+    Function to describe the recorded spans in the order they started.
+
+    Args:
+        origin (float): time.perf_counter() the offsets are counted from, usually when the process started
+
+    Returns:
+        str: the description
+    """
+    spans = _sorted_spans()
+    end = max([span[3] for span in spans] + [time.perf_counter()])
+    lines = [f"Profile (total {(end - origin) * 1000:.1f}ms, Python {sys.version.split()[0]}, {sys.platform})"]
+    lines.append(f"{'start':>10}  {'duration':>10}  phase")
+    # spans are indented under the span they happened in on the same thread, or else on the main thread,
+    # so requests sent at the same time from a thread pool don't end up under each other
+    main_thread = threading.main_thread().ident
+    active = []
+    for name, category, start, stop, thread, args in spans:
+        # spans are sorted by start, so ones that ended already can't hold any of the rest
+        active = [parent for parent in active if parent[1] > start]
+        containing = [parent for parent in active if parent[1] >= stop]
+        parents = [parent for parent in containing if parent[2] == thread] or [parent for parent in containing if parent[2] == main_thread]
+        depth = parents[-1][3] + 1 if parents else 0
+        details = ", ".join(f"{key}={value}" for key, value in args.items())
+        lines.append(
+            f"{(start - origin) * 1000:>8.1f}ms  {(stop - start) * 1000:>8.1f}ms  "
+            + "  " * depth + name + (f" ({details})" if details else "")
+        )
+        active.append((start, stop, thread, depth))
+    return "\n".join(lines)
+
+def write_chrome_trace(path: str, origin: float, metadata: dict = None) -> None:
+    """
+    Function to write the recorded spans as a Chrome trace,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+    Args:
+        path (str): path of the file
+        origin (float): time.perf_counter() the timestamps are counted from
+        metadata (dict, optional): details about the run, like the version and command. Defaults to None.
+    """
+    events = []
+    for name, category, start, stop, thread, args in _sorted_spans():
+        events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - origin) * 1e6, 1),
+            "dur": round((stop - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": thread,
+            "args": {key: str(value) for key, value in args.items()}
+        })
+    with open(path, "w") as tracefile:
+        json.dump({
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": metadata or {}
+        }, tracefile, indent=1)
@@ -1,3 +1,5 @@
+import sys
+
 __all__ = [
     "log",
     "warn",
@@ -5,6 +7,10 @@ __all__ = [
     "winfo"
 ]
 
+# Where log(), warn(), info() and winfo() write to, None for stdout.
+# Commands whose stdout is read by other programs set this to sys.stderr.
+stream = None
+
 def log(msg = " "):
     """
     Log outputs.
@@ -16,7 +22,7 @@ def log(msg = " "):
     pmsg = ""
     for x in msg:
         pmsg += "[INFO] " + x + "\n"
-    print(pmsg, end="")
+    print(pmsg, end="", file=stream or sys.stdout)
 
 def warn(msg = " "):
     """
@@ -29,7 +35,7 @@ def warn(msg = " "):
     pmsg = ""
     for x in msg:
         pmsg += "[WARN] " + x + "\n"
-    print(pmsg, end="")
+    print(pmsg, end="", file=stream or sys.stdout)
 
 def info(msg = " "):
     """
@@ -42,7 +48,7 @@ def info(msg = " "):
     pmsg = ""
     for x in msg:
         pmsg += "<i> " + x + "\n"
-    print(pmsg, end="")
+    print(pmsg, end="", file=stream or sys.stdout)
 
 def winfo(msg = " "):
     """
@@ -55,4 +61,4 @@ def winfo(msg = " "):
     pmsg = ""
     for x in msg:
         pmsg += "<!> " + x + "\n"
-    print(pmsg, end="")
\ No newline at end of file
+    print(pmsg, end="", file=stream or sys.stdout)
\ No newline at end of file
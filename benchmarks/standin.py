@@ -0,0 +1,408 @@
+"""
+Local stand-in for the Ahuri server, for benchmarks and for trying the CLI
+without a network connection. Everything is kept in memory and lost when it stops.
+
+HTTP endpoints, answered like the real API ({"payload": ...} on success,
+{"message": ...} on errors):
+    POST   /auth/register              {"email", "username", "password"}
+    POST   /auth/login                 {"email", "password"}
+    GET    /account, DELETE /account
+    POST   /channel                    {"channelName"}
+    GET    /channel/<id>               with ETag / If-None-Match
+    DELETE /channel/<id>
+    POST   /channel/<id>/send-message  {"content"}
+    GET    /channel/<id>/messages      ?after=<message id>&limit=<n>
+
+Websocket: the "authorize" and "open channel" commands, after which every
+message sent to an open channel is pushed as {"payload": message}.
+
+Endpoints only the stand-in has, for benchmarks:
+    POST /_standin/flood   {"channel", "count", "rate", "size"}
+        push `count` generated messages at `rate` per second (0 for as fast as
+        possible) to the next client that opens the channel. Pushed messages
+        carry "sentAt", the unix time they were written to the socket.
+    GET  /_standin/stats   requests and websocket commands handled so far
+
+A user bench@example.com with password "bench" and token "bench-token" and a
+channel "bench" owned by them exist from the start.
+
+Usage:
+    python benchmarks/standin.py [--host HOST] [--port PORT] [--ws-port PORT]
+
+Prints {"api_url": ..., "ws_url": ...} on the first line once it is ready.
+Port 0, the default, picks a free port.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+import collections
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class State:
+    """
+    Users, channels, messages and websocket subscribers of the stand-in.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): event loop the websocket server runs in
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.users = {}
+        self.channels = {}
+        self.messages = collections.defaultdict(list)
+        self.versions = collections.defaultdict(int)
+        # channel id mapped to the outgoing queues of the connections that opened it
+        self.subscribers = collections.defaultdict(set)
+        self.floods = {}
+        self.stats = collections.Counter()
+        self.next_id = 0
+
+        user = self.add_user("bench@example.com", "bench", "bench", token="bench-token")
+        self.channels["bench"] = {
+            "id": "bench",
+            "name": "bench",
+            "owner": self.public(user),
+            "createdAt": now()
+        }
+
+    def new_id(self) -> str:
+        with self.lock:
+            self.next_id += 1
+            return f"{self.next_id:012x}"
+
+    def add_user(self, email: str, username: str, password: str, token: str = None) -> dict:
+        user = {
+            "id": self.new_id(),
+            "username": username,
+            "tag": f"{len(self.users) + 1:04d}",
+            "email": email,
+            "createdAt": now(),
+            "token": token or f"token-{self.new_id()}",
+            "password": password
+        }
+        self.users[user["token"]] = user
+        return user
+
+    @staticmethod
+    def public(user: dict) -> dict:
+        """
+        Function to get the details of a user other users may see.
+        """
+        return {key: user[key] for key in ("id", "username", "tag")}
+
+    @staticmethod
+    def account(user: dict) -> dict:
+        """
+        Function to get the details of a user the user may see.
+        """
+        return {key: value for key, value in user.items() if key != "password"}
+
+    def publish(self, channel_id: str, message: dict) -> None:
+        """
+        Function to push a message to every connection that opened the channel.
+        Safe to call from any thread.
+        """
+        with self.lock:
+            queues = list(self.subscribers.get(channel_id, ()))
+        for queue in queues:
+            self.loop.call_soon_threadsafe(queue.put_nowait, message)
+
+def now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def handler_class(state: State):
+    """
+    Function to make the HTTP request handler of the stand-in.
+
+    Args:
+        state (State): state of the stand-in
+
+    Returns:
+        type: the handler class
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, without this every response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def reply(self, status: int, body: dict = None, headers: dict = {}) -> None:
+            data = json.dumps(body).encode() if body != None else b""
+            self.send_response(status)
+            if body != None:
+                self.send_header("Content-Type", "application/json")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def error(self, status: int, message: str) -> None:
+            self.reply(status, {"message": message})
+
+        def body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = None
+            return body if type(body) == dict else {}
+
+        def user(self) -> dict:
+            user = state.users.get(self.headers.get("Authorization"))
+            if user == None:
+                self.error(401, "Invalid token")
+            return user
+
+        def route(self, method: str) -> None:
+            url = urlsplit(self.path)
+            path = [segment for segment in url.path.split("/") if segment]
+            endpoint = ["{id}" if index == 1 and path[0] == "channel" else segment for index, segment in enumerate(path)]
+            state.stats[f"{method} /{'/'.join(endpoint)}"] += 1
+            # the body has to be read even if the request fails so the connection can be reused
+            body = self.body() if method in ("POST", "PUT", "PATCH") else {}
+
+            if path[:1] == ["_standin"]:
+                return self.standin(method, path[1:], body)
+            if path == ["auth", "register"] and method == "POST":
+                if not all(type(body.get(key)) == str for key in ("email", "username", "password")):
+                    return self.error(400, "email, username and password are required")
+                if any(user["email"] == body["email"] for user in state.users.values()):
+                    return self.error(409, "Email is already in use")
+                return self.reply(201, {"payload": state.account(state.add_user(body["email"], body["username"], body["password"]))})
+            if path == ["auth", "login"] and method == "POST":
+                for user in state.users.values():
+                    if user["email"] == body.get("email") and user["password"] == body.get("password"):
+                        return self.reply(200, {"payload": state.account(user)})
+                return self.error(401, "Invalid email or password")
+
+            user = self.user()
+            if user == None:
+                return
+            if path == ["account"]:
+                if method == "GET":
+                    return self.reply(200, {"payload": state.account(user)})
+                if method == "DELETE":
+                    state.users.pop(user["token"], None)
+                    return self.reply(200, {"payload": state.account(user)})
+            elif path == ["channel"] and method == "POST":
+                if type(body.get("channelName")) != str:
+                    return self.error(400, "channelName is required")
+                channel = {
+                    "id": state.new_id(),
+                    "name": body["channelName"],
+                    "owner": state.public(user),
+                    "createdAt": now()
+                }
+                state.channels[channel["id"]] = channel
+                return self.reply(201, {"payload": channel})
+            elif path[:1] == ["channel"] and len(path) in (2, 3):
+                channel = state.channels.get(path[1])
+                if channel == None:
+                    return self.error(404, "Channel not found")
+                if len(path) == 2 and method == "GET":
+                    etag = f'"{channel["id"]}-{state.versions[channel["id"]]}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.reply(304, headers={"ETag": etag})
+                    return self.reply(200, {"payload": channel}, {"ETag": etag})
+                if len(path) == 2 and method == "DELETE":
+                    if channel["owner"]["id"] != user["id"]:
+                        return self.error(403, "Only the owner can delete a channel")
+                    state.channels.pop(channel["id"], None)
+                    state.versions[channel["id"]] += 1
+                    return self.reply(200, {"payload": channel})
+                if path[2:] == ["send-message"] and method == "POST":
+                    if type(body.get("content")) != str or not body["content"]:
+                        return self.error(400, "content is required")
+                    message = {
+                        "id": state.new_id(),
+                        "channel": channel["id"],
+                        "content": body["content"],
+                        "sender": state.public(user),
+                        "createdAt": now()
+                    }
+                    state.messages[channel["id"]].append(message)
+                    state.publish(channel["id"], message)
+                    return self.reply(200, {"payload": message})
+                if path[2:] == ["messages"] and method == "GET":
+                    query = parse_qs(url.query)
+                    try:
+                        limit = int(query.get("limit", ["100"])[0])
+                    except ValueError:
+                        return self.error(400, "limit must be a number")
+                    limit = max(1, min(limit, 1000))
+                    messages = state.messages[channel["id"]]
+                    start = 0
+                    if "after" in query:
+                        ids = [message["id"] for message in messages]
+                        start = ids.index(query["after"][0]) + 1 if query["after"][0] in ids else len(ids)
+                    return self.reply(200, {"payload": messages[start:start + limit]})
+            self.error(404, "Not found")
+
+        def standin(self, method: str, path: list, body: dict) -> None:
+            if path == ["stats"] and method == "GET":
+                return self.reply(200, {"payload": dict(state.stats)})
+            if path == ["flood"] and method == "POST":
+                if body.get("channel") not in state.channels:
+                    return self.error(404, "Channel not found")
+                try:
+                    state.floods[body["channel"]] = {
+                        "count": int(body.get("count", 1000)),
+                        "rate": float(body.get("rate", 0)),
+                        "size": int(body.get("size", 32))
+                    }
+                except (TypeError, ValueError):
+                    return self.error(400, "count, rate and size must be numbers")
+                return self.reply(200, {"payload": state.floods[body["channel"]]})
+            self.error(404, "Not found")
+
+        def do_GET(self) -> None:
+            self.route("GET")
+
+        def do_POST(self) -> None:
+            self.route("POST")
+
+        def do_DELETE(self) -> None:
+            self.route("DELETE")
+    return Handler
+
+async def flood(state: State, queue: asyncio.Queue, channel: dict, spec: dict) -> None:
+    """
+    Function to push generated messages to one connection at a steady rate.
+
+    Args:
+        state (State): state of the stand-in
+        queue (asyncio.Queue): outgoing queue of the connection
+        channel (dict): the channel the messages are sent in
+        spec (dict): count, rate and size of the messages, see /_standin/flood
+    """
+    sender = next(iter(state.users.values()))
+    padding = "x" * max(0, spec["size"] - 16)
+    started = time.perf_counter()
+    for number in range(spec["count"]):
+        queue.put_nowait({
+            "id": f"flood-{number}",
+            "channel": channel["id"],
+            "content": f"{number:>8} {padding}",
+            "sender": state.public(sender),
+            "createdAt": now()
+        })
+        if spec["rate"] > 0:
+            # sleep only once ahead of schedule, sleeping after every message can't keep up with high rates
+            ahead = started + (number + 1) / spec["rate"] - time.perf_counter()
+            if ahead > 0.001:
+                await asyncio.sleep(ahead)
+        elif number % 100 == 99:
+            await asyncio.sleep(0)
+
+async def serve_websocket(state: State, ws) -> None:
+    """
+    Function to serve one websocket connection.
+
+    Args:
+        state (State): state of the stand-in
+        ws (websockets.WebSocketServerProtocol): the connection
+    """
+    queue = asyncio.Queue()
+    user = None
+    opened = []
+    floods = []
+
+    async def send() -> None:
+        while True:
+            message = await queue.get()
+            if "id" in message and message["id"].startswith("flood-"):
+                message["sentAt"] = time.time()
+            await ws.send(json.dumps({"payload": message}))
+
+    sender = asyncio.create_task(send())
+    try:
+        async for text in ws:
+            try:
+                command = json.loads(text)
+                name = command["command"]
+                arguments = command.get("arguments") or {}
+            except (ValueError, KeyError, TypeError):
+                await ws.send(json.dumps({"message": "Invalid command"}))
+                continue
+            state.stats[f"ws {name}"] += 1
+            if name == "authorize":
+                user = state.users.get(arguments.get("token"))
+                if user == None:
+                    await ws.send(json.dumps({"message": "Invalid token"}))
+                    break
+            elif name == "open channel":
+                channel = state.channels.get(arguments.get("id"))
+                if user == None or channel == None:
+                    await ws.send(json.dumps({"message": "Not authorized" if user == None else "Channel not found"}))
+                    continue
+                with state.lock:
+                    state.subscribers[channel["id"]].add(queue)
+                opened.append(channel["id"])
+                spec = state.floods.pop(channel["id"], None)
+                if spec != None:
+                    floods.append(asyncio.create_task(flood(state, queue, channel, spec)))
+            else:
+                await ws.send(json.dumps({"message": f"Unknown command '{name}'"}))
+    except Exception:
+        # the client going away without closing the connection is normal for a benchmark
+        pass
+    finally:
+        with state.lock:
+            for id in opened:
+                state.subscribers[id].discard(queue)
+        for task in floods + [sender]:
+            task.cancel()
+
+async def serve(host: str, port: int, ws_port: int) -> None:
+    import websockets
+
+    state = State(asyncio.get_running_loop())
+    http = ThreadingHTTPServer((host, port), handler_class(state))
+    http.daemon_threads = True
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+
+    async with websockets.serve(lambda ws, *args: serve_websocket(state, ws), host, ws_port, max_size=None) as server:
+        print(json.dumps({
+            "api_url": f"http://{host}:{http.server_address[1]}",
+            "ws_url": f"ws://{host}:{server.sockets[0].getsockname()[1]}/ws"
+        }), flush=True)
+        await asyncio.Future()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description = "Run a local stand-in for the Ahuri server."
+    )
+    parser.add_argument(
+        "--host",
+        default = "127.0.0.1",
+        help = "address to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type = int,
+        default = 0,
+        help = "port of the HTTP API (default: a free port)"
+    )
+    parser.add_argument(
+        "--ws-port",
+        type = int,
+        default = 0,
+        help = "port of the websocket server (default: a free port)"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.ws_port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
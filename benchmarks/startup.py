@@ -0,0 +1,169 @@
+"""
+Startup benchmark for the `ahuri` entry point.
+
+Reports how long importing `ahuri.start` takes (using `python -X importtime`)
+and the cold-start wall time of every subcommand. Each run uses a throwaway
+config directory, so nothing touches your real config or the network.
+
+Usage:
+    python benchmarks/startup.py [-n RUNS] [--json]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from time import perf_counter
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Commands timed for cold start. Subcommands that would hit the network are
+# timed with -h, which still pays the imports needed to build the parser.
+commands = {
+    "version": ["-V"],
+    "config": ["config", "api_url"],
+    "account login": ["account", "login", "-h"],
+    "account register": ["account", "register", "-h"],
+    "account info": ["account", "info", "-h"],
+    "channel connect": ["channel", "connect", "-h"],
+    "channel send": ["channel", "send", "-h"],
+    "channel info": ["channel", "info", "-h"]
+}
+
+# Modules that should only be imported by the subcommands that need them
+heavy_modules = [
+    "maskpass",
+    "requests",
+    "websockets",
+    "yarl",
+    "asyncio"
+]
+
+def environment(home: str) -> dict:
+    """
+    Function to build the environment for a benchmark run.
+
+    Args:
+        home (str): directory to use as the home/config directory
+
+    Returns:
+        dict: environment variables
+    """
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["LOCALAPPDATA"] = home
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+def import_time(env: dict) -> dict:
+    """
+    Function to measure the import time of `ahuri.start`.
+
+    Args:
+        env (dict): environment variables
+
+    Returns:
+        dict: total import time in milliseconds and the heavy modules that got imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import ahuri.start"],
+        env = env,
+        capture_output = True,
+        text = True
+    )
+    total = 0
+    imported = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if name == "ahuri.start":
+            total = int(cumulative) / 1000
+        if name in heavy_modules:
+            imported.append(name)
+    return {
+        "import_ms": round(total, 2),
+        "heavy_imports": imported
+    }
+
+def cold_start(env: dict, args: list, runs: int) -> dict:
+    """
+    Function to measure the cold-start wall time of a command.
+
+    Args:
+        env (dict): environment variables
+        args (list): arguments passed to `python -m ahuri`
+        runs (int): number of runs
+
+    Returns:
+        dict: wall time statistics in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "ahuri", *args],
+            env = env,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL
+        )
+        times.append((perf_counter() - start) * 1000)
+    return {
+        "min_ms": round(min(times), 2),
+        "median_ms": round(statistics.median(times), 2),
+        "max_ms": round(max(times), 2)
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description = "Measure import time and cold-start wall time of the ahuri CLI."
+    )
+    parser.add_argument(
+        "-n", "--runs",
+        type = int,
+        default = 10,
+        help = "runs per command (default: 10)"
+    )
+    parser.add_argument(
+        "--json",
+        action = "store_true",
+        help = "print results as JSON"
+    )
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix="ahuri-bench-")
+    try:
+        env = environment(home)
+        # Create the config file so its creation isn't part of the first run
+        subprocess.run([sys.executable, "-m", "ahuri", "-V"], env=env, stdout=subprocess.DEVNULL)
+
+        results = {
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "import": import_time(env),
+            "cold_start": {}
+        }
+        for name, command in commands.items():
+            results["cold_start"][name] = cold_start(env, command, args.runs)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"import ahuri.start: {results['import']['import_ms']}ms")
+    heavy = ", ".join(results["import"]["heavy_imports"]) or "none"
+    print(f"heavy modules imported: {heavy}\n")
+    print(f"{'command':<20}{'min':>10}{'median':>10}{'max':>10}")
+    for name, stats in results["cold_start"].items():
+        print(f"{name:<20}{stats['min_ms']:>8.1f}ms{stats['median_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Benchmark suite for the ahuri CLI, run against the local stand-in server
+(benchmarks/standin.py), so it needs no network and gives numbers that can be
+compared across commits on the same machine.
+
+Measures:
+    cold_start         wall time of every subcommand, started from scratch, against the stand-in
+    send_throughput    messages per second sent by `channel send -f` at a few concurrencies
+    connect_latency    time from starting `channel connect` to the first message shown
+    listen_throughput  messages per second shown by `channel connect` while the stand-in
+                       pushes messages at the given rates, with delivery latency and losses
+
+Results are printed as JSON, with the commit and Python version they were
+measured on. Compare two runs with:
+    python benchmarks/suite.py -o before.json
+    git checkout <other commit>
+    python benchmarks/suite.py -o after.json
+
+Usage:
+    python benchmarks/suite.py [-n RUNS] [--messages N] [--rates R,R,...] [--only NAME ...] [-o FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from time import perf_counter
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# startup.py sits next to this file, find it however this file is run
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+from startup import environment
+
+# Commands timed for cold start, all of them talk to the stand-in except version and config
+commands = {
+    "version": ["-V"],
+    "config": ["config", "api_url"],
+    "account info": ["account", "info"],
+    "channel info": ["channel", "info", "bench"],
+    "channel create": ["channel", "create", "bench-cold-start"],
+    "channel send": ["channel", "send", "bench", "-m", "cold start"],
+    "channel sync": ["channel", "sync", "bench"]
+}
+
+benchmarks = ("cold_start", "send_throughput", "connect_latency", "listen_throughput")
+
+def distribution(values: list, unit: str = "ms") -> dict:
+    """
+    Function to summarize measurements.
+
+    Args:
+        values (list): the measurements
+        unit (str, optional): unit added to the key names. Defaults to "ms".
+
+    Returns:
+        dict: min, median, p95 and max
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        f"min_{unit}": round(values[0], 2),
+        f"median_{unit}": round(statistics.median(values), 2),
+        f"p95_{unit}": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+        f"max_{unit}": round(values[-1], 2)
+    }
+
+class Standin:
+    """
+    Runs the stand-in server in a subprocess and configures a throwaway home directory to use it.
+
+    Args:
+        home (str): directory to use as the home/config directory
+    """
+    def __init__(self, home: str):
+        self.env = environment(home)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(root, "benchmarks", "standin.py")],
+            stdout = subprocess.PIPE,
+            text = True
+        )
+        try:
+            urls = json.loads(self.process.stdout.readline())
+            self.api_url = urls["api_url"]
+            self.ws_url = urls["ws_url"]
+
+            # create the config file, then log in by writing the token, since login asks for the password
+            self.run(["-V"])
+            config_path = subprocess.run(
+                [sys.executable, "-c", "from ahuri import config; print(config.config)"],
+                env = self.env,
+                capture_output = True,
+                text = True
+            ).stdout.strip()
+            with open(config_path, "r") as configfile:
+                config = json.load(configfile)
+            config.update({
+                "api_url": self.api_url,
+                "ws_url": self.ws_url,
+                "user": self.call("POST", "auth/login", {"email": "bench@example.com", "password": "bench"}),
+                "user_refreshed_at": time.time()
+            })
+            with open(config_path, "w") as configfile:
+                json.dump(config, configfile, indent=4)
+        except BaseException:
+            # don't leave the server running if it can't be set up
+            self.stop()
+            raise
+
+    def call(self, method: str, path: str, data: dict = None):
+        """
+        Function to send a request to the stand-in directly.
+
+        Returns:
+            Any: payload of the response
+        """
+        request = urllib.request.Request(
+            f"{self.api_url}/{path}",
+            data = json.dumps(data).encode() if data != None else None,
+            headers = {"Content-Type": "application/json"},
+            method = method
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)["payload"]
+
+    def run(self, args: list, **kwargs) -> subprocess.CompletedProcess:
+        """
+        Function to run the CLI and fail loudly if it fails, so a broken command isn't timed as a fast one.
+        """
+        result = subprocess.run(
+            [sys.executable, "-m", "ahuri", *args],
+            env = self.env,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.PIPE,
+            text = True,
+            **kwargs
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"'ahuri {' '.join(args)}' failed:\n{result.stderr}")
+        return result
+
+    def connect(self, channel: str = "bench") -> subprocess.Popen:
+        """
+        Function to start `channel connect` printing messages as NDJSON.
+        """
+        return subprocess.Popen(
+            [sys.executable, "-m", "ahuri", "channel", "connect", channel, "--format", "ndjson"],
+            env = self.env,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.DEVNULL,
+            text = True
+        )
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait()
+
+def stop(process: subprocess.Popen) -> None:
+    """
+    Function to stop `channel connect` the way a user would, with Ctrl+C.
+    """
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def cold_start(standin: Standin, runs: int) -> dict:
+    results = {}
+    for name, args in commands.items():
+        times = []
+        for _ in range(runs):
+            started = perf_counter()
+            standin.run(args)
+            times.append((perf_counter() - started) * 1000)
+        results[name] = distribution(times)
+    return results
+
+def send_throughput(standin: Standin, messages: int, concurrencies: list = [1, 8]) -> dict:
+    results = {}
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as messagefile:
+        for number in range(messages):
+            messagefile.write(f"benchmark message {number}\n")
+    try:
+        for concurrency in concurrencies:
+            started = perf_counter()
+            standin.run(["channel", "send", "bench", "-f", messagefile.name, "-c", str(concurrency)])
+            seconds = perf_counter() - started
+            results[f"concurrency {concurrency}"] = {
+                "messages": messages,
+                "seconds": round(seconds, 3),
+                "messages_per_second": round(messages / seconds, 1)
+            }
+    finally:
+        os.remove(messagefile.name)
+    return results
+
+def connect_latency(standin: Standin, runs: int) -> dict:
+    times = []
+    for _ in range(runs):
+        standin.call("POST", "_standin/flood", {"channel": "bench", "count": 1})
+        started = perf_counter()
+        process = standin.connect()
+        try:
+            if not process.stdout.readline():
+                raise RuntimeError("'ahuri channel connect' exited before showing a message")
+            times.append((perf_counter() - started) * 1000)
+        finally:
+            stop(process)
+    return distribution(times)
+
+def listen_throughput(standin: Standin, messages: int, rates: list) -> dict:
+    results = {}
+    for rate in rates:
+        standin.call("POST", "_standin/flood", {"channel": "bench", "count": messages, "rate": rate})
+        process = standin.connect()
+        latencies = []
+        first = last = None
+        # give up on messages that were lost
+        deadline = perf_counter() + 30 + (messages / rate if rate > 0 else 0)
+        try:
+            while len(latencies) < messages and perf_counter() < deadline:
+                line = process.stdout.readline()
+                if not line:
+                    break
+                shown = time.time()
+                last = perf_counter()
+                if first == None:
+                    first = last
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if "sentAt" in message:
+                    latencies.append((shown - message["sentAt"]) * 1000)
+        finally:
+            stop(process)
+        seconds = (last - first) if first != None and last > first else 0
+        results["unlimited" if rate <= 0 else f"{rate:g}/s"] = {
+            "sent": messages,
+            "shown": len(latencies),
+            "lost": messages - len(latencies),
+            "messages_per_second": round(len(latencies) / seconds, 1) if seconds else None,
+            "latency": distribution(latencies)
+        }
+    return results
+
+def metadata() -> dict:
+    """
+    Function to describe what the benchmarks were run on.
+    """
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=root, capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            return None
+
+    sys.path.insert(0, root)
+    from ahuri import __version__
+
+    return {
+        "version": __version__,
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description = "Benchmark the ahuri CLI against a local stand-in server."
+    )
+    parser.add_argument(
+        "-n", "--runs",
+        type = int,
+        default = 5,
+        help = "runs per cold start and connect latency measurement (default: 5)"
+    )
+    parser.add_argument(
+        "--messages",
+        type = int,
+        default = 2000,
+        help = "messages sent and received by the throughput benchmarks (default: 2000)"
+    )
+    parser.add_argument(
+        "--rates",
+        type = lambda value: [float(rate) for rate in value.split(",")],
+        default = [1000, 10000, 0],
+        help = "comma separated messages per second pushed by the stand-in for listen throughput, 0 for as fast as possible (default: 1000,10000,0)"
+    )
+    parser.add_argument(
+        "--only",
+        nargs = "+",
+        choices = benchmarks,
+        default = benchmarks,
+        help = "benchmarks to run (default: all)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help = "write the results to this file instead of printing them"
+    )
+    args = parser.parse_args()
+
+    results = {"meta": metadata()}
+    home = tempfile.mkdtemp(prefix="ahuri-bench-")
+    standin = None
+    try:
+        standin = Standin(home)
+        for name in benchmarks:
+            if name not in args.only:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            if name == "cold_start":
+                results[name] = cold_start(standin, args.runs)
+            elif name == "send_throughput":
+                results[name] = send_throughput(standin, args.messages)
+            elif name == "connect_latency":
+                results[name] = connect_latency(standin, args.runs)
+            else:
+                results[name] = listen_throughput(standin, args.messages, args.rates)
+    finally:
+        if standin != None:
+            standin.stop()
+        shutil.rmtree(home, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as outputfile:
+            json.dump(results, outputfile, indent=2)
+        print(f"Wrote results to '{args.output}'", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+# ahuri.config finds the config directory from HOME when it is imported,
+# point it somewhere empty so the tests never touch the real config
+os.environ["HOME"] = tempfile.mkdtemp(prefix="ahuri-tests-")
+os.environ["LOCALAPPDATA"] = os.environ["HOME"]
+
+import pytest
+from ahuri import config
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    """
+    Fixture to give every test its own config file, freshly reset.
+
+    Returns:
+        str: path of the config file
+    """
+    monkeypatch.setattr(config, "config_dir", str(tmp_path))
+    monkeypatch.setattr(config, "config", str(tmp_path / "config.json"))
+    monkeypatch.setattr(config, "_cache", None)
+    monkeypatch.setattr(config, "_stamp", None)
+    config.reset(p=False)
+    return config.config
@@ -0,0 +1,125 @@
+import json
+import pytest
+import requests
+from ahuri import api
+
+class FakeSession:
+    """
+    Stand-in for requests.Session that answers from a list of responses
+    and records every request it gets.
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def response(status_code, body=None, headers={}):
+    result = requests.Response()
+    result.status_code = status_code
+    result.url = "http://api.test/x"
+    result.headers.update(headers)
+    result._content = b"" if body == None else json.dumps(body).encode()
+    return result
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waits = []
+    monkeypatch.setattr(api.time, "sleep", waits.append)
+    return waits
+
+def use(monkeypatch, *responses):
+    session = FakeSession(*responses)
+    monkeypatch.setattr(api, "_session", session)
+    return session
+
+def test_payload_and_token(monkeypatch, sleeps):
+    session = use(monkeypatch, response(200, {"payload": {"id": 1}}))
+    client = api.Client("http://api.test", "secret")
+    assert client.request("GET", "user", "me") == {"id": 1}
+    method, url, kwargs = session.requests[0]
+    assert (method, url) == ("GET", "http://api.test/user/me")
+    assert kwargs["headers"]["Authorization"] == "secret"
+    assert sleeps == []
+
+def test_get_retried_until_success(monkeypatch, sleeps):
+    session = use(
+        monkeypatch,
+        response(503),
+        requests.exceptions.ConnectionError("reset"),
+        response(200, {"payload": "ok"})
+    )
+    assert api.Client("http://api.test", retries=3).request("GET", "x") == "ok"
+    assert len(session.requests) == 3
+    assert len(sleeps) == 2
+
+def test_retries_give_up(monkeypatch, sleeps):
+    session = use(monkeypatch, *[response(502, {"message": "bad gateway"}) for _ in range(3)])
+    with pytest.raises(api.APIError) as e:
+        api.Client("http://api.test", retries=2).request("GET", "x")
+    assert e.value.status_code == 502
+    assert e.value.message == "502: bad gateway"
+    assert len(session.requests) == 3
+
+def test_post_not_retried(monkeypatch, sleeps):
+    session = use(monkeypatch, response(503), response(200, {"payload": "ok"}))
+    with pytest.raises(api.APIError):
+        api.Client("http://api.test").request("POST", "x", data={})
+    assert len(session.requests) == 1
+    assert sleeps == []
+
+def test_post_retried_after_connect_timeout(monkeypatch, sleeps):
+    session = use(
+        monkeypatch,
+        requests.exceptions.ConnectTimeout("timed out"),
+        response(201, {"payload": "made"})
+    )
+    assert api.Client("http://api.test").request("POST", "x", data={}, expected=201) == "made"
+    assert len(session.requests) == 2
+
+def test_unreachable(monkeypatch, sleeps):
+    use(monkeypatch, *[requests.exceptions.ConnectionError("refused") for _ in range(2)])
+    with pytest.raises(api.APIError) as e:
+        api.Client("http://api.test", retries=1).request("GET", "x")
+    assert e.value.status_code == None
+    assert e.value.message.startswith("Could not reach http://api.test/x")
+
+def test_retry_after(monkeypatch, sleeps):
+    use(monkeypatch, response(429, headers={"Retry-After": "2"}), response(200, {"payload": "ok"}))
+    api.Client("http://api.test").request("GET", "x")
+    assert sleeps == [2]
+
+def test_backoff():
+    client = api.Client("http://api.test")
+    assert client._backoff(0, response(429, headers={"Retry-After": "120"})) == 30
+    for attempt in range(8):
+        assert 0 <= client._backoff(attempt, response(503)) <= min(10, 0.25 * 2 ** attempt)
+
+def test_not_modified(monkeypatch, sleeps):
+    session = use(monkeypatch, response(304, headers={"ETag": '"v1"'}))
+    payload, headers = api.Client("http://api.test").request(
+        "GET",
+        "x",
+        headers = {"If-None-Match": '"v1"'},
+        with_headers = True
+    )
+    assert payload == None
+    assert headers["ETag"] == '"v1"'
+    assert session.requests[0][2]["headers"]["If-None-Match"] == '"v1"'
+
+def test_unexpected_status(monkeypatch, sleeps):
+    use(monkeypatch, response(404, {"message": "not found"}))
+    with pytest.raises(api.APIError) as e:
+        api.Client("http://api.test").request("GET", "x")
+    assert (e.value.status_code, e.value.expected, e.value.has_message) == (404, 200, True)
+
+def test_invalid_response(monkeypatch, sleeps):
+    use(monkeypatch, response(200, {"no": "payload"}))
+    with pytest.raises(api.APIError) as e:
+        api.Client("http://api.test").request("GET", "x")
+    assert e.value.message.startswith("Invalid response text")
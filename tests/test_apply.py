@@ -0,0 +1,130 @@
+import json
+import threading
+import pytest
+from ahuri import api, apply
+from ahuri.cache import ChannelCache
+
+class FakeClient:
+    """
+    Stand-in for api.Client with a set of existing channels, that can be told
+    to fail some requests a number of times first.
+    """
+    def __init__(self, channels: dict = {}):
+        self.channels = dict(channels)
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.next_id = 100
+
+    def fail(self, method, key, status_code, times=1):
+        self.failures[(method, key)] = [status_code] * times
+
+    def request(self, method, *path, data=None, headers=None, expected=200, with_headers=False, **kwargs):
+        key = path[1] if len(path) > 1 else data["channelName"]
+        with self.lock:
+            self.requests.append((method, key))
+            failures = self.failures.get((method, key))
+            if failures:
+                raise api.APIError(f"{failures[0]}: failed", status_code=failures.pop(0))
+            if method == "GET":
+                if key not in self.channels:
+                    raise api.APIError("404: not found", status_code=404)
+                return {"id": key, "name": self.channels[key]}, {}
+            if method == "POST":
+                id = str(self.next_id)
+                self.next_id += 1
+                self.channels[id] = key
+                return {"id": id, "name": key}
+            if key not in self.channels:
+                raise api.APIError("404: not found", status_code=404)
+            del self.channels[key]
+
+@pytest.fixture
+def cache(tmp_path):
+    return ChannelCache("http://api.test", "u1", path=str(tmp_path / "channels.json"))
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(apply.time, "sleep", lambda seconds: None)
+
+def test_load_manifest(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"channels": ["general", {"name": " random "}, "general"]}))
+    assert apply.load_manifest(str(path)) == ["general", "random"]
+    path.write_text(json.dumps(["general"]))
+    assert apply.load_manifest(str(path)) == ["general"]
+    for invalid in ({"channels": "general"}, [""], [{"id": 1}]):
+        path.write_text(json.dumps(invalid))
+        with pytest.raises(ValueError):
+            apply.load_manifest(str(path))
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    assert apply.load_state(path) == {}
+    apply.save_state(path, {"general": "1"})
+    assert apply.load_state(path) == {"general": "1"}
+    assert [name for name in (tmp_path).iterdir() if name.name != "state.json"] == []
+
+def test_plan(cache):
+    client = FakeClient({"1": "general", "2": "old"})
+    state = {"general": "1", "old": "2", "gone": "3"}
+    changes = apply.plan(client, cache, ["general", "gone", "new"], state)
+    assert changes["keep"] == {"general": "1"}
+    assert changes["delete"] == {"old": "2"}
+    # deleted outside of apply, so it is created again
+    assert sorted(changes["create"]) == ["gone", "new"]
+
+def test_plan_uses_cache(cache):
+    client = FakeClient({"1": "general"})
+    apply.plan(client, cache, ["general"], {"general": "1"})
+    apply.plan(client, cache, ["general"], {"general": "1"})
+    assert client.requests == [("GET", "1")]
+
+def test_plan_fails_on_other_errors(cache):
+    client = FakeClient({"1": "general"})
+    client.fail("GET", "1", 500)
+    with pytest.raises(api.APIError):
+        apply.plan(client, cache, ["general"], {"general": "1"})
+
+def test_apply(cache):
+    client = FakeClient({"1": "general", "2": "old"})
+    state = {"general": "1", "old": "2"}
+    changes = apply.plan(client, cache, ["general", "new"], state)
+    seen = []
+    failed = apply.apply(client, cache, changes, state, progress=lambda action, name, result, error: seen.append((action, name)))
+    assert failed == {}
+    assert sorted(seen) == [("create", "new"), ("delete", "old")]
+    assert state == {"general": "1", "new": "100"}
+    assert client.channels == {"1": "general", "100": "new"}
+    # created channels are cached, so the next plan doesn't look them up
+    client.requests = []
+    assert apply.plan(client, cache, ["general", "new"], state) == {"create": [], "delete": {}, "keep": state}
+    assert client.requests == []
+
+def test_apply_retries_create_only_when_turned_away(cache):
+    client = FakeClient()
+    client.fail("POST", "busy", 503, times=2)
+    client.fail("POST", "broken", 500)
+    state = {}
+    failed = apply.apply(client, cache, {"create": ["busy", "broken"], "delete": {}, "keep": {}}, state)
+    assert list(failed) == ["broken"]
+    assert list(state) == ["busy"]
+    assert client.requests.count(("POST", "busy")) == 3
+    # a 500 might have created the channel, sending it again could make a duplicate
+    assert client.requests.count(("POST", "broken")) == 1
+
+def test_apply_retries_delete(cache):
+    client = FakeClient({"1": "old"})
+    client.fail("DELETE", "1", 502, times=2)
+    state = {"old": "1", "gone": "2"}
+    failed = apply.apply(client, cache, {"create": [], "delete": {"old": "1", "gone": "2"}, "keep": {}}, state)
+    assert failed == {}
+    assert state == {}
+    assert client.requests.count(("DELETE", "1")) == 3
+
+def test_apply_gives_up(cache):
+    client = FakeClient()
+    client.fail("POST", "busy", 429, times=5)
+    failed = apply.apply(client, cache, {"create": ["busy"], "delete": {}, "keep": {}}, {}, retries=2)
+    assert failed["busy"].status_code == 429
+    assert client.requests.count(("POST", "busy")) == 3
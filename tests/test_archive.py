@@ -0,0 +1,143 @@
+import time
+import asyncio
+import sqlite3
+import pytest
+from ahuri import archive
+
+def message(id, content="hello", username="bob", created_at="2024-05-01T12:00:00Z"):
+    return {
+        "id": id,
+        "content": content,
+        "sender": {"id": f"u-{username}", "username": username, "tag": "0001"},
+        "createdAt": created_at
+    }
+
+@pytest.fixture
+def db(tmp_path):
+    result = archive.Archive(str(tmp_path / "archive.db"))
+    yield result
+    result.close()
+
+def count(db):
+    return db.connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+def test_add_outside_event_loop_writes_at_once(db):
+    db.add(message("1"), "general")
+    assert count(db) == 1
+
+def test_duplicates_ignored(db):
+    db.add(message("1"), "general")
+    db.add(message("1", content="edited"), "general")
+    assert count(db) == 1
+    assert db.history()[0]["content"] == "hello"
+
+def test_messages_without_id_skipped(db):
+    db.add(message(None), "general")
+    db.add(message(""), "general")
+    assert db.store_page("general", [message(None), message("2")], "2") == 1
+    assert [row["id"] for row in db.history()] == ["2"]
+
+def test_batching(tmp_path):
+    db = archive.Archive(str(tmp_path / "archive.db"), batch_size=3, flush_interval=0.05)
+
+    async def receive():
+        db.add(message("1"), "general")
+        db.add(message("2"), "general")
+        assert count(db) == 0
+        db.add(message("3"), "general")
+        assert count(db) == 3
+        db.add(message("4"), "general")
+        assert count(db) == 3
+        await asyncio.sleep(0.2)
+        assert count(db) == 4
+
+    asyncio.run(receive())
+    db.close()
+
+def test_history_filters(db):
+    db.store_page("general", [message("1", created_at="2024-05-01T10:00:00Z")], "1")
+    db.store_page("general", [message("2", username="amy", created_at="2024-05-01T11:00:00Z")], "2")
+    db.store_page("random", [message("3", created_at="2024-05-01T12:00:00Z")], "3")
+    assert [row["id"] for row in db.history()] == ["1", "2", "3"]
+    assert [row["id"] for row in db.history(channel="general")] == ["1", "2"]
+    assert [row["id"] for row in db.history(sender="amy.0001")] == ["2"]
+    assert [row["id"] for row in db.history(sender="u-bob")] == ["1", "3"]
+    noon = archive.message_time("2024-05-01T11:00:00Z")
+    assert [row["id"] for row in db.history(since=noon)] == ["2", "3"]
+    assert [row["id"] for row in db.history(until=noon)] == ["1"]
+    assert [row["id"] for row in db.history(limit=2)] == ["2", "3"]
+
+def test_message_time():
+    assert archive.message_time("1970-01-01T00:01:00Z") == 60
+    assert archive.message_time("1970-01-01T00:01:00") == 60
+    assert abs(archive.message_time("not a time") - time.time()) < 5
+    assert abs(archive.message_time(None) - time.time()) < 5
+
+def test_parse_time():
+    assert abs(archive.parse_time("2h") - (time.time() - 7200)) < 5
+    assert archive.parse_time("1970-01-01T00:00:00+00:00") == 0
+    with pytest.raises(ValueError):
+        archive.parse_time("yesterday")
+
+@pytest.fixture
+def searchable(db):
+    if not db.searchable:
+        pytest.skip("this SQLite build has no FTS5 support")
+    db.store_page("general", [
+        message("1", "deploy failed on staging", created_at="2024-05-01T10:00:00Z"),
+        message("2", "deploy finished", username="amy", created_at="2024-05-01T11:00:00Z"),
+        message("3", "lunch?", username="deploy", created_at="2024-05-01T12:00:00Z")
+    ], "3")
+    db.store_page("random", [message("4", "deploy failed again", created_at="2024-05-01T13:00:00Z")], "4")
+    return db
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+def test_search(searchable):
+    assert sorted(ids(searchable.search("failed"))) == ["1", "4"]
+    assert ids(searchable.search('"deploy finished"')) == ["2"]
+    assert ids(searchable.search("deploy NOT failed", order="time")) == ["3", "2"]
+    assert ids(searchable.search("sender:amy")) == ["2"]
+
+def test_search_ranks_content_over_sender(searchable):
+    # message 3 only matches through its sender
+    assert ids(searchable.search("deploy"))[-1] == "3"
+
+def test_search_filters(searchable):
+    assert ids(searchable.search("failed", channel="random")) == ["4"]
+    eleven = archive.message_time("2024-05-01T11:00:00Z")
+    assert ids(searchable.search("deploy", since=eleven, order="time")) == ["4", "3", "2"]
+    assert ids(searchable.search("deploy", until=eleven)) == ["1"]
+    assert len(searchable.search("deploy", limit=2)) == 2
+
+def test_search_sees_pending_messages(searchable):
+    searchable._pending.append(archive._row(message("5", "rollback"), "general"))
+    assert ids(searchable.search("rollback")) == ["5"]
+
+def test_search_index_follows_changes(searchable):
+    with searchable.connection:
+        searchable.connection.execute("UPDATE messages SET content = 'rolled back' WHERE id = '1'")
+        searchable.connection.execute("DELETE FROM messages WHERE id = '4'")
+    assert ids(searchable.search("failed")) == []
+    assert ids(searchable.search("rolled")) == ["1"]
+
+def test_search_index_built_for_old_archives(tmp_path):
+    path = str(tmp_path / "archive.db")
+    connection = sqlite3.connect(path)
+    connection.executescript(archive.schema)
+    with connection:
+        connection.execute(
+            "INSERT INTO messages (id, channel, sender_id, sender, content, created_at, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            archive._row(message("1", "archived before search existed"), "general")
+        )
+    connection.close()
+    db = archive.Archive(path)
+    if not db.searchable:
+        pytest.skip("this SQLite build has no FTS5 support")
+    assert ids(db.search("before")) == ["1"]
+    db.close()
+
+def test_invalid_query(searchable):
+    with pytest.raises(sqlite3.OperationalError):
+        searchable.search('"unbalanced')
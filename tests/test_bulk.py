@@ -0,0 +1,65 @@
+import time
+import threading
+import itertools
+from ahuri import bulk
+
+def slow_for_early_items(item):
+    # earlier items take longer, so they finish last
+    time.sleep(0.01 * (10 - item))
+    return item * 2
+
+def test_imap_ordered():
+    results = list(bulk.imap(slow_for_early_items, range(10), concurrency=4))
+    assert [item for item, _, _ in results] == list(range(10))
+    assert [result for _, result, _ in results] == [item * 2 for item in range(10)]
+
+def test_imap_unordered():
+    results = list(bulk.imap(slow_for_early_items, range(10), concurrency=10, ordered=False))
+    assert sorted(item for item, _, _ in results) == list(range(10))
+    assert [item for item, _, _ in results] != list(range(10))
+    assert all(result == item * 2 for item, result, _ in results)
+
+def test_imap_errors():
+    def check(item):
+        if item % 3 == 0:
+            raise ValueError(item)
+        return item
+    for item, result, error in bulk.imap(check, range(9)):
+        if item % 3 == 0:
+            assert result == None and isinstance(error, ValueError)
+        else:
+            assert result == item and error == None
+
+def test_imap_concurrency():
+    running = 0
+    most = 0
+    lock = threading.Lock()
+    def work(item):
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.005)
+        with lock:
+            running -= 1
+    list(bulk.imap(work, range(30), concurrency=3))
+    assert most <= 3
+
+def test_imap_lazy():
+    # items come from an endless stream, only a few are read ahead
+    read = []
+    def items():
+        for item in itertools.count():
+            read.append(item)
+            yield item
+    results = bulk.imap(lambda item: item, items(), concurrency=2)
+    assert [item for item, _, _ in itertools.islice(results, 5)] == list(range(5))
+    results.close()
+    assert len(read) <= 5 + 2 * 2
+
+def test_rate_limiter():
+    limiter = bulk.RateLimiter(100)
+    started = time.monotonic()
+    for _ in range(11):
+        limiter.wait()
+    assert time.monotonic() - started >= 0.09
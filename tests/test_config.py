@@ -0,0 +1,61 @@
+import os
+import json
+import pytest
+from ahuri import config
+
+def test_reset_writes_defaults(config_file):
+    with open(config_file) as f:
+        assert json.load(f) == json.loads(config.reset_str)
+
+def test_get_uses_cache(config_file, monkeypatch):
+    assert config.get("retries") == 3
+    reads = []
+    real_open = open
+    def counting_open(path, *args, **kwargs):
+        if path == config_file:
+            reads.append(path)
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr("builtins.open", counting_open)
+    for _ in range(5):
+        assert config.get("retries") == 3
+    assert reads == []
+
+def test_get_rereads_changed_file(config_file):
+    assert config.get("retries") == 3
+    with open(config_file) as f:
+        configjson = json.load(f)
+    configjson["retries"] = 7
+    with open(config_file, "w") as f:
+        json.dump(configjson, f, indent=8)
+    assert config.get("retries") == 7
+
+def test_get_default(config_file):
+    assert config.get("missing", "fallback") == "fallback"
+    assert config.get("user").get("token", "fallback") == None
+
+def test_update_writes_once(config_file):
+    result = config.update({"retries": 5, "channel_ttl": 60})
+    assert result["retries"] == 5 and result["channel_ttl"] == 60
+    config._cache = None
+    assert config.get("retries") == 5
+    assert config.get("channel_ttl") == 60
+
+def test_write_is_atomic(config_file, monkeypatch):
+    config.set("retries", 4)
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", broken_replace)
+    with pytest.raises(OSError):
+        config.set("retries", 9)
+    # the old file is left as it was and no temporary files are left behind
+    assert os.listdir(config.config_dir) == ["config.json"]
+    with open(config_file) as f:
+        assert json.load(f)["retries"] == 4
+
+def test_check_resets_broken_file(config_file):
+    with open(config_file, "w") as f:
+        f.write("{not json")
+    config._cache = None
+    config.check()
+    with open(config_file) as f:
+        assert json.load(f) == json.loads(config.reset_str)
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import tempfile
+import subprocess
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="stops `channel connect` with SIGINT")
+
+@pytest.fixture(scope="module")
+def standin():
+    pytest.importorskip("websockets")
+    from suite import Standin
+
+    with tempfile.TemporaryDirectory(prefix="ahuri-tests-") as home:
+        result = Standin(home)
+        yield result
+        result.stop()
+
+def wait_for(check, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.1)
+    return False
+
+def lines(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return f.read().splitlines()
+
+@pytest.mark.parametrize("format,overflow", [
+    ("ndjson", "spill"),
+    ("ndjson", "block"),
+    ("text", "spill")
+])
+def test_flood_reaches_everything(standin, tmp_path, format, overflow):
+    # far more messages than the queues hold, so every queue fills up
+    count = 150
+    hooked = str(tmp_path / "hooked.txt")
+    archive_path = os.path.join(standin.env["HOME"], ".config", "ahuri-cli", "archive.db")
+    if os.path.exists(archive_path):
+        os.remove(archive_path)
+
+    standin.call("POST", "_standin/flood", {"channel": "bench", "count": count, "rate": 0})
+    with open(tmp_path / "stdout.txt", "w") as stdout, open(tmp_path / "stderr.txt", "w") as stderr:
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "ahuri", "channel", "connect", "bench",
+                "--format", format,
+                "--archive",
+                "--queue-size", "5",
+                "--hook-queue", "2",
+                "--overflow", overflow,
+                "--exec", f"echo \"$AHURI_MESSAGE_ID\" >> {hooked}"
+            ],
+            env = standin.env,
+            stdout = stdout,
+            stderr = stderr
+        )
+        try:
+            done = wait_for(lambda: len(lines(hooked)) >= count)
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    assert done, "\n".join(lines(tmp_path / "stderr.txt"))
+
+    expected = {f"flood-{number}" for number in range(count)}
+    hook_ids = lines(hooked)
+    assert len(hook_ids) == count
+    assert set(hook_ids) == expected
+
+    connection = sqlite3.connect(archive_path)
+    archived = {row[0] for row in connection.execute("SELECT id FROM messages WHERE id LIKE 'flood-%'")}
+    connection.close()
+    assert archived == expected
+
+    if format == "ndjson":
+        shown = [json.loads(line) for line in lines(tmp_path / "stdout.txt")]
+        assert [message["id"] for message in shown] == [f"flood-{number}" for number in range(count)]
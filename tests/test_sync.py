@@ -0,0 +1,84 @@
+import threading
+import pytest
+from ahuri import api, archive, sync
+
+class FakeClient:
+    """
+    Stand-in for api.Client that serves the messages of a few channels
+    the way `GET channel/<id>/messages` does.
+    """
+    def __init__(self, channels: dict, broken=()):
+        self.channels = channels
+        self.broken = broken
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, method, *path, params=None, **kwargs):
+        channel = path[1]
+        with self.lock:
+            self.requests.append((channel, params.get("after")))
+        if channel in self.broken:
+            raise api.APIError("500: broken", status_code=500)
+        messages = self.channels[channel]
+        start = 0
+        if "after" in params:
+            start = [message["id"] for message in messages].index(params["after"]) + 1
+        return messages[start:start + params["limit"]]
+
+def messages(channel, count, start=0):
+    return [
+        {
+            "id": f"{channel}-{index:03}",
+            "content": f"message {index}",
+            "sender": {"id": "u1", "username": "bob", "tag": "0001"},
+            "createdAt": f"2024-05-01T12:{index // 60:02}:{index % 60:02}Z"
+        }
+        for index in range(start, start + count)
+    ]
+
+@pytest.fixture
+def db(tmp_path):
+    result = archive.Archive(str(tmp_path / "archive.db"))
+    yield result
+    result.close()
+
+def test_sync_pages(db):
+    client = FakeClient({"a": messages("a", 25), "b": messages("b", 3)})
+    pages = []
+    results = sync.sync(client, db, ["a", "b"], page_size=10, progress=lambda *page: pages.append(page))
+    assert results == {"a": 25, "b": 3}
+    assert [after for channel, after in client.requests if channel == "a"] == [None, "a-009", "a-019"]
+    assert [after for channel, after in client.requests if channel == "b"] == [None]
+    assert sorted(pages) == [("a", 5, 5), ("a", 10, 10), ("a", 10, 10), ("b", 3, 3)]
+    assert db.cursor("a") == "a-024"
+    assert db.cursor("b") == "b-002"
+    assert len(db.history(channel="a", limit=100)) == 25
+
+def test_sync_resumes_from_cursor(db):
+    client = FakeClient({"a": messages("a", 12)})
+    sync.sync(client, db, ["a"], page_size=10)
+    client.channels["a"] += messages("a", 4, start=12)
+    client.requests = []
+    assert sync.sync(client, db, ["a"], page_size=10) == {"a": 4}
+    assert client.requests == [("a", "a-011")]
+    assert db.cursor("a") == "a-015"
+
+def test_sync_nothing_new(db):
+    client = FakeClient({"a": messages("a", 5)})
+    sync.sync(client, db, ["a"])
+    assert sync.sync(client, db, ["a"]) == {"a": 0}
+    assert db.cursor("a") == "a-004"
+
+def test_full_sync_ignores_cursor(db):
+    client = FakeClient({"a": messages("a", 5)})
+    sync.sync(client, db, ["a"])
+    client.requests = []
+    assert sync.sync(client, db, ["a"], full=True) == {"a": 0}
+    assert client.requests == [("a", None)]
+
+def test_sync_errors_stay_in_their_channel(db):
+    client = FakeClient({"a": messages("a", 5), "b": messages("b", 5)}, broken=["b"])
+    results = sync.sync(client, db, ["a", "b"])
+    assert results["a"] == 5
+    assert isinstance(results["b"], api.APIError)
+    assert db.cursor("b") == None